@@ -1,13 +1,24 @@
 # api/admin.py
-from django.contrib import admin
-from .models import Bug, BugModificationLog, ProcessedEmail # Use .models because it's in the same app
+from django import forms
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import Bug, BugModificationDaily, BugModificationLog, BugRevision, ProcessedEmail, Mailbox, MailboxSyncState, IngestionRun, DeadLetterEmail # Use .models because it's in the same app
 
 @admin.register(Bug)
 class BugAdmin(admin.ModelAdmin):
     list_display = ('bug_id', 'subject', 'status', 'priority', 'modified_count', 'created_at', 'updated_at')
     list_filter = ('status', 'priority', 'created_at', 'updated_at')
-    search_fields = ('bug_id', 'subject', 'description')
-    readonly_fields = ('created_at', 'updated_at', 'modified_count')
+    search_fields = ('bug_id', 'subject', 'summary')
+    readonly_fields = ('summary', 'created_at', 'updated_at', 'modified_count')
+    ordering = ('-created_at',)
+
+@admin.register(BugRevision)
+class BugRevisionAdmin(admin.ModelAdmin):
+    list_display = ('bug', 'number', 'subject', 'size', 'created_at')
+    search_fields = ('bug__bug_id', 'subject')
+    readonly_fields = ('bug', 'number', 'modification_log', 'subject', 'size', 'created_at', 'text')
+    exclude = ('data',)
+    list_select_related = ('bug',)
     ordering = ('-created_at',)
 
 @admin.register(BugModificationLog)
@@ -18,8 +29,75 @@ class BugModificationLogAdmin(admin.ModelAdmin):
     autocomplete_fields = ['bug']
     ordering = ('-modified_at',)
 
+@admin.register(BugModificationDaily)
+class BugModificationDailyAdmin(admin.ModelAdmin):
+    list_display = ('date', 'priority', 'count')
+    list_filter = ('priority',)
+    readonly_fields = ('date', 'priority', 'count') # Maintained by ingestion; fix drift with rebuild_modification_rollup
+    ordering = ('-date', 'priority')
+
 @admin.register(ProcessedEmail)
 class ProcessedEmailAdmin(admin.ModelAdmin):
     list_display = ('message_id', 'processed_at')
     search_fields = ('message_id',)
-    ordering = ('-processed_at',)
\ No newline at end of file
+    ordering = ('-processed_at',)
+
+class MailboxAdminForm(forms.ModelForm):
+    """ The stored password is never rendered into the page: a blank password keeps it, `clear_password` empties it. """
+    password = forms.CharField(required=False, strip=False, widget=forms.PasswordInput(), help_text="Leave blank to keep the stored password (or, with server and username empty, to use IMAP_PASSWORD).")
+    clear_password = forms.BooleanField(required=False, help_text="Remove the stored password.")
+
+    class Meta: model = Mailbox; fields = '__all__'
+
+    def clean_password(self):
+        password = self.cleaned_data.get('password')
+        if self.data.get('clear_password'): return ''
+        return password or (self.instance.password if self.instance.pk else '')
+
+@admin.register(Mailbox)
+class MailboxAdmin(admin.ModelAdmin):
+    form = MailboxAdminForm
+    list_display = ('name', 'server', 'username', 'folders', 'enabled', 'max_messages_per_run', 'poll_min_seconds', 'updated_at')
+    list_filter = ('enabled',)
+    search_fields = ('name', 'server', 'username')
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(MailboxSyncState)
+class MailboxSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('mailbox', 'folder', 'uid_validity', 'last_uid', 'poll_interval_seconds', 'next_poll_at', 'updated_at')
+    list_filter = ('mailbox',)
+    readonly_fields = ('poll_interval_seconds', 'next_poll_at', 'updated_at')
+    ordering = ('mailbox', 'folder')
+
+@admin.register(IngestionRun)
+class IngestionRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'mailbox', 'folder', 'duration_seconds', 'processed', 'duplicates', 'skipped', 'failed', 'bytes_fetched', 'stopped_early')
+    list_filter = ('stopped_early', 'mailbox', 'started_at')
+    readonly_fields = [field.name for field in IngestionRun._meta.fields]
+    ordering = ('-started_at',)
+
+@admin.register(DeadLetterEmail)
+class DeadLetterEmailAdmin(admin.ModelAdmin):
+    list_display = ('uid', 'mailbox', 'folder', 'message_id', 'stage', 'status', 'attempts', 'next_attempt_at', 'last_failed_at')
+    list_filter = ('status', 'stage', 'mailbox', 'folder')
+    search_fields = ('message_id', 'error')
+    readonly_fields = [field.name for field in DeadLetterEmail._meta.fields]
+    ordering = ('-last_failed_at',)
+    actions = ['replay_entries', 'discard_entries']
+
+    @admin.action(description="Replay selected emails now")
+    def replay_entries(self, request, queryset):
+        from .tasks import retry_dead_letters # Avoids importing the Celery tasks when the admin loads
+        pks = list(queryset.exclude(status=DeadLetterEmail.Status.RESOLVED).values_list('pk', flat=True))
+        count = DeadLetterEmail.objects.filter(pk__in=pks).update(status=DeadLetterEmail.Status.PENDING, next_attempt_at=timezone.now())
+        if not count: return self.message_user(request, "No unresolved emails selected.", messages.WARNING)
+        try:
+            retry_dead_letters.apply_async(kwargs={'limit': count, 'pks': pks}, retry=False)
+            self.message_user(request, f"{count} dead-lettered emails queued for retry.")
+        except Exception as broker_error:
+            self.message_user(request, f"{count} emails marked for retry; the scheduled retry run will pick them up ({broker_error}).", messages.WARNING)
+
+    @admin.action(description="Discard selected emails")
+    def discard_entries(self, request, queryset):
+        count = queryset.exclude(status=DeadLetterEmail.Status.RESOLVED).update(status=DeadLetterEmail.Status.DISCARDED, next_attempt_at=None)
+        self.message_user(request, f"{count} dead-lettered emails discarded.")
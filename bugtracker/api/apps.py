@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _forget_search_backends(**kwargs):
+    from . import search
+    search._available.clear() # Migrations may have created or dropped the full-text index
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        post_migrate.connect(_forget_search_backends, sender=self)
@@ -0,0 +1,106 @@
+# api/caching.py
+"""
+Cached read endpoints with write-driven invalidation.
+
+Bug data only changes when ingestion or a user writes it, so read endpoints
+cache their responses in Django's cache (Redis via CACHE_URL, see settings).
+Every cached entry is keyed by a data version. Writers call bump_data_version
+once their transaction has committed (transaction.on_commit), which gives all
+cached entries a new key at once; the old ones simply expire. The version is
+the millisecond time of the last write, so it also provides the responses'
+ETag. A client that sends it back gets a 304 without the payload being
+computed. There is no Last-Modified: at HTTP's one-second resolution, two
+writes within a second would leave If-Modified-Since clients with a stale 304.
+The version is also stored in the database (the DataVersion row seeded by its
+migration). It is read from there when the cache lost it or there is no cache
+(DummyCache), so the ETag stays stable and clients still get 304s. Reads never
+write it. If neither is reachable the endpoints compute every response and send
+no validators, as before.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'data_version'
+
+
+def data_version():
+    """ The current data version (ms timestamp of the last committed write), or None if neither the cache nor the database has it. """
+    try: version = cache.get(VERSION_KEY)
+    except Exception as cache_error:
+        logger.warning(f"Cache unavailable ({cache_error}). Serving uncached."); return None
+    if version is None: # Evicted, or no cache: the database holds the same version
+        try: version = _stored_version()
+        except DatabaseError as db_error:
+            logger.warning(f"Could not read the data version ({db_error}). Serving uncached."); return None
+        if version is None: return None # Row missing (migrations not applied): serve uncached rather than write on a read
+        try: cache.add(VERSION_KEY, version, timeout=None); version = cache.get(VERSION_KEY, version)
+        except Exception: pass
+    return version
+
+def bump_data_version():
+    """ Invalidates every cached response. Call through on_commit_bump() from inside write transactions. """
+    from .models import DataVersion # models imports this module
+    version = int(time.time() * 1000)
+    try:
+        with transaction.atomic():
+            if not DataVersion.objects.filter(pk=1).update(version=Greatest(F('version') + 1, Value(version))):
+                DataVersion.objects.create(pk=1, version=version)
+            version = _stored_version()
+    except DatabaseError as db_error:
+        logger.warning(f"Could not store the data version ({db_error}).")
+    try:
+        cache.set(VERSION_KEY, max(version, (cache.get(VERSION_KEY) or 0) + 1), timeout=None)
+    except Exception as cache_error:
+        logger.warning(f"Could not bump the data version ({cache_error}); cached responses expire after CACHE_TIMEOUT.")
+
+def _stored_version():
+    from .models import DataVersion
+    return DataVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+
+def on_commit_bump():
+    """ Bumps the data version once the current transaction commits (at once outside one). """
+    transaction.on_commit(bump_data_version)
+
+
+def cached_response(request, name, compute, make_response):
+    """
+    Serves `name` (endpoint plus filters) from the cache for the current data version.
+    `compute()` returns the payload on a miss; `make_response(payload)` builds the response.
+    Answers 304 when the request's If-None-Match matches the version.
+    """
+    version = data_version()
+    if version is None: return make_response(compute())
+    etag = f'"{name}:{version}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None: return _with_validators(not_modified, etag)
+
+    return _with_validators(make_response(_get_or_compute(f"response:{name}:{version}", compute)), etag)
+
+def cached_value(name, compute):
+    """ compute(), cached under `name` until the next write (computed every time without a cache). """
+    version = data_version()
+    if version is None: return compute()
+    return _get_or_compute(f"value:{name}:{version}", compute)
+
+def _get_or_compute(key, compute):
+    try: value = cache.get(key)
+    except Exception: value = None
+    if value is None:
+        value = compute()
+        try: cache.set(key, value, timeout=getattr(settings, 'CACHE_TIMEOUT', 300))
+        except Exception as cache_error: logger.warning(f"Could not cache {key}: {cache_error}")
+    return value
+
+def _with_validators(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True) # Browsers keep it but revalidate every time (a 304 while unchanged)
+    return response
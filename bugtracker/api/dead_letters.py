@@ -0,0 +1,72 @@
+# api/dead_letters.py
+"""
+Dead-letter queue for emails that fail to fetch, parse or persist.
+
+Ingestion parks a failed UID here instead of holding the folder checkpoint below
+it, so one poison message no longer makes every later poll re-fetch (and fail
+on) the same UIDs. tasks.retry_dead_letters retries due entries one message at
+a time on a low-priority queue, with exponential backoff, until they succeed
+or run out of attempts. Entries can be replayed or discarded from the admin.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DeadLetterEmail
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    """ Backoff before the next retry after `attempts` failures: base * 2^(attempts-1), capped. """
+    base = getattr(settings, 'DEAD_LETTER_RETRY_BASE_SECONDS', 300)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), getattr(settings, 'DEAD_LETTER_RETRY_MAX_SECONDS', 24 * 60 * 60)))
+
+def record_failures(mailbox, folder, uid_validity, failures):
+    """
+    Parks failed UIDs of a Mailbox's `folder`. `failures` maps uid -> (stage, error, message_id).
+    A UID already parked (e.g. refetched after a UIDVALIDITY resync) is reset to pending.
+    Returns the number of entries written; raises on DB errors, so callers can fall back
+    to holding the checkpoint.
+    """
+    if not failures: return 0
+    now = timezone.now(); next_attempt = now + retry_delay(1)
+    DeadLetterEmail.objects.bulk_create([
+        DeadLetterEmail(mailbox=mailbox, folder=folder, uid_validity=uid_validity, uid=uid, stage=stage, error=str(error)[:2000], message_id=message_id or '',
+                        last_failed_at=now, next_attempt_at=next_attempt)
+        for uid, (stage, error, message_id) in failures.items()
+    ], update_conflicts=True, unique_fields=['mailbox', 'folder', 'uid_validity', 'uid'],
+       update_fields=['stage', 'error', 'message_id', 'status', 'last_failed_at', 'next_attempt_at'])
+    logger.warning(f"Dead-lettered {len(failures)} emails in '{mailbox.name}/{folder}' (UIDs {sorted(failures)[:10]}{'...' if len(failures) > 10 else ''}).")
+    return len(failures)
+
+def parked_uids(mailbox, folder, uid_validity, above=0):
+    """ UIDs above `above` with an open (pending or exhausted) entry: the main run leaves them to the retry task. """
+    return set(DeadLetterEmail.objects.filter(mailbox=mailbox, folder=folder, uid_validity=uid_validity, uid__gt=above)
+               .exclude(status__in=[DeadLetterEmail.Status.RESOLVED, DeadLetterEmail.Status.DISCARDED]).values_list('uid', flat=True))
+
+def due_entries(limit, pks=None):
+    """ Pending entries of enabled mailboxes whose backoff has elapsed, oldest first (only those in `pks` when given). """
+    entries = DeadLetterEmail.objects.select_related('mailbox').filter(status=DeadLetterEmail.Status.PENDING, mailbox__enabled=True)
+    if pks is not None: entries = entries.filter(pk__in=pks)
+    return list(entries.filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())).order_by('next_attempt_at', 'pk')[:limit])
+
+def mark_failed(entry, stage, error, message_id=''):
+    """ Records another failed attempt and schedules the next one (or gives up after DEAD_LETTER_MAX_ATTEMPTS). """
+    entry.attempts += 1; entry.stage = stage; entry.error = str(error)[:2000]; entry.last_failed_at = timezone.now()
+    entry.message_id = message_id or entry.message_id
+    if entry.attempts >= getattr(settings, 'DEAD_LETTER_MAX_ATTEMPTS', 8):
+        entry.status = DeadLetterEmail.Status.EXHAUSTED; entry.next_attempt_at = None
+        logger.error(f"Giving up on UID {entry.uid} in '{entry.folder}' after {entry.attempts} attempts: {entry.error}")
+    else:
+        entry.next_attempt_at = entry.last_failed_at + retry_delay(entry.attempts)
+    entry.save(update_fields=['attempts', 'stage', 'error', 'message_id', 'status', 'last_failed_at', 'next_attempt_at'])
+
+def close(entry, status, note=''):
+    """ Resolves or discards an entry. """
+    entry.status = status; entry.next_attempt_at = None
+    if note: entry.error = f"{note}\n{entry.error}"[:2000]
+    entry.save(update_fields=['status', 'next_attempt_at', 'error'])
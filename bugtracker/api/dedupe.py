@@ -0,0 +1,188 @@
+# api/dedupe.py
+"""
+Message-ID deduplication for ingestion.
+
+ProcessedEmail rows are keyed by a 16-byte digest of the Message-ID rather
+than the raw header (up to 500 chars), so the unique index is fixed-width and
+small. A Bloom filter sits in front of that index. It answers "definitely new"
+for most incoming messages, and only possible repeats are probed in the
+database. By default the filter is one Redis bitmap at DEDUPE_BLOOM_URL (the
+broker), shared by every process. With an empty URL it is held in process
+memory instead and built from the table on first use.
+
+The filter may over-report: false positives, and bits left behind by pruned
+rows, cost only a DB probe. It must not miss a stored Message-ID, so hashes
+are added before their rows are written. Rows written by another process can
+still be missing from an in-process filter, which then shows up as a
+unique-key conflict, and persist_batch rechecks that batch against the
+database.
+"""
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ProcessedEmail
+
+logger = logging.getLogger(__name__)
+
+_WARM_CHUNK = 10000 # Hashes read per query while (re)building a filter
+_PRUNE_CHUNK = 10000 # Rows deleted per query by prune_processed_emails
+_RETRY_SECONDS = 60 # Wait before building a filter again after a failed build (e.g. Redis down at worker start)
+
+
+def bloom_parameters(capacity, error_rate):
+    """ (bits, hash count) of a Bloom filter holding `capacity` items at `error_rate` false positives. """
+    bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+class BloomFilter:
+    """
+    In-process Bloom filter over ProcessedEmail.hash_message_id digests. Bit positions
+    come from double hashing the two halves of the digest; bits are stored most
+    significant first, the same layout as a Redis bitmap, so a built filter can be
+    uploaded as-is (see RedisBloomFilter).
+    """
+    def __init__(self, size, hashes):
+        self.size, self.hashes = size, hashes
+        self.bits = bytearray((size + 7) // 8)
+
+    def positions(self, digest):
+        h1 = int.from_bytes(digest[:8], 'big'); h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add_many(self, digests):
+        for digest in digests:
+            for position in self.positions(digest): self.bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def might_contain_many(self, digests):
+        return [all(self.bits[position >> 3] & (0x80 >> (position & 7)) for position in self.positions(digest)) for digest in digests]
+
+    def rebuild(self):
+        self.bits = build_bits(self)
+
+
+class RedisBloomFilter(BloomFilter):
+    """
+    The same filter kept in one Redis string (SETBIT/GETBIT in a single pipeline per
+    call), so every ingestion worker sees hashes added by the others. The key embeds
+    the filter geometry, so changing capacity or error rate starts a fresh bitmap.
+    """
+    def __init__(self, url, size, hashes):
+        import redis # Optional dependency, only needed for a shared filter
+        self.size, self.hashes = size, hashes
+        self.client = redis.Redis.from_url(url)
+        self.key = f"bugtracker:dedupe:bloom:{self.size}:{self.hashes}"
+        if not self.client.exists(self.key): # First user builds it; NX keeps a bitmap another worker uploaded meanwhile
+            self.client.set(self.key, bytes(build_bits(self)), nx=True)
+
+    def add_many(self, digests):
+        pipeline = self.client.pipeline(transaction=False)
+        for digest in digests:
+            for position in self.positions(digest): pipeline.setbit(self.key, position, 1)
+        pipeline.execute()
+
+    def might_contain_many(self, digests):
+        pipeline = self.client.pipeline(transaction=False)
+        for digest in digests:
+            for position in self.positions(digest): pipeline.getbit(self.key, position)
+        bits = pipeline.execute()
+        return [all(bits[i * self.hashes:(i + 1) * self.hashes]) for i in range(len(digests))]
+
+    def rebuild(self):
+        self.client.set(self.key, bytes(build_bits(self))) # Hashes added during the build are recovered by the conflict recheck
+
+
+def build_bits(bloom):
+    """ Bitmap for `bloom`'s geometry holding every stored ProcessedEmail hash. """
+    local = BloomFilter(bloom.size, bloom.hashes)
+    started = timezone.now(); count = 0; chunk = []
+    for digest in ProcessedEmail.objects.values_list('message_hash', flat=True).iterator(chunk_size=_WARM_CHUNK):
+        chunk.append(bytes(digest)); count += 1
+        if len(chunk) == _WARM_CHUNK: local.add_many(chunk); chunk = []
+    local.add_many(chunk)
+    logger.info(f"Built Message-ID Bloom filter ({bloom.size} bits, {bloom.hashes} hashes) from {count} dedupe records in {(timezone.now() - started).total_seconds():.1f}s.")
+    return local.bits
+
+
+# --- Configured Filter ---
+_filter = None; _filter_config = None; _retry_at = None
+
+def get_filter():
+    """
+    The filter configured in settings, built on first use (None when DEDUPE_BLOOM_CAPACITY is 0 or Redis is
+    unreachable). A failed build is retried after _RETRY_SECONDS, so a Redis outage does not disable the
+    filter for the rest of the process.
+    """
+    global _filter, _filter_config, _retry_at
+    config = (settings.DEDUPE_BLOOM_CAPACITY, settings.DEDUPE_BLOOM_ERROR_RATE, settings.DEDUPE_BLOOM_URL)
+    if config != _filter_config or (_retry_at is not None and time.monotonic() >= _retry_at):
+        _filter_config = config; _retry_at = None; capacity, error_rate, url = config
+        try:
+            _filter = None
+            if capacity > 0:
+                _filter = RedisBloomFilter(url, *bloom_parameters(capacity, error_rate)) if url else BloomFilter(*bloom_parameters(capacity, error_rate))
+                if not url: _filter.rebuild()
+        except Exception as filter_error:
+            logger.warning(f"Message-ID Bloom filter unavailable ({filter_error}). Probing the dedupe index for every message; retrying in {_RETRY_SECONDS}s.")
+            _filter = None; _retry_at = time.monotonic() + _RETRY_SECONDS
+    return _filter
+
+def reset_filter():
+    """ Drops the in-process filter; the next get_filter() rebuilds it from the database. """
+    global _filter, _filter_config, _retry_at
+    _filter = None; _filter_config = None; _retry_at = None
+# --- END Configured Filter ---
+
+
+def seen_message_ids(message_ids, trust_filter=True):
+    """
+    The subset of `message_ids` that already have a ProcessedEmail record. Message-IDs
+    the filter rules out are not looked up; the rest are checked with one IN query
+    on the hash index.
+    """
+    hashes = {ProcessedEmail.hash_message_id(message_id): message_id for message_id in message_ids}
+    bloom = get_filter() if trust_filter else None
+    if bloom is not None and hashes:
+        try:
+            candidates = [digest for digest, maybe in zip(hashes, bloom.might_contain_many(list(hashes))) if maybe]
+        except Exception as filter_error:
+            logger.warning(f"Message-ID Bloom filter lookup failed ({filter_error}). Probing the dedupe index."); candidates = list(hashes)
+    else: candidates = list(hashes)
+    if not candidates: return set()
+    return {hashes[bytes(digest)] for digest in ProcessedEmail.objects.filter(message_hash__in=candidates).values_list('message_hash', flat=True)}
+
+def remember_message_ids(message_ids):
+    """ Adds Message-IDs about to be recorded to the filter (before the rows are written, so the filter never lags the index). """
+    bloom = get_filter()
+    if bloom is None or not message_ids: return
+    try: bloom.add_many([ProcessedEmail.hash_message_id(message_id) for message_id in message_ids])
+    except Exception as filter_error: logger.warning(f"Could not add {len(message_ids)} Message-IDs to the Bloom filter: {filter_error}")
+
+
+def prune_processed_emails(retention_days=None):
+    """
+    Deletes dedupe records older than the mailbox retention window (MAILBOX_RETENTION_DAYS;
+    0 keeps them forever): a message that old can no longer be redelivered. Primary keys
+    follow processed_at, so the scan stops at the first row inside the window and the old
+    rows are deleted in primary-key chunks; processed_at needs no index of its own.
+    The filter is rebuilt afterwards to drop the pruned hashes. Returns the number of rows deleted.
+    """
+    retention_days = settings.MAILBOX_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0: return 0
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    boundary = ProcessedEmail.objects.filter(processed_at__gte=cutoff).order_by('pk').values_list('pk', flat=True).first()
+    expired = ProcessedEmail.objects.filter(pk__lt=boundary) if boundary is not None else ProcessedEmail.objects.all()
+    deleted = 0
+    while True:
+        chunk = list(expired.order_by('pk').values_list('pk', flat=True)[:_PRUNE_CHUNK])
+        if not chunk: break
+        deleted += ProcessedEmail.objects.filter(pk__in=chunk).delete()[0]
+    logger.info(f"Pruned {deleted} dedupe records processed before {cutoff:%Y-%m-%d %H:%M}.")
+    bloom = get_filter()
+    if deleted and bloom is not None: bloom.rebuild()
+    return deleted
@@ -0,0 +1,143 @@
+# api/email_parser.py
+"""
+Streaming, size-capped MIME parsing for incoming bug emails.
+
+`email.message_from_bytes` keeps every part of a message in memory, so one
+large attachment inflates worker RSS by its full (decoded) size. Here the raw
+message is read line by line and pruned before it reaches
+`email.parser.BytesFeedParser`. Headers and MIME boundaries are kept, and so is
+the first inline text/plain body, up to a byte cap. Every other part body
+(attachments, HTML alternatives) is dropped without being buffered. The result
+is an ordinary `email.message.Message` that works with `get_plain_text_body`.
+"""
+import re
+import time
+from dataclasses import dataclass
+from datetime import timezone as dt_timezone
+from email.parser import BytesFeedParser, BytesHeaderParser
+from email.policy import compat32
+from email.utils import parsedate_to_datetime
+
+# --- Precompiled Patterns ---
+BUG_ID_RE = re.compile(r'Bug ID:\s*([\w-]+)', re.IGNORECASE)
+PRIORITY_RE = re.compile(r'^\s*priority:\s*(high|medium|low)\s*$', re.IGNORECASE | re.MULTILINE)
+# --- END Precompiled Patterns ---
+
+# Lenient parsing: defects are recorded on the message, never raised
+PARSE_POLICY = compat32.clone(raise_on_defect=False)
+_MAX_PENDING_LINE = 64 * 1024 # Longest partial line buffered while dropping a part body
+
+
+@dataclass
+class ParseStats:
+    """ Cost of parsing one message (logged per message). """
+    bytes_read: int = 0
+    bytes_skipped: int = 0 # Part bodies dropped without buffering (attachments, other text parts)
+    truncated: bool = False # The text/plain body hit the size cap
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"{self.bytes_read} bytes read, {self.bytes_skipped} skipped{' (body truncated)' if self.truncated else ''}, "
+                f"{self.seconds * 1000:.2f} ms")
+
+
+class _MimePruner:
+    """
+    Line-level MIME state machine that decides which raw lines reach the feed parser.
+    It tracks the boundary stack and the headers of each part, so it needs only the
+    current part's header block in memory.
+    """
+    def __init__(self, max_body_bytes):
+        self.max_body_bytes = max_body_bytes
+        self.boundaries = [] # b'--boundary' markers of the enclosing multiparts
+        self.in_headers = True; self.header_lines = []
+        self.keep_body = False; self.body_bytes = 0; self.found_text = False
+        self.stats = ParseStats()
+
+    def feed_line(self, line):
+        """ Returns the line to pass on, or None to drop it. """
+        if self.in_headers:
+            self.header_lines.append(line)
+            if line in (b'\r\n', b'\n'): self._end_headers()
+            return line
+        if self.boundaries and line.startswith(b'--'):
+            marker = line.rstrip()
+            for depth in range(len(self.boundaries) - 1, -1, -1):
+                boundary = self.boundaries[depth]
+                if marker == boundary: # Next sibling part starts
+                    del self.boundaries[depth + 1:]; self.in_headers = True; self.header_lines = []
+                    return line
+                if marker == boundary + b'--': # Multipart closed; its epilogue is dropped
+                    del self.boundaries[depth:]; self.keep_body = False
+                    return line
+        if self.keep_body and self.body_bytes + len(line) <= self.max_body_bytes:
+            self.body_bytes += len(line)
+            return line
+        if self.keep_body: self.stats.truncated = True
+        self.stats.bytes_skipped += len(line)
+        return None
+
+    def dropping(self):
+        """ True inside a dropped body, where only boundary lines (starting with '--') matter. """
+        return not self.in_headers and not self.keep_body and bool(self.boundaries)
+
+    def drop_partial(self, pending):
+        """ Whether an unterminated line may be discarded now (it is inside a dropped body). """
+        return not self.in_headers and not self.keep_body and len(pending) > _MAX_PENDING_LINE
+
+    def _end_headers(self):
+        self.in_headers = False; self.body_bytes = 0
+        headers = BytesHeaderParser(policy=PARSE_POLICY).parsebytes(b''.join(self.header_lines))
+        self.header_lines = []
+        boundary = headers.get_boundary() if headers.get_content_maintype() == 'multipart' else None
+        if boundary:
+            self.boundaries.append(b'--' + boundary.encode('ascii', 'replace')); self.keep_body = False # Preamble
+            return
+        disposition = str(headers.get('Content-Disposition', '')).lower()
+        self.keep_body = headers.get_content_type() == 'text/plain' and 'attachment' not in disposition and not self.found_text
+        self.found_text = self.found_text or self.keep_body
+
+
+def parse_message(source, max_body_bytes=256 * 1024):
+    """
+    Parses raw RFC822 bytes (or an iterable of byte chunks, e.g. a file read in blocks)
+    without buffering attachment payloads. Returns (email.message.Message, ParseStats).
+    Only the first inline text/plain body is kept, capped at `max_body_bytes` raw bytes.
+    """
+    started = time.perf_counter()
+    pruner = _MimePruner(max_body_bytes)
+    parser = BytesFeedParser(policy=PARSE_POLICY)
+    pending = b''
+    for chunk in ([source] if isinstance(source, (bytes, bytearray)) else source):
+        pruner.stats.bytes_read += len(chunk)
+        pending += chunk
+        start = 0
+        while True:
+            if pruner.dropping() and not pending.startswith(b'--', start):
+                # Jump straight to the next line that could be a boundary instead of splitting every line
+                candidate = pending.find(b'\n--', start)
+                skip_to = candidate + 1 if candidate >= 0 else pending.rfind(b'\n') + 1
+                if skip_to > start: pruner.stats.bytes_skipped += skip_to - start; start = skip_to
+                if candidate < 0: break
+            end = pending.find(b'\n', start)
+            if end < 0: break
+            line = pruner.feed_line(pending[start:end + 1])
+            if line is not None: parser.feed(line)
+            start = end + 1
+        pending = pending[start:]
+        if pruner.drop_partial(pending):
+            pruner.stats.bytes_skipped += len(pending); pending = b''
+    if pending: # Last line without a line ending
+        line = pruner.feed_line(pending)
+        if line is not None: parser.feed(line)
+    message = parser.close()
+    pruner.stats.seconds = time.perf_counter() - started
+    return message, pruner.stats
+
+
+def parse_date_header(value):
+    """ Parses an RFC 5322 Date header into an aware datetime (UTC when it has no zone), or None. """
+    if not value: return None
+    try: parsed = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError, IndexError): return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt_timezone.utc)
@@ -0,0 +1,415 @@
+# api/fake_imap.py
+"""
+A small, self-contained IMAP4rev1 stand-in server for tests and benchmarks.
+
+It speaks plain-text IMAP over a local TCP socket so the real `imaplib`
+client (and therefore `process_incoming_emails`) can be exercised end to end
+without a mail provider. Only the subset of the protocol used by the
+ingestion code is implemented.
+"""
+import email
+import re
+from datetime import date, datetime
+import select
+import socketserver
+import threading
+import time
+
+# --- Command Line Tokenizer ---
+_ATOM_SPECIALS = ' ()"'
+
+
+def _tokenize(line):
+    """
+    Splits an IMAP command line into atoms, quoted strings and nested lists.
+    Bracketed sections (e.g. BODY.PEEK[HEADER.FIELDS (SUBJECT)]) stay part of their atom.
+    """
+    stack = [[]]
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        if ch == ' ':
+            i += 1
+        elif ch == '(':
+            stack.append([]); i += 1
+        elif ch == ')':
+            if len(stack) == 1: raise ValueError("Unbalanced ')' in command.")
+            group = stack.pop(); stack[-1].append(group); i += 1
+        elif ch == '"':
+            j, value = i + 1, []
+            while j < n and line[j] != '"':
+                if line[j] == '\\' and j + 1 < n: j += 1
+                value.append(line[j]); j += 1
+            stack[-1].append(''.join(value)); i = j + 1
+        else:
+            j, depth = i, 0
+            while j < n and (depth or line[j] not in _ATOM_SPECIALS):
+                if line[j] == '[': depth += 1
+                elif line[j] == ']': depth -= 1
+                j += 1
+            stack[-1].append(line[i:j]); i = j
+    if len(stack) != 1: raise ValueError("Unbalanced '(' in command.")
+    return stack[0]
+
+
+def _parse_sequence_set(spec, largest):
+    """Expands an IMAP sequence set ('1:3,7,9:*') into a predicate over numbers."""
+    ranges = []
+    for part in spec.split(','):
+        lo, _, hi = part.partition(':')
+        lo = largest if lo == '*' else int(lo)
+        hi = lo if not hi else (largest if hi == '*' else int(hi))
+        ranges.append((min(lo, hi), max(lo, hi)))
+    return lambda value: any(lo <= value <= hi for lo, hi in ranges)
+
+
+# --- MIME Helpers (BODYSTRUCTURE and body sections) ---
+def _quote(value):
+    if value is None: return 'NIL'
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _raw_payload(part):
+    """ A leaf part's body exactly as transferred (still Content-Transfer-Encoded). """
+    payload = part.get_payload(decode=False)
+    return payload.encode('utf-8', 'surrogateescape') if isinstance(payload, str) else b''
+
+
+def _body_structure(part):
+    """ Renders the RFC 3501 BODYSTRUCTURE of an email.message.Message. """
+    if part.is_multipart():
+        return '(' + ''.join(_body_structure(sub) for sub in part.get_payload()) + f' {_quote(part.get_content_subtype().upper())})'
+    params = (part.get_params() or [])[1:] # The first entry is the content type itself
+    params = '(' + ' '.join(f'{_quote(key.upper())} {_quote(value)}' for key, value in params) + ')' if params else 'NIL'
+    body = _raw_payload(part)
+    fields = [_quote(part.get_content_maintype().upper()), _quote(part.get_content_subtype().upper()), params, 'NIL', 'NIL',
+              _quote(part.get('Content-Transfer-Encoding', '7BIT').upper()), str(len(body))]
+    if part.get_content_maintype() == 'text': fields.append(str(body.count(b'\n')))
+    disposition, filename = part.get_content_disposition(), part.get_filename()
+    if disposition:
+        params = f'("FILENAME" {_quote(filename)})' if filename else 'NIL'
+        disposition = f'({_quote(disposition.upper())} {params})'
+    fields += ['NIL', disposition or 'NIL'] # MD5, disposition
+    return '(' + ' '.join(fields) + ')'
+
+
+def _section_data(raw, section, parsed=None):
+    """
+    Returns BODY[section] of a raw message: '', 'HEADER', 'TEXT', 'HEADER.FIELDS (...)' or a part like '1.2'.
+    `parsed` is an optional already parsed copy of `raw`.
+    """
+    if section == '':
+        return raw
+    separator = b'\r\n\r\n' if b'\r\n\r\n' in raw else b'\n\n'
+    head, _, text = raw.partition(separator)
+    upper = section.upper()
+    if upper == 'HEADER':
+        return head + separator
+    if upper == 'TEXT':
+        return text
+    if upper.startswith('HEADER.FIELDS'):
+        wanted = {name.upper() for name in _tokenize(section[len('HEADER.FIELDS'):])[0]}
+        lines = [f'{name}: {value}' for name, value in (parsed or email.message_from_bytes(raw)).items() if name.upper() in wanted]
+        return ''.join(f'{line}\r\n' for line in lines).encode('utf-8', 'surrogateescape') + b'\r\n'
+    part = parsed or email.message_from_bytes(raw)
+    for index in section.split('.'):
+        index = int(index)
+        if part.is_multipart(): part = part.get_payload()[index - 1]
+        elif index != 1: raise ValueError(f'No body part {section}')
+    return _raw_payload(part)
+
+
+# --- Mailbox State ---
+class FakeMessage:
+    def __init__(self, uid, raw, flags=(), received=None):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.received = received or date.today() # INTERNALDATE, for SEARCH SINCE
+        self._parsed = None
+
+    @property
+    def parsed(self):
+        """ The message parsed once, for BODYSTRUCTURE and section fetches. """
+        if self._parsed is None: self._parsed = email.message_from_bytes(self.raw)
+        return self._parsed
+
+
+class FakeMailbox:
+    """ In-memory store shared by all connections to the server. """
+    def __init__(self, uid_validity=1):
+        self.lock = threading.RLock()
+        self.folders = {}
+        self.uid_validity = uid_validity
+
+    def folder(self, name):
+        with self.lock:
+            return self.folders.setdefault(name.lower(), {'messages': [], 'uidnext': 1})
+
+    def append(self, raw, folder='inbox', flags=(), received=None):
+        """ Adds a raw RFC822 message to a folder (received on `received`, default today) and returns its UID. """
+        with self.lock:
+            box = self.folder(folder)
+            uid = box['uidnext']; box['uidnext'] += 1
+            box['messages'].append(FakeMessage(uid, raw, flags, received))
+            return uid
+
+
+# --- Protocol Handler ---
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    """ Handles one client connection. """
+    disable_nagle_algorithm = True # Many small writes per response; avoid delayed-ACK stalls
+
+    def setup(self):
+        super().setup()
+        self.authenticated = False
+        self.selected = None
+
+    def send(self, line):
+        if isinstance(line, str): line = line.encode()
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        self.send('* OK [CAPABILITY IMAP4rev1 UIDPLUS IDLE] Fake IMAP ready')
+        while True:
+            line = self.rfile.readline()
+            if not line: return
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            tag, _, rest = line.partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            uid_mode = False
+            if command == 'UID':
+                uid_mode = True
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            handler = getattr(self, f'cmd_{command.lower()}', None)
+            if self.server.latency: time.sleep(self.server.latency)
+            self.server.command_count += 1
+            if handler is None:
+                self.send(f'{tag} BAD Unknown command {command}'); continue
+            try:
+                tokens = _tokenize(args)
+                result = handler(tag, tokens, uid_mode) if command in ('FETCH', 'STORE', 'SEARCH') else handler(tag, tokens)
+            except Exception as e:
+                self.send(f'{tag} BAD {command} failed: {e}'); continue
+            if result == 'LOGOUT': return
+
+    # -- Helpers --
+    def _messages(self):
+        return self.server.mailbox.folder(self.selected)['messages']
+
+    def _select_messages(self, spec, uid_mode):
+        """ Returns [(seq, message)] matching a sequence or UID set. """
+        messages = self._messages()
+        if not messages: return []
+        largest = messages[-1].uid if uid_mode else len(messages)
+        matches = _parse_sequence_set(spec, largest)
+        return [(seq, msg) for seq, msg in enumerate(messages, start=1) if matches(msg.uid if uid_mode else seq)]
+
+    def _require_selected(self, tag):
+        if self.selected is None:
+            self.send(f'{tag} BAD No mailbox selected'); return False
+        return True
+
+    # -- Commands --
+    def cmd_capability(self, tag, tokens):
+        self.send('* CAPABILITY IMAP4rev1 UIDPLUS IDLE')
+        self.send(f'{tag} OK CAPABILITY completed')
+
+    def cmd_noop(self, tag, tokens):
+        self.send(f'{tag} OK NOOP completed')
+
+    def cmd_login(self, tag, tokens):
+        user, password = tokens[0], tokens[1]
+        if (user, password) != (self.server.username, self.server.password):
+            self.send(f'{tag} NO [AUTHENTICATIONFAILED] Invalid credentials'); return
+        self.authenticated = True
+        self.send(f'{tag} OK LOGIN completed')
+
+    def cmd_logout(self, tag, tokens):
+        self.send('* BYE Fake IMAP logging out')
+        self.send(f'{tag} OK LOGOUT completed')
+        return 'LOGOUT'
+
+    def cmd_select(self, tag, tokens, readonly=False):
+        if not self.authenticated:
+            self.send(f'{tag} NO Not authenticated'); return
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            box = mailbox.folder(tokens[0])
+            self.selected = tokens[0]
+            self.send(f"* {len(box['messages'])} EXISTS")
+            self.send('* 0 RECENT')
+            self.send(r'* FLAGS (\Seen \Answered \Flagged \Deleted \Draft)')
+            self.send(f'* OK [UIDVALIDITY {mailbox.uid_validity}] UIDs valid')
+            self.send(f"* OK [UIDNEXT {box['uidnext']}] Predicted next UID")
+        self.send(f"{tag} OK [{'READ-ONLY' if readonly else 'READ-WRITE'}] SELECT completed")
+
+    def cmd_examine(self, tag, tokens):
+        self.cmd_select(tag, tokens, readonly=True)
+
+    def cmd_close(self, tag, tokens):
+        self.selected = None
+        self.send(f'{tag} OK CLOSE completed')
+
+    def cmd_search(self, tag, tokens, uid_mode):
+        if not self._require_selected(tag): return
+        if tokens and str(tokens[0]).upper() == 'CHARSET': tokens = tokens[2:]
+        with self.server.mailbox.lock:
+            messages = self._messages()
+            largest_uid = messages[-1].uid if messages else 0
+            results = []
+            for seq, msg in enumerate(messages, start=1):
+                if self._matches_search(tokens, seq, msg, len(messages), largest_uid):
+                    results.append(msg.uid if uid_mode else seq)
+        self.send('* SEARCH' + ''.join(f' {value}' for value in results))
+        self.send(f'{tag} OK SEARCH completed')
+
+    def _matches_search(self, keys, seq, msg, count, largest_uid):
+        keys = list(keys)
+        while keys:
+            key = keys.pop(0)
+            if isinstance(key, list):
+                if not self._matches_search(key, seq, msg, count, largest_uid): return False
+                continue
+            name = key.upper()
+            if name == 'ALL': continue
+            elif name == 'UNSEEN':
+                if '\\Seen' in msg.flags: return False
+            elif name == 'SEEN':
+                if '\\Seen' not in msg.flags: return False
+            elif name == 'UID':
+                if not _parse_sequence_set(keys.pop(0), largest_uid)(msg.uid): return False
+            elif name == 'SINCE':
+                if msg.received < datetime.strptime(keys.pop(0), '%d-%b-%Y').date(): return False
+            elif re.match(r'^[\d*:,]+$', name):
+                if not _parse_sequence_set(name, count)(seq): return False
+            else:
+                raise ValueError(f'Unsupported search key {key}')
+        return True
+
+    def cmd_fetch(self, tag, tokens, uid_mode):
+        if not self._require_selected(tag): return
+        spec, items = tokens[0], tokens[1] if isinstance(tokens[1], list) else tokens[1:]
+        items = [item.upper() if '[' not in item else item for item in items]
+        if uid_mode and 'UID' not in items: items = ['UID'] + items
+        with self.server.mailbox.lock:
+            selected = self._select_messages(spec, uid_mode)
+        for seq, msg in selected:
+            parts = []
+            for item in items:
+                value = self._fetch_item(item, msg)
+                parts.append(value)
+            body = b'* %d FETCH (' % seq + b' '.join(parts) + b')'
+            self.wfile.write(body + b'\r\n')
+        self.send(f'{tag} OK FETCH completed')
+
+    def _fetch_item(self, item, msg):
+        name = item.split('[', 1)[0].upper()
+        if name == 'UID':
+            return b'UID %d' % msg.uid
+        if name == 'FLAGS':
+            return ('FLAGS (%s)' % ' '.join(sorted(msg.flags))).encode()
+        if name == 'RFC822.SIZE':
+            return b'RFC822.SIZE %d' % len(msg.raw)
+        if name == 'BODYSTRUCTURE':
+            return b'BODYSTRUCTURE ' + _body_structure(msg.parsed).encode()
+        if name in ('RFC822', 'BODY', 'BODY.PEEK'):
+            section = item[item.index('['):item.index(']') + 1] if '[' in item else ''
+            if name != 'BODY.PEEK': msg.flags.add('\\Seen')
+            data = _section_data(msg.raw, section[1:-1], msg.parsed)
+            label = 'RFC822' if name == 'RFC822' else 'BODY' + section
+            partial = re.fullmatch(r'<(\d+)\.(\d+)>', item[item.index(']') + 1:]) if '[' in item else None
+            if partial: # <origin.count>: answered as BODY[section]<origin>
+                origin, count = int(partial.group(1)), int(partial.group(2))
+                data = data[origin:origin + count]; label += f'<{origin}>'
+            self.server.bytes_sent += len(data)
+            return label.encode() + b' {%d}\r\n' % len(data) + data
+        raise ValueError(f'Unsupported fetch item {item}')
+
+    def cmd_idle(self, tag, tokens):
+        """ Announces appended messages with EXISTS until the client sends DONE. """
+        if not self._require_selected(tag): return
+        self.send('+ idling')
+        known = len(self._messages())
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], 0.02)
+            if readable:
+                line = self.rfile.readline()
+                if not line: return 'LOGOUT'
+                if line.strip().upper() == b'DONE': break
+            count = len(self._messages())
+            if count > known:
+                self.send(f'* {count} EXISTS'); known = count
+        self.send(f'{tag} OK IDLE terminated')
+
+    def cmd_store(self, tag, tokens, uid_mode):
+        if not self._require_selected(tag): return
+        spec, action = tokens[0], tokens[1].upper()
+        flags = tokens[2] if isinstance(tokens[2], list) else tokens[2:]
+        with self.server.mailbox.lock:
+            selected = self._select_messages(spec, uid_mode)
+            for seq, msg in selected:
+                if action.startswith('+'): msg.flags.update(flags)
+                elif action.startswith('-'): msg.flags.difference_update(flags)
+                else: msg.flags = set(flags)
+        if not action.endswith('.SILENT'):
+            for seq, msg in selected:
+                self.send(f"* {seq} FETCH (UID {msg.uid} FLAGS ({' '.join(sorted(msg.flags))}))")
+        self.send(f'{tag} OK STORE completed')
+
+
+class FakeIMAPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Threaded fake IMAP server bound to localhost on an ephemeral port.
+
+    Usage:
+        with FakeIMAPServer() as server:
+            server.mailbox.append(raw_bytes)
+            ... connect imaplib.IMAP4('127.0.0.1', server.port) ...
+    `latency` adds a per-command delay (seconds) to simulate network round-trips.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, username='bugs@example.com', password='secret', latency=0.0, mailbox=None):
+        super().__init__((host, port), FakeIMAPHandler)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.mailbox = mailbox or FakeMailbox()
+        self.command_count = 0
+        self.bytes_sent = 0 # Message data returned by FETCH (bodies, sections, header fields)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, name='fake-imap', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def make_bug_email(bug_id, body, message_id, subject=None):
+    """ Builds raw bytes for a bug report email in the format the ingestion task expects. """
+    from email.message import EmailMessage
+    msg = EmailMessage()
+    msg['Subject'] = subject or f"Bug ID: {bug_id} - Generated report"
+    msg['From'] = 'reporter@example.com'
+    msg['To'] = 'bugs@example.com'
+    msg['Message-ID'] = message_id
+    msg.set_content(body)
+    return msg.as_bytes()
@@ -0,0 +1,175 @@
+# api/imap_utils.py
+"""
+IMAP protocol helpers used by the ingestion pipeline: connecting, UID sequence
+sets, parsing multi-message FETCH responses (including BODYSTRUCTURE), and IDLE.
+"""
+import base64
+import imaplib
+import logging
+import quopri
+import re
+import select
+import time
+from itertools import takewhile
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def connect_imap(mailbox=None):
+    """
+    Opens an IMAP connection to `mailbox` (a Mailbox; None or its empty fields mean the IMAP_*
+    settings) and logs in. SSL unless disabled. Socket operations time out after IMAP_TIMEOUT
+    seconds, so an unresponsive server fails its own run instead of holding a worker.
+    """
+    own_account = bool(mailbox and mailbox.server and mailbox.username)
+    server = mailbox and mailbox.server or settings.IMAP_SERVER
+    port = mailbox and mailbox.port or settings.IMAP_PORT
+    use_ssl = getattr(settings, 'IMAP_USE_SSL', True) if mailbox is None or mailbox.use_ssl is None else mailbox.use_ssl
+    user, password = (mailbox.username, mailbox.password) if own_account else (settings.IMAP_USER, settings.IMAP_PASSWORD)
+    timeout = getattr(settings, 'IMAP_TIMEOUT', 60) or None
+    mail = imaplib.IMAP4_SSL(server, port, timeout=timeout) if use_ssl else imaplib.IMAP4(server, port, timeout=timeout)
+    mail.login(user, password)
+    logger.info(f"Logged in as {user}" + (f" ({mailbox.name})" if mailbox else ""))
+    return mail
+
+def uid_sequence_set(uids):
+    """ Compresses UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> '1:3,7'. """
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1: ranges[-1][1] = uid
+        else: ranges.append([uid, uid])
+    return ','.join(str(lo) if lo == hi else f"{lo}:{hi}" for lo, hi in ranges)
+
+
+# --- FETCH Response Parsing ---
+# Parens, quoted strings, a trailing literal marker, or an atom (which may carry a
+# bracketed section such as BODY[HEADER.FIELDS (SUBJECT)] and a <partial> suffix).
+_FETCH_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}\s*$|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?))')
+
+def _fetch_tokens(data):
+    """ Flattens imaplib FETCH data (prefix/literal tuples and plain bytes) into (kind, value) tokens. """
+    for item in data:
+        if item is None: continue
+        text, literal = (item[0], item[1]) if isinstance(item, tuple) else (item, None)
+        pos = 0
+        while pos < len(text):
+            match = _FETCH_TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos: break
+            pos = match.end()
+            open_paren, close_paren, quoted, _, atom = match.groups()
+            if open_paren: yield ('(', None)
+            elif close_paren: yield (')', None)
+            elif quoted is not None: yield ('value', re.sub(rb'\\(.)', rb'\1', quoted))
+            elif atom is not None: yield ('value', None if atom.upper() == b'NIL' else atom)
+        if literal is not None: yield ('value', literal)
+
+def parse_fetch_response(data):
+    """
+    Parses a (multi-message) FETCH response into one dict per message, keyed by the
+    upper-cased item name, e.g. {'UID': b'7', 'BODYSTRUCTURE': [...], 'BODY[1]': b'...'}.
+    Works on the whole response as imaplib returns it, regardless of where the server
+    placed literals or the UID item.
+    """
+    stack = [[]]
+    for kind, value in _fetch_tokens(data):
+        if kind == '(':
+            stack.append([])
+        elif kind == ')':
+            if len(stack) > 1: group = stack.pop(); stack[-1].append(group)
+        else:
+            stack[-1].append(value)
+    messages = []
+    for item in stack[0]:
+        if isinstance(item, list):
+            messages.append({item[i].decode(errors='replace').upper(): item[i + 1] for i in range(0, len(item) - 1, 2) if isinstance(item[i], bytes)})
+    return messages
+
+def iter_fetch_response(data):
+    """ Yields (uid, payload) pairs from a multi-message UID FETCH (BODY[] or RFC822) response. """
+    for message in parse_fetch_response(data):
+        payload = message.get('BODY[]', message.get('RFC822'))
+        if 'UID' in message and payload is not None:
+            yield int(message['UID']), payload
+
+def find_text_plain_part(structure, section=''):
+    """
+    Walks a parsed BODYSTRUCTURE and returns (section, encoding, charset) of the first
+    text/plain part that is not an attachment (same rule as get_plain_text_body), or None.
+    Section numbers follow RFC 3501: '1' for a single-part message, '1.2' for nested parts.
+    """
+    if not structure: return None
+    if isinstance(structure[0], list): # Multipart: child parts, then subtype and extension data
+        for index, part in enumerate(takewhile(lambda p: isinstance(p, list), structure), start=1):
+            found = find_text_plain_part(part, f"{section}.{index}" if section else str(index))
+            if found: return found
+        return None
+    media_type, subtype = (structure[0] or b'').lower(), (structure[1] or b'').lower()
+    if (media_type, subtype) != (b'text', b'plain'): return None
+    # text/* fields: type subtype params id description encoding size lines [md5 disposition ...]
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and (disposition[0] or b'').lower() == b'attachment': return None
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((params[i + 1] for i in range(0, len(params) - 1, 2) if (params[i] or b'').lower() == b'charset'), None)
+    return section or '1', (structure[5] or b'7bit').decode().lower(), charset.decode() if charset else None
+
+def decode_body_section(payload, encoding, charset):
+    """ Decodes a fetched MIME section using its Content-Transfer-Encoding and charset (a section cut by a partial fetch decodes up to the cut). """
+    if encoding == 'base64':
+        payload = re.sub(rb'\s+', b'', payload); payload = base64.b64decode(payload[:len(payload) // 4 * 4]) # Whole quanta only
+    elif encoding == 'quoted-printable': payload = quopri.decodestring(payload)
+    try: return payload.decode(charset or 'utf-8', errors='replace')
+    except LookupError: return payload.decode('utf-8', errors='replace')
+# --- END FETCH Response Parsing ---
+
+
+# --- IDLE ---
+_EXISTS_RE = re.compile(rb'^\* \d+ EXISTS')
+
+def idle_wait(mail, timeout):
+    """
+    Issues IMAP IDLE (RFC 2177) on a selected connection and blocks until the server
+    announces new messages (EXISTS) or `timeout` seconds pass, then ends the IDLE.
+    Returns True if new messages were announced.
+    imaplib (before Python 3.14) has no IDLE support and its buffered reader cannot be
+    waited on with a timeout, so the exchange is read straight from the socket. The
+    server sends nothing after the tagged reply, so imaplib's own buffer stays in sync.
+    """
+    tag = mail._new_tag() # Reserve a tag imaplib will not reuse
+    sock = mail.sock
+    buffer = b''
+
+    def read_line(wait=None):
+        nonlocal buffer
+        deadline = None if wait is None else time.monotonic() + wait
+        while b'\r\n' not in buffer:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                has_pending = getattr(sock, 'pending', lambda: 0)() # Decrypted bytes buffered by SSL
+                if not has_pending and (remaining <= 0 or not select.select([sock], [], [], remaining)[0]): return None
+            chunk = sock.recv(4096)
+            if not chunk: raise imaplib.IMAP4.abort("Connection closed during IDLE.")
+            buffer += chunk
+        line, buffer = buffer.split(b'\r\n', 1)
+        return line
+
+    mail.send(tag + b' IDLE\r\n')
+    line = read_line()
+    if not line.startswith(b'+'): raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+    announced = False; deadline = time.monotonic() + timeout
+    while not announced:
+        line = read_line(deadline - time.monotonic())
+        if line is None: break # Timed out
+        if _EXISTS_RE.match(line): announced = True
+
+    mail.send(b'DONE\r\n')
+    while True:
+        line = read_line()
+        if line.startswith(tag):
+            if not line[len(tag):].strip().startswith(b'OK'): raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+            break
+        if _EXISTS_RE.match(line): announced = True
+    return announced
+# --- END IDLE ---
@@ -0,0 +1,110 @@
+# api/importer.py
+"""
+Backfill of historical bug emails from mbox files and Maildir directories.
+
+Archives are read one message at a time (an mbox is split on its "From "
+separator lines as the file is read), so memory does not grow with archive
+size. Parsing reuses the ingestion helpers in tasks.py and runs in worker
+processes. Persistence goes through persist_batch, so re-importing an archive
+or overlapping with IMAP ingestion is deduplicated by Message-ID.
+"""
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+
+from .persistence import persist_batch, PROCESSED
+from .tasks import parse_email
+
+logger = logging.getLogger(__name__)
+
+_MBOX_FROM_ESCAPE_RE = re.compile(rb'^>+From ') # mboxrd/mboxo quoting of body lines that start with "From "
+
+
+def iter_mbox(path):
+    """ Yields (label, raw bytes) for each message of an mbox file, reading it line by line. """
+    def message(lines):
+        if lines and lines[-1] in (b'\n', b'\r\n'): lines.pop() # The blank line before a separator belongs to the mbox format
+        return b''.join(lines)
+
+    with open(path, 'rb') as mbox:
+        lines = []; index = 0; after_blank = True
+        for line in mbox:
+            if after_blank and line.startswith(b'From '): # Separator line ("From sender date")
+                if lines: yield f"{path}#{index}", message(lines)
+                lines = []; index += 1; after_blank = False
+                continue
+            if _MBOX_FROM_ESCAPE_RE.match(line): line = line[1:]
+            lines.append(line); after_blank = line in (b'\n', b'\r\n')
+        if lines: yield f"{path}#{index}", message(lines)
+
+def iter_maildir(path):
+    """ Yields (label, raw bytes) for each message in a Maildir's cur/ and new/ (delivery order: file names start with a timestamp). """
+    names = []
+    for subdir in ('cur', 'new'):
+        folder = os.path.join(path, subdir)
+        if os.path.isdir(folder): names += [(name, os.path.join(folder, name)) for name in os.listdir(folder) if not name.startswith('.')]
+    for _, file_path in sorted(names):
+        with open(file_path, 'rb') as message: yield file_path, message.read()
+
+def iter_archive(path):
+    """ Maildir if `path` is a directory with cur/ or new/, mbox otherwise. """
+    if os.path.isdir(path):
+        if not any(os.path.isdir(os.path.join(path, subdir)) for subdir in ('cur', 'new')):
+            raise ValueError(f"{path} is a directory but not a Maildir (no cur/ or new/).")
+        return iter_maildir(path)
+    if not os.path.isfile(path): raise ValueError(f"{path} is neither an mbox file nor a Maildir.")
+    return iter_mbox(path)
+
+
+def _init_worker(api_log_level):
+    """ Workers may be spawned rather than forked: set Django up before tasks are unpickled, keeping the parent's log level. """
+    django.setup()
+    logging.getLogger('api').setLevel(api_log_level)
+
+def parse_archived_email(item):
+    """ Process pool worker: (label, raw) -> ParsedEmail dated by its Date header, or None if unusable. """
+    label, raw = item
+    try:
+        return parse_email(raw, label, keep_date=True)
+    except Exception as parse_error:
+        logger.error(f"Error parsing archived email {label}: {parse_error}", exc_info=True)
+        return None
+
+
+def import_messages(messages, batch_size=1000, workers=None, on_batch=None):
+    """
+    Parses (label, raw) pairs in a process pool (`workers`=0 parses in-process) and
+    persists them in transactional batches of `batch_size`, in archive order. The next
+    batch is parsed while the current one is written.
+    `on_batch(counts)` is called after each batch. Returns counts:
+    {'read', 'processed', 'skipped'} (skipped = unusable or already imported).
+    """
+    counts = {'read': 0, 'processed': 0, 'skipped': 0}
+
+    def write(parsed):
+        usable = [email for email in parsed if email is not None]
+        outcomes = persist_batch(usable)
+        counts['read'] += len(parsed)
+        counts['processed'] += sum(outcome == PROCESSED for outcome in outcomes)
+        counts['skipped'] += len(parsed) - sum(outcome == PROCESSED for outcome in outcomes)
+        if on_batch: on_batch(dict(counts))
+
+    messages = iter(messages)
+    windows = iter(lambda: list(islice(messages, batch_size)), [])
+    if workers == 0:
+        for window in windows: write([parse_archived_email(item) for item in window])
+        return counts
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(logging.getLogger('api').level,)) as pool:
+        pending = None
+        for window in windows:
+            parsing = pool.map(parse_archived_email, window, chunksize=max(1, len(window) // (workers * 4)))
+            if pending is not None: write(list(pending))
+            pending = parsing
+        if pending is not None: write(list(pending))
+    return counts
@@ -0,0 +1,131 @@
+# api/loadgen.py
+"""
+Synthetic bug email workload for the fake IMAP server (see fake_imap.py).
+
+The generated stream mixes new bugs with updates to earlier ones, optional
+attachments, and redelivered Message-IDs, so ingestion can be load-tested
+against realistic shapes without a mail provider. With `replies` the updates
+are written like mail client replies: new text on top, then the whole earlier
+thread quoted below an attribution line, plus a signature.
+fill_bug_table writes generated bugs (and their search documents) straight to
+the database, for list and search benchmarks at sizes no mailbox could feed.
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+
+
+@dataclass
+class WorkloadStats:
+    """ What a generated workload contains, for checking ingestion results. """
+    emails: int = 0
+    new_bugs: int = 0
+    updates: int = 0
+    duplicates: int = 0 # Redelivered Message-IDs (ingestion must skip them)
+    attachments: int = 0
+    delivered_at: dict = field(default_factory=dict) # Message-ID -> time.time() of first delivery
+
+
+def generate_bug_emails(count, update_ratio=0.5, duplicate_ratio=0.0, attachment_kb=0, attachment_ratio=0.0, replies=False, seed=0, stats=None):
+    """
+    Yields (message_id, raw bytes) for `count` synthetic bug report emails.
+    `update_ratio` of the non-duplicate emails update an already reported bug, the rest
+    report a new one; `duplicate_ratio` of all emails re-send an earlier Message-ID;
+    `attachment_ratio` of the emails carry an `attachment_kb` KiB binary attachment;
+    with `replies` every update quotes its bug's thread so far.
+    The same seed always produces the same stream.
+    """
+    rng = random.Random(seed)
+    stats = stats if stats is not None else WorkloadStats()
+    bug_ids = []; sent = []; threads = {} # bug_id -> full body of its latest email (quoted by the next reply)
+    for i in range(count):
+        if sent and rng.random() < duplicate_ratio:
+            message_id, raw = sent[rng.randrange(len(sent))]
+            stats.duplicates += 1
+        else:
+            if bug_ids and rng.random() < update_ratio:
+                bug_id = rng.choice(bug_ids); stats.updates += 1
+            else:
+                bug_id = f"LOAD-{len(bug_ids):05d}"; bug_ids.append(bug_id); stats.new_bugs += 1
+            message_id = f"<load-{seed}-{i}@example.com>"
+            with_attachment = attachment_kb > 0 and rng.random() < attachment_ratio
+            raw = _make_email(bug_id, message_id, i, rng, attachment_kb * 1024 if with_attachment else 0, threads if replies else None)
+            stats.attachments += with_attachment
+            sent.append((message_id, raw))
+        stats.emails += 1
+        yield message_id, raw
+
+
+def fill_mailbox(mailbox, count, folder='inbox', rate=None, **options):
+    """
+    Appends a generated workload to a FakeMailbox. With `rate` (emails/sec) delivery
+    happens on a background thread, like mail arriving during ingestion; the thread is
+    returned with the stats. Otherwise the mailbox is filled before returning.
+    Returns (WorkloadStats, thread or None).
+    """
+    stats = WorkloadStats()
+
+    def deliver():
+        start = time.monotonic()
+        for i, (message_id, raw) in enumerate(generate_bug_emails(count, stats=stats, **options)):
+            if rate:
+                delay = start + i / rate - time.monotonic()
+                if delay > 0: time.sleep(delay)
+            stats.delivered_at.setdefault(message_id, time.time())
+            mailbox.append(raw, folder)
+
+    if not rate:
+        deliver(); return stats, None
+    thread = threading.Thread(target=deliver, name='loadgen-delivery', daemon=True)
+    thread.start()
+    return stats, thread
+
+
+BUG_WORDS = ('crash', 'save', 'login', 'timeout', 'render', 'editor', 'upload', 'export', 'report', 'slow', 'memory', 'leak', 'button',
+             'layout', 'network', 'retry', 'cache', 'token', 'session', 'profile', 'search', 'filter', 'chart', 'dashboard', 'email',
+             'password', 'sync', 'offline', 'locale', 'font', 'scroll', 'modal', 'invoice', 'payment', 'webhook', 'queue', 'worker')
+
+def fill_bug_table(count, description_words=120, rare=None, seed=0, batch_size=5000, on_batch=None):
+    """
+    Bulk inserts `count` bugs BENCH-0.. with Zipf-distributed words from BUG_WORDS (a few words are in almost
+    every bug) and indexes their descriptions for search. Bug number `rare` also gets the word "zq<rare>".
+    No revisions or logs are written; `on_batch(bugs, descriptions)` gets each batch's texts instead.
+    Call inside a transaction that the caller rolls back.
+    """
+    from . import search
+    from .models import Bug
+    rng = random.Random(seed); weights = [1 / (rank + 1) for rank in range(len(BUG_WORDS))]
+    for offset in range(0, count, batch_size):
+        bugs = []; descriptions = []
+        for number in range(offset, min(offset + batch_size, count)):
+            words = rng.choices(BUG_WORDS, weights, k=description_words)
+            if number == rare: words.append(f"zq{number}")
+            description = ' '.join(words); subject = ' '.join(rng.choices(BUG_WORDS, weights, k=5)).capitalize()
+            bugs.append(Bug(bug_id=f"BENCH-{number}", subject=subject, summary=Bug.summarize(description))); descriptions.append(description)
+        Bug.objects.bulk_create(bugs) # Sets the pks (RETURNING)
+        search.index_documents((bug.pk, bug.bug_id, bug.subject, description) for bug, description in zip(bugs, descriptions))
+        if on_batch: on_batch(bugs, descriptions)
+
+
+def _make_email(bug_id, message_id, i, rng, attachment_size, threads=None):
+    msg = EmailMessage()
+    previous = threads.get(bug_id) if threads is not None else None
+    msg['Subject'] = f"{'Re: ' if previous else ''}Bug ID: {bug_id} - Synthetic report {i}"
+    sender = f"reporter{rng.randrange(100)}"
+    msg['From'] = f"{sender}@example.com"; msg['To'] = 'bugs@example.com'
+    msg['Message-ID'] = message_id
+    priority = rng.choice(('High', 'Medium', 'Low', None))
+    lines = [f"Synthetic failure report {i}."] + (([f"Priority: {priority}"]) if priority else []) + ["Steps to reproduce follow."] * rng.randrange(1, 30)
+    body = "\n".join(lines)
+    if threads is not None:
+        body += f"\n\n-- \n{sender.capitalize()}\nQA, Example Corp\n"
+        if previous:
+            quoted = "\n".join(f">{line}" if line.startswith('>') else f"> {line}" if line else ">" for line in previous.splitlines())
+            body += f"\nOn Mon, 3 Jun 2024 at 10:{i % 60:02d}, {sender}@example.com wrote:\n{quoted}\n"
+        threads[bug_id] = body
+    msg.set_content(body)
+    if attachment_size:
+        msg.add_attachment(rng.randbytes(attachment_size), maintype='application', subtype='octet-stream', filename='trace.bin')
+    return msg.as_bytes()
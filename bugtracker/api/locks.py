@@ -0,0 +1,157 @@
+# api/locks.py
+"""
+Lease locks that keep ingestion runs from overlapping.
+
+A lease is a key with an expiry that holds the holder's token
+(host:pid:random). While the holder works, a heartbeat thread renews the lease
+every third of its TTL. A run longer than the TTL keeps the lease, and the lease
+of a crashed worker expires by itself. Renewal and release only touch the key if
+it still holds the holder's token. With INGEST_LOCK_URL set (a redis:// URL, by
+default the Celery broker) the lease is shared by every worker. Without it the
+lease only covers the current process.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LeaseStats:
+    """ What happened to one lease request; returned in task results. """
+    name: str
+    backend: str = 'local'
+    acquired: bool = False # False: another holder had it and the caller should exit
+    contended: bool = False
+    holder: str = '' # Token of the current holder (ours when acquired)
+    wait_seconds: float = 0.0 # Time spent acquiring
+    held_seconds: float = 0.0
+    renewals: int = 0
+    lost: bool = False # A renewal found the lease expired or taken over
+
+    def to_dict(self): return asdict(self)
+
+
+class LocalLeaseBackend:
+    """ Leases held in this process only (for development and single-process deployments). """
+    name = 'local'
+    _leases = {}; _mutex = threading.Lock() # key -> (token, monotonic expiry), shared by every instance
+
+    def acquire(self, key, token, ttl):
+        """ (True, token) if the lease was taken, else (False, current holder). """
+        with self._mutex:
+            holder = self._leases.get(key)
+            if holder and holder[1] > time.monotonic(): return False, holder[0]
+            self._leases[key] = (token, time.monotonic() + ttl)
+            return True, token
+
+    def renew(self, key, token, ttl):
+        with self._mutex:
+            holder = self._leases.get(key)
+            if not holder or holder[0] != token or holder[1] <= time.monotonic(): return False
+            self._leases[key] = (token, time.monotonic() + ttl)
+            return True
+
+    def release(self, key, token):
+        with self._mutex:
+            if self._leases.get(key, (None,))[0] == token: del self._leases[key]
+
+
+class RedisLeaseBackend:
+    """ Leases in Redis: SET NX PX to acquire, token-checked Lua scripts to renew and release. """
+    name = 'redis'
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url):
+        import redis # Optional dependency (also the Celery broker client)
+        self.client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+        self.renew_script = self.client.register_script(self._RENEW)
+        self.release_script = self.client.register_script(self._RELEASE)
+
+    def acquire(self, key, token, ttl):
+        if self.client.set(key, token, nx=True, px=int(ttl * 1000)): return True, token
+        holder = self.client.get(key)
+        return False, holder.decode() if holder else ''
+
+    def renew(self, key, token, ttl):
+        return bool(self.renew_script(keys=[key], args=[token, int(ttl * 1000)]))
+
+    def release(self, key, token):
+        self.release_script(keys=[key], args=[token])
+
+
+_backend = None; _backend_url = None
+
+def get_backend():
+    """ The lease backend configured by INGEST_LOCK_URL (Redis when set, this process otherwise). """
+    global _backend, _backend_url
+    url = getattr(settings, 'INGEST_LOCK_URL', '')
+    if _backend is None or url != _backend_url:
+        _backend = RedisLeaseBackend(url) if url else LocalLeaseBackend(); _backend_url = url
+    return _backend
+
+
+_held = ContextVar('held_leases', default=frozenset())
+
+@contextmanager
+def lease(name, ttl=None, on_lost=None):
+    """
+    Takes the lease `name` without waiting and keeps it renewed until the block exits.
+    Yields LeaseStats: when `acquired` is False another holder has the lease and the
+    caller should return at once. `on_lost` is called from the heartbeat thread if the
+    lease expires or is taken over while the block runs. Code already holding the lease
+    (e.g. a task run eagerly from inside the holder) re-enters it. If the backend is
+    unreachable the block runs without a lease, as if it had been acquired.
+    """
+    ttl = ttl or getattr(settings, 'INGEST_LOCK_TTL', 60)
+    stats = LeaseStats(name)
+    if name in _held.get():
+        stats.backend = 'reentrant'; stats.acquired = True
+        yield stats; return
+    key = f"bugtracker:lock:{name}"; token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+    started = time.perf_counter(); backend = None
+    try:
+        backend = get_backend(); stats.backend = backend.name
+        stats.acquired, stats.holder = backend.acquire(key, token, ttl)
+    except Exception as lock_error:
+        logger.warning(f"Lease '{name}' unavailable ({lock_error}). Running without it.")
+        backend = None; stats.backend = 'unavailable'; stats.acquired = True
+    stats.wait_seconds = round(time.perf_counter() - started, 6)
+    if not stats.acquired:
+        stats.contended = True
+        yield stats; return
+
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(ttl / 3):
+            try: renewed = backend.renew(key, token, ttl)
+            except Exception as renew_error:
+                logger.warning(f"Could not renew lease '{name}': {renew_error}"); continue
+            if renewed: stats.renewals += 1; continue
+            stats.lost = True
+            logger.error(f"Lease '{name}' was lost (expired or taken over). Stopping the holder.")
+            if on_lost: on_lost()
+            return
+    beat = threading.Thread(target=heartbeat, name=f"lease-{name}", daemon=True) if backend is not None else None
+    if beat: beat.start()
+    held = _held.set(_held.get() | {name})
+    try:
+        yield stats
+    finally:
+        _held.reset(held)
+        stop.set()
+        if beat: beat.join()
+        if backend is not None and not stats.lost:
+            try: backend.release(key, token)
+            except Exception as release_error: logger.warning(f"Could not release lease '{name}' (it expires in {ttl}s): {release_error}")
+        stats.held_seconds = round(time.perf_counter() - started - stats.wait_seconds, 6)
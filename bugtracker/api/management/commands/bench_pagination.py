@@ -0,0 +1,61 @@
+# api/management/commands/bench_pagination.py
+import base64
+import logging
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.loadgen import fill_bug_table
+from api.views import BugListView
+
+class Command(BaseCommand):
+    help = ('Times BugListView pages at increasing depth with page numbers (COUNT + OFFSET) and with keyset cursors, '
+            'unfiltered and with searches, on a generated table of bugs. No shared cache, so nothing is served from it. DB changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bugs', type=int, default=1_000_000, help='Generated bugs.')
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--searches', nargs='*', default=['', 'memory leak', 'crash'], help="Search terms ('' = unfiltered).")
+        parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions; the best one is reported.')
+
+    def handle(self, *args, **options):
+        logging.getLogger('api').setLevel(logging.WARNING)
+        size = options['page_size']
+        with transaction.atomic(), override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}, ALLOWED_HOSTS=['testserver']):
+            started = time.perf_counter(); fill_bug_table(options['bugs'], description_words=40)
+            self.stdout.write(f"Generated {options['bugs']} bugs in {time.perf_counter() - started:.1f}s; page size {size}.")
+            self.user = User.objects.create_user("bench-pagination")
+            for term in options['searches']:
+                view = BugListView.as_view(); matches = view(self._request({'page_size': size}, term)).data['count']
+                self.stdout.write(f"  search '{term}' ({matches} matches)")
+                self.stdout.write(f"    {'page':>8} {'page number ms':>15} {'keyset ms':>10}")
+                last = max(-(-matches // size), 1); depths = sorted({page for page in (1, 10, 1000, last // 2, last) if 1 <= page <= last})
+                for page in depths:
+                    number_ms = self._time(view, {'page': page, 'page_size': size}, term, options['repeat'])
+                    keyset_ms = self._time(view, {'cursor': self._cursor(term, (page - 1) * size), 'page_size': size}, term, options['repeat'])
+                    self.stdout.write(f"    {page:>8} {number_ms:15.1f} {keyset_ms:10.1f}")
+            transaction.set_rollback(True) # Leave the database untouched
+
+    def _request(self, params, term):
+        request = APIRequestFactory().get('/api/bugs/', {**params, **({'search': term} if term else {})})
+        force_authenticate(request, user=self.user); return request
+
+    def _cursor(self, term, offset):
+        """ The cursor a client following `next` links holds before the row at `offset` (looked up outside the timings). """
+        if offset == 0: return ''
+        view = BugListView(); view.request = Request(self._request({'cursor': ''}, term)) # Same filter as the keyset pages
+        row = view.filter_queryset(view.get_queryset()).order_by('-created_at', '-pk')[offset - 1]
+        return base64.urlsafe_b64encode(f"n|{row.created_at.isoformat()}|{row.pk}".encode()).decode().rstrip('=')
+
+    def _time(self, view, params, term, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter(); response = view(self._request(params, term))
+            elapsed = (time.perf_counter() - start) * 1000; best = elapsed if best is None else min(best, elapsed)
+            assert response.status_code == 200, response.data
+        return best
@@ -0,0 +1,74 @@
+# api/management/commands/bench_parsing.py
+import email
+import email.policy
+import logging
+import time
+import tracemalloc
+from email.header import Header
+from email.message import EmailMessage
+
+from django.core.management.base import BaseCommand
+
+from api.email_parser import parse_message
+from api.tasks import decode_subject, get_plain_text_body, parse_priority_from_body
+
+class Command(BaseCommand):
+    help = ('Micro-benchmarks the email parsing helpers (decode_subject, get_plain_text_body, parse_priority_from_body) '
+            'and compares full-tree parsing with the streaming parser over a generated corpus.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=200, help='Corpus size.')
+        parser.add_argument('--attachment-kb', type=int, default=512, help='Size of the attachment carried by every third email.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions; the best one is reported.')
+
+    def handle(self, *args, **options):
+        logging.getLogger('api').setLevel(logging.WARNING) # Debug lines per call would dominate the timings
+        corpus = [self._make_email(i, options['attachment_kb'] * 1024) for i in range(options['emails'])]
+        messages = [email.message_from_bytes(raw) for raw in corpus]
+        subjects = [msg['Subject'] for msg in messages]
+        bodies = [get_plain_text_body(msg) for msg in messages]
+        total_kb = sum(len(raw) for raw in corpus) / 1024
+        self.stdout.write(f"Corpus: {len(corpus)} emails, {total_kb:.0f} KiB (best of {options['repeat']} runs)")
+
+        benchmarks = (
+            ('decode_subject', subjects, decode_subject),
+            ('get_plain_text_body', messages, get_plain_text_body),
+            ('parse_priority_from_body', bodies, parse_priority_from_body),
+            ('message_from_bytes + body', corpus, lambda raw: get_plain_text_body(email.message_from_bytes(raw))),
+            ('parse_message + body', corpus, lambda raw: get_plain_text_body(parse_message(raw)[0])),
+        )
+        for label, inputs, func in benchmarks:
+            per_call = self._best_time(func, inputs, options['repeat']) / len(inputs)
+            self.stdout.write(f"  {label:<28} {per_call * 1e6:10.1f} us/call")
+
+        self.stdout.write("Peak traced memory per message (largest email):")
+        largest = max(corpus, key=len)
+        for label, func in (('message_from_bytes', email.message_from_bytes), ('parse_message', parse_message)):
+            tracemalloc.start()
+            func(largest)
+            _, peak = tracemalloc.get_traced_memory(); tracemalloc.stop()
+            self.stdout.write(f"  {label:<28} {peak / 1024:10.1f} KiB")
+
+    def _best_time(self, func, inputs, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            for item in inputs: func(item)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _make_email(self, i, attachment_size):
+        """ Rotates through plain, encoded-subject, multipart/alternative and attachment-carrying reports. """
+        msg = EmailMessage(policy=email.policy.SMTP)
+        priority = ('High', 'Medium', 'Low', None)[i % 4]
+        body = f"Step {i} fails with a stack trace.\n" + (f"Priority: {priority}\n" if priority else "") + "Details follow.\n" * 20
+        subject = f"Bug ID: PARSE-{i % 50:03d} - Crash in module {i}"
+        msg['Subject'] = Header(subject + " été", 'utf-8').encode() if i % 4 == 1 else subject
+        msg['From'] = 'reporter@example.com'; msg['To'] = 'bugs@example.com'; msg['Message-ID'] = f"<parse-{i}@example.com>"
+        msg.set_content(body, cte='base64' if i % 5 == 0 else None)
+        if i % 3 == 2:
+            msg.add_alternative(f"<p>{body}</p>", subtype='html')
+        if i % 3 == 0:
+            msg.add_attachment(bytes(range(256)) * (attachment_size // 256), maintype='application', subtype='octet-stream', filename='trace.bin')
+        return msg.as_bytes()
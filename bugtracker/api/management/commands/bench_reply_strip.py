@@ -0,0 +1,56 @@
+# api/management/commands/bench_reply_strip.py
+import logging
+import time
+import zlib
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.loadgen import generate_bug_emails
+from api.reply_parser import strip_reply
+from api.tasks import parse_email
+
+class Command(BaseCommand):
+    help = ('Measures quoted-reply stripping on a generated corpus of reply threads (every update quotes its bug\'s thread and '
+            'carries a signature): stored description bytes per bug before and after, compressed as BugRevision keeps them, '
+            'and the stripping cost per email. No database access.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=2000, help='Corpus size.')
+        parser.add_argument('--update-ratio', type=float, default=0.8, help='Fraction of emails that reply to an existing bug.')
+        parser.add_argument('--seed', type=int, default=0, help='Corpus seed.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions; the best one is reported.')
+
+    def handle(self, *args, **options):
+        logging.getLogger('api').setLevel(logging.WARNING)
+        with override_settings(EMAIL_STRIP_QUOTED=False): # The unstripped bodies are the "before" column
+            parsed = [parse_email(raw, message_id) for message_id, raw in generate_bug_emails(options['emails'], update_ratio=options['update_ratio'], replies=True, seed=options['seed'])]
+        parsed = [email for email in parsed if email is not None]
+        bodies = [email.description for email in parsed]
+
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            start = time.perf_counter(); stripped = [strip_reply(body) for body in bodies]
+            elapsed = time.perf_counter() - start; best = elapsed if best is None else min(best, elapsed)
+
+        totals = defaultdict(lambda: [0, 0, 0, 0]) # bug_id -> [before, after, before compressed, after compressed] over all revisions
+        latest = {}
+        for email, before, after in zip(parsed, bodies, stripped):
+            before_bytes = before.encode('utf-8', 'surrogateescape'); after_bytes = after.encode('utf-8', 'surrogateescape')
+            sizes = totals[email.bug_id]
+            sizes[0] += len(before_bytes); sizes[1] += len(after_bytes)
+            sizes[2] += len(zlib.compress(before_bytes, 6)); sizes[3] += len(zlib.compress(after_bytes, 6))
+            latest[email.bug_id] = (len(before_bytes), len(after_bytes))
+
+        bugs = len(totals)
+        column = lambda index: sum(sizes[index] for sizes in totals.values()) / bugs / 1024
+        self.stdout.write(f"Corpus: {len(parsed)} emails, {bugs} bugs, {sum(map(len, bodies)) / 1024:.0f} KiB of bodies")
+        self.stdout.write(f"  {'':<34} {'before':>10} {'after':>10} {'saved':>7}")
+        for label, before, after in (
+            ('revisions per bug (KiB)', column(0), column(1)),
+            ('revisions per bug, zlib (KiB)', column(2), column(3)),
+            ('current description per bug (KiB)', sum(b for b, _ in latest.values()) / bugs / 1024, sum(a for _, a in latest.values()) / bugs / 1024),
+        ):
+            self.stdout.write(f"  {label:<34} {before:10.2f} {after:10.2f} {1 - after / before if before else 0:7.1%}")
+        self.stdout.write(f"  strip_reply: {best / len(bodies) * 1e6:.1f} us/email (best of {options['repeat']})")
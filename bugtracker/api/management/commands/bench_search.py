@@ -0,0 +1,78 @@
+# api/management/commands/bench_search.py
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import search
+from api.loadgen import fill_bug_table
+from api.models import Bug
+from api.views import BugListView
+
+LIKE_TABLE = 'bench_search_documents' # The texts the index gets, as the api_bug columns SearchFilter used to scan
+
+class Command(BaseCommand):
+    help = ('Compares BugListView search through the full-text index with LIKE scans (SearchFilter over bug_id, subject and the full '
+            'description) on a generated table of bugs (count plus first page, as the paginated list runs them). '
+            'Both must return the same bugs. DB changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bugs', type=int, default=1_000_000, help='Generated bugs.')
+        parser.add_argument('--description-words', type=int, default=120, help='Words per generated description.')
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions; the best one is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None: raise CommandError("This database has no full-text index (run migrations, or set SEARCH_FULL_TEXT=True).")
+        logging.getLogger('api').setLevel(logging.WARNING)
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE {LIKE_TABLE} (id bigint PRIMARY KEY, bug_id varchar(50), subject varchar(255), description text, created_at timestamp)")
+            rare = rng.randrange(options['bugs']) # The one bug whose description holds the rare word
+            started = time.perf_counter(); fill_bug_table(options['bugs'], options['description_words'], rare=rare, seed=options['seed'], on_batch=self._copy_texts)
+            self.stdout.write(f"Generated and indexed {options['bugs']} bugs in {time.perf_counter() - started:.1f}s ({search.get_backend().name}).")
+            queries = (('common word', 'crash'), ('two words', 'memory leak'), ('prefix', 'dashb'), ('rare word', f"zq{rare}"), ('bug id', f"BENCH-{options['bugs'] // 2}"))
+            self.stdout.write(f"  {'query':<14} {'matches':>9} {'LIKE ms':>10} {'FTS ms':>10} {'speedup':>8}")
+            for label, term in queries:
+                request = Request(APIRequestFactory().get('/api/bugs/', {'search': term}))
+                fts = search.FullTextSearchFilter().filter_queryset(request, Bug.objects.order_by('-created_at'), BugListView())
+                like_sql, like_params = self._like_where(filters.SearchFilter().get_search_terms(request))
+                like_ids = {pk for pk, in self._query(f"SELECT id FROM {LIKE_TABLE} WHERE {like_sql}", like_params)}
+                if like_ids != set(fts.values_list('pk', flat=True)):
+                    raise CommandError(f"'{term}': LIKE and full-text search disagree ({len(like_ids)} vs {fts.count()} matches); the timings would compare different results.")
+                like_ms = self._time(lambda: (self._query(f"SELECT COUNT(*) FROM {LIKE_TABLE} WHERE {like_sql}", like_params),
+                                              self._query(f"SELECT id, bug_id, subject FROM {LIKE_TABLE} WHERE {like_sql} ORDER BY created_at DESC LIMIT %s", like_params + [options['page_size']])), options)
+                fts_ms = self._time(lambda: (fts.all().count(), list(fts.all()[:options['page_size']])), options)
+                self.stdout.write(f"  {label:<14} {len(like_ids):>9} {like_ms:10.1f} {fts_ms:10.1f} {like_ms / fts_ms if fts_ms else 0:7.1f}x")
+            transaction.set_rollback(True) # Leave the database untouched
+
+    def _copy_texts(self, bugs, descriptions):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {LIKE_TABLE} (id, bug_id, subject, description, created_at) VALUES (%s, %s, %s, %s, %s)",
+                               [(bug.pk, bug.bug_id, bug.subject, description, connection.ops.adapt_datetimefield_value(bug.created_at)) for bug, description in zip(bugs, descriptions)])
+
+    @staticmethod
+    def _like_where(terms):
+        """ SearchFilter's condition: every term is a case-insensitive substring of one of the columns. """
+        condition = "(UPPER(bug_id) LIKE UPPER(%s) OR UPPER(subject) LIKE UPPER(%s) OR UPPER(description) LIKE UPPER(%s))"
+        return ' AND '.join([condition] * len(terms)), [f"%{term}%" for term in terms for _ in range(3)]
+
+    @staticmethod
+    def _query(sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params); return cursor.fetchall()
+
+    def _time(self, run, options):
+        """ Best milliseconds of `run()` (the count and first page of a search). """
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            start = time.perf_counter(); run()
+            elapsed = (time.perf_counter() - start) * 1000; best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -6,7 +6,8 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db import transaction
 from django.db.models import F
-from api.models import Bug, BugModificationLog
+from api import search
+from api.models import Bug, BugModificationDaily, BugModificationLog, BugRevision
 
 class Command(BaseCommand):
     help = 'Populates the database with sample bugs and modification logs over a specified period.'
@@ -58,7 +59,7 @@ class Command(BaseCommand):
                 created_at=created_at_sim, # Set simulated creation time
                 updated_at=created_at_sim, # Initial update time matches creation
             )
-            bug.save() # Save the bug first
+            bug.save() # Save the bug first (also stores the description as revision 1)
             created_bugs.append(bug)
             # Note: auto_now_add/auto_now are bypassed when explicitly setting dates
 
@@ -68,6 +69,7 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Simulating {num_updates} bug updates over the last {num_days} days...")
         update_count = 0; log_count = 0
+        revision_numbers = {}; latest_descriptions = {} # bug pk -> latest revision number (1 = created above) / text
 
         for i in range(num_updates):
             bug_to_update = random.choice(created_bugs)
@@ -90,11 +92,11 @@ class Command(BaseCommand):
 
             # Update fields (only description for simplicity now)
             new_description = f"Description updated on {final_simulated_date.strftime('%Y-%m-%d %H:%M')}.\n" \
-                              f"Old description started: {bug_to_update.description[:50]}..."
+                              f"Old description started: {latest_descriptions.get(bug_to_update.pk, bug_to_update.description)[:50]}..."
 
             # Update using .update() for efficiency & correct F() usage
             updated_rows = Bug.objects.filter(pk=bug_to_update.pk).update(
-                description=new_description,
+                summary=Bug.summarize(new_description),
                 modified_count=F('modified_count') + 1,
                 # Manually set updated_at to match simulated date
                 updated_at=final_simulated_date
@@ -103,11 +105,16 @@ class Command(BaseCommand):
             if updated_rows > 0:
                 update_count += 1
                 # Create modification log with the SIMULATED date
-                BugModificationLog.objects.create(
+                log = BugModificationLog.objects.create(
                     bug=bug_to_update, # Pass the instance
                     modified_at=final_simulated_date
                 )
                 log_count += 1
+                # Keep the new text as the bug's next revision, linked to its log
+                revision_numbers[bug_to_update.pk] = revision_numbers.get(bug_to_update.pk, 1) + 1
+                BugRevision.of(new_description, bug=bug_to_update, number=revision_numbers[bug_to_update.pk], subject=bug_to_update.subject,
+                               modification_log=log, created_at=final_simulated_date).save()
+                latest_descriptions[bug_to_update.pk] = new_description
             else:
                 self.stdout.write(self.style.WARNING(f"Failed to update bug {bug_to_update.pk}"))
 
@@ -115,4 +122,7 @@ class Command(BaseCommand):
             if (i + 1) % 10 == 0: self.stdout.write(f"  Simulated {i+1}/{num_updates} updates...")
 
         self.stdout.write(self.style.SUCCESS(f"Simulated {update_count} updates, created {log_count} logs."))
+        # The logs above bypass persist_batch, so the dashboard rollup is recomputed in one pass
+        self.stdout.write(f"Rebuilt the daily modification rollup ({BugModificationDaily.rebuild()} rows).")
+        self.stdout.write(f"Rebuilt the search index ({search.rebuild(Bug, BugRevision)} bugs).") # Same for the updated descriptions
         self.stdout.write("Population complete.")
\ No newline at end of file
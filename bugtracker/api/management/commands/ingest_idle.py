@@ -0,0 +1,70 @@
+# api/management/commands/ingest_idle.py
+import imaplib
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import locks
+from api.imap_utils import connect_imap, idle_wait
+from api.models import DEFAULT_MAILBOX, Mailbox
+from api.tasks import RunBudget, sync_mailbox
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Long-running ingestion daemon: keeps one authenticated IMAP connection in IDLE and ingests new '
+            'UIDs as soon as the server reports EXISTS. Reconnects with exponential backoff. Each sync takes the '
+            'same lease as process_incoming_emails, so it never overlaps a polling run on the folder.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mailbox', default=DEFAULT_MAILBOX, help='Name of the Mailbox to watch (one daemon per mailbox).')
+        parser.add_argument('--folder', default='inbox', help='IMAP folder to watch.')
+        parser.add_argument('--batch-size', type=int, default=None, help='UID FETCH chunk size (default: IMAP_FETCH_BATCH_SIZE).')
+        parser.add_argument('--idle-timeout', type=float, default=None, help='Seconds before IDLE is re-issued (default: IMAP_IDLE_TIMEOUT; RFC 2177 asks for < 30 min).')
+        parser.add_argument('--backoff', type=float, default=1.0, help='Initial reconnect delay in seconds.')
+        parser.add_argument('--max-backoff', type=float, default=300.0, help='Reconnect delay ceiling in seconds.')
+        parser.add_argument('--max-cycles', type=int, default=None, help='Stop after this many IDLE cycles (for testing).')
+
+    def handle(self, *args, **options):
+        folder = options['folder']; mailbox = Mailbox.objects.get(name=options['mailbox'])
+        batch_size = options['batch_size'] or getattr(settings, 'IMAP_FETCH_BATCH_SIZE', 100)
+        idle_timeout = options['idle_timeout'] or getattr(settings, 'IMAP_IDLE_TIMEOUT', 29 * 60)
+        backoff = options['backoff']; max_cycles = options['max_cycles']
+        cycles = 0
+
+        self.stdout.write(f"Watching '{mailbox.name}/{folder}' with IMAP IDLE (re-issued every {idle_timeout:.0f}s)...")
+        while max_cycles is None or cycles < max_cycles:
+            mail = None
+            try:
+                mail = connect_imap(mailbox)
+                self._sync(mail, mailbox, folder, batch_size) # Catch up on anything that arrived while disconnected
+                backoff = options['backoff']
+                while max_cycles is None or cycles < max_cycles:
+                    cycles += 1
+                    if idle_wait(mail, idle_timeout):
+                        self._sync(mail, mailbox, folder, batch_size)
+                    else:
+                        mail.noop() # IDLE timed out quietly; keep the session alive and re-issue
+            except (imaplib.IMAP4.error, OSError) as conn_error:
+                cycles += 1
+                logger.warning(f"IMAP IDLE connection lost: {conn_error}. Reconnecting in {backoff:.1f}s.")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, options['max_backoff'])
+            finally:
+                if mail is not None:
+                    try: mail.logout()
+                    except Exception: pass
+        self.stdout.write("IDLE listener stopped.")
+
+    def _sync(self, mail, mailbox, folder, batch_size):
+        close_old_connections() # Long-lived process: drop DB connections past CONN_MAX_AGE or broken
+        budget = RunBudget()
+        with locks.lease(f'process_incoming_emails:{mailbox.name}:{folder}', on_lost=budget.cancel) as lease:
+            if not lease.acquired: # A polling run is syncing the folder; it picks up the new UIDs
+                logger.info(f"IDLE sync of '{mailbox.name}/{folder}' skipped: a polling run holds the lease ({lease.holder})."); return
+            processed, skipped = sync_mailbox(mail, folder, batch_size, budget=budget, mailbox=mailbox)
+        if processed or skipped:
+            logger.info(f"IDLE sync of '{mailbox.name}/{folder}': Processed: {processed}, Skipped: {skipped}.")
@@ -0,0 +1,90 @@
+# api/management/commands/load_ingest.py
+import logging
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from api.dedupe import reset_filter
+from api.fake_imap import FakeIMAPServer
+from api.loadgen import fill_mailbox
+from api.models import IngestionRun, MailboxSyncState, ProcessedEmail
+from api.tasks import process_incoming_emails
+
+class Command(BaseCommand):
+    help = ('Load-tests process_incoming_emails against the in-process fake IMAP server filled with synthetic bug emails. '
+            'Reports emails/sec, p50/p99 delivery-to-persist latency, DB queries per email and peak RSS. DB changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=1000, help='Number of emails to deliver.')
+        parser.add_argument('--update-ratio', type=float, default=0.5, help='Fraction of emails that update an existing bug.')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.05, help='Fraction of emails that re-send an earlier Message-ID.')
+        parser.add_argument('--attachment-kb', type=int, default=0, help='Attachment size for emails that carry one.')
+        parser.add_argument('--attachment-ratio', type=float, default=0.2, help='Fraction of emails with an attachment (needs --attachment-kb).')
+        parser.add_argument('--rate', type=float, default=0, help='Delivery rate in emails/sec while ingesting (0 = preload a backlog).')
+        parser.add_argument('--batch-size', type=int, default=100, help='UID FETCH chunk size.')
+        parser.add_argument('--latency-ms', type=float, default=1.0, help='Simulated per-command IMAP round-trip latency.')
+        parser.add_argument('--full-fetch', action='store_true', help='Download whole messages instead of header-first fetching.')
+        parser.add_argument('--seed', type=int, default=0, help='Workload seed.')
+        parser.add_argument('--timeout', type=float, default=600, help='Give up after this many seconds.')
+
+    def handle(self, *args, **options):
+        logging.getLogger('api').setLevel(logging.WARNING) # Per-message log lines would dominate the timings
+        rss_before = self._peak_rss_kib()
+        with FakeIMAPServer(latency=options['latency_ms'] / 1000.0) as server:
+            workload = dict(update_ratio=options['update_ratio'], duplicate_ratio=options['duplicate_ratio'], attachment_kb=options['attachment_kb'],
+                            attachment_ratio=options['attachment_ratio'], seed=options['seed'])
+            imap_settings = dict(IMAP_SERVER='127.0.0.1', IMAP_PORT=server.port, IMAP_USE_SSL=False, IMAP_USER=server.username,
+                                 IMAP_PASSWORD=server.password, IMAP_HEADER_FIRST=not options['full_fetch'], INGEST_PARTITIONS=1,
+                                 INGEST_MAX_MESSAGES=0, INGEST_MAX_SECONDS=0, INGEST_MAX_BYTES=0, # The loop below polls instead of re-enqueueing
+                                 DEDUPE_BLOOM_URL='', INGEST_LOCK_URL='') # In-process filter and lease: nothing reaches the shared Redis
+            reset_filter() # Built from this transaction's rows, and dropped with them
+            try:
+                with override_settings(**imap_settings), transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    MailboxSyncState.objects.all().delete()
+                    stats, delivery = fill_mailbox(server.mailbox, options['emails'], rate=options['rate'], **workload)
+                    start = time.time() # A preloaded backlog is generated before the clock starts
+                    run_start = timezone.now()
+                    runs = self._drain(server, delivery, options)
+                    elapsed = time.time() - start
+                    stage_seconds = {}
+                    for run_stages in IngestionRun.objects.filter(started_at__gte=run_start).values_list('stage_seconds', flat=True):
+                        for stage, seconds in run_stages.items(): stage_seconds[stage] = stage_seconds.get(stage, 0) + seconds
+                    hashes = {ProcessedEmail.hash_message_id(message_id): message_id for message_id in stats.delivered_at}
+                    processed_at = {hashes[bytes(digest)]: at for digest, at in ProcessedEmail.objects.filter(message_hash__in=list(hashes)).values_list('message_hash', 'processed_at')}
+                    query_count = len(queries)
+                    transaction.set_rollback(True) # Leave the database untouched
+            finally:
+                reset_filter()
+
+        latencies = sorted(processed_at[mid].timestamp() - delivered for mid, delivered in stats.delivered_at.items() if mid in processed_at)
+        self.stdout.write(f"Workload: {stats.emails} emails ({stats.new_bugs} new bugs, {stats.updates} updates, {stats.duplicates} duplicates, "
+                          f"{stats.attachments} with attachments), {runs} ingestion runs")
+        self.stdout.write(f"  throughput      {stats.emails / elapsed:10.1f} emails/sec ({elapsed:.2f}s)")
+        if latencies:
+            self.stdout.write(f"  latency p50     {self._percentile(latencies, 50) * 1000:10.1f} ms (delivery to persisted)")
+            self.stdout.write(f"  latency p99     {self._percentile(latencies, 99) * 1000:10.1f} ms")
+        self.stdout.write(f"  DB queries      {query_count / max(stats.emails, 1):10.2f} per email")
+        self.stdout.write(f"  stage seconds   {', '.join(f'{stage} {seconds:.2f}' for stage, seconds in sorted(stage_seconds.items(), key=lambda item: -item[1]))}")
+        self.stdout.write(f"  IMAP commands   {server.command_count:10d} ({server.bytes_sent / 1024:.0f} KiB fetched)")
+        self.stdout.write(f"  peak RSS        {self._peak_rss_kib() / 1024:10.1f} MiB (was {rss_before / 1024:.1f} MiB before the run)")
+
+    def _drain(self, server, delivery, options):
+        """ Polls until delivery is finished and every message is flagged Seen. Returns the number of runs. """
+        deadline = time.monotonic() + options['timeout']; runs = 0
+        while time.monotonic() < deadline:
+            process_incoming_emails(batch_size=options['batch_size']); runs += 1
+            delivered = delivery is None or not delivery.is_alive()
+            if delivered and all('\\Seen' in msg.flags for msg in server.mailbox.folder('inbox')['messages']): return runs
+            if delivery is not None: time.sleep(0.05) # Poll interval while mail is still arriving
+        self.stderr.write("Timed out before the mailbox was drained.")
+        return runs
+
+    def _percentile(self, ordered, pct):
+        return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+    def _peak_rss_kib(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KiB on Linux
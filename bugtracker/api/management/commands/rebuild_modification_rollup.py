@@ -0,0 +1,27 @@
+# api/management/commands/rebuild_modification_rollup.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import BugModificationDaily
+
+class Command(BaseCommand):
+    help = ('Recomputes the BugModificationDaily rollup (modifications per day and priority, read by the dashboard) from '
+            'BugModificationLog. Use it to backfill, or after bulk changes that bypass persist_batch and Bug.save '
+            '(QuerySet.update of priorities, bulk deletes, raw SQL).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report days whose stored counts differ from the logs.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stored = dict(((date, priority), count) for date, priority, count in BugModificationDaily.objects.filter(count__gt=0).values_list('date', 'priority', 'count'))
+            expected = {(date, priority): count for date, priority, count in BugModificationDaily.totals_from_logs()}
+            drift = sorted(key for key in stored.keys() | expected.keys() if stored.get(key, 0) != expected.get(key, 0))
+            for date, priority in drift:
+                self.stdout.write(f"  {date} {priority}: stored {stored.get((date, priority), 0)}, logged {expected.get((date, priority), 0)}")
+            self.stdout.write(self.style.WARNING(f"{len(drift)} rollup rows differ from the logs.") if drift else self.style.SUCCESS("Rollup matches the logs."))
+            return
+        started = time.perf_counter()
+        rows = BugModificationDaily.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows in {time.perf_counter() - started:.2f}s."))
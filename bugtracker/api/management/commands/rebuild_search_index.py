@@ -0,0 +1,23 @@
+# api/management/commands/rebuild_search_index.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import search
+from api.models import Bug, BugRevision
+
+class Command(BaseCommand):
+    help = ('Rewrites the bug full-text search index (FTS5 on SQLite, tsvector on PostgreSQL) from the bugs and their latest '
+            'revisions. Use it to backfill, or after changes that bypass persist_batch and Bug.save (QuerySet.update, raw SQL).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Bugs read and indexed per query.')
+
+    def handle(self, *args, **options):
+        backend = search.index_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING("This database has no full-text index; nothing to rebuild.")); return
+        started = time.perf_counter()
+        with transaction.atomic(): documents = search.rebuild(Bug, BugRevision, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {documents} bugs ({backend.name}) in {time.perf_counter() - started:.2f}s."))
@@ -0,0 +1,201 @@
+# api/metrics.py
+"""
+Ingestion metrics: per-stage latency histograms, outcome and skip-reason counters.
+
+Each ingestion run collects into its own RunMetrics, held in a context variable,
+so the instrumentation points in tasks.py need no extra arguments and cost a
+dict update when no run is collecting. When the run ends, record_run() writes
+an IngestionRun summary row and adds the run's series to the cumulative
+IngestionMetric totals. Celery workers and the web server are separate
+processes, so the /metrics endpoint serves those totals from the database, in
+the Prometheus text format.
+"""
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import IngestionMetric, IngestionRun, MailboxSyncState
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+# Metric family -> (Prometheus type, help text)
+FAMILIES = {
+    'bugtracker_ingest_runs_total': ('counter', 'Ingestion runs recorded.'),
+    'bugtracker_ingest_emails_total': ('counter', 'Emails handled by ingestion, by outcome (processed, duplicate, skipped, failed).'),
+    'bugtracker_ingest_skipped_total': ('counter', 'Emails that did not become a bug update, by reason.'),
+    'bugtracker_ingest_fetched_bytes_total': ('counter', 'Message bytes downloaded from IMAP.'),
+    'bugtracker_ingest_stripped_chars_total': ('counter', 'Quoted history and signature characters dropped from email bodies before storing.'),
+    'bugtracker_ingest_dead_lettered_total': ('counter', 'Failed emails parked in the dead-letter queue.'),
+    'bugtracker_ingest_dead_letter_retries_total': ('counter', 'Dead-letter retry attempts, by result (resolved, retry, exhausted, discarded).'),
+    'bugtracker_ingest_lock_contended_total': ('counter', 'Ingestion runs that exited because another run held the ingestion lease.'),
+    'bugtracker_ingest_stage_seconds': ('histogram', 'Duration of each ingestion stage call (lock, login, select, search, fetch, parse, dedupe, persist, store).'),
+    'bugtracker_ingest_run_seconds': ('histogram', 'Wall time of an ingestion run.'),
+}
+STAGE_SECONDS = 'bugtracker_ingest_stage_seconds'
+EMAILS = 'bugtracker_ingest_emails_total'
+SKIPPED = 'bugtracker_ingest_skipped_total'
+
+
+def series_key(name, labels):
+    """ Prometheus series name, e.g. bugtracker_ingest_skipped_total{reason="no_body"}. """
+    if not labels: return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class RunMetrics:
+    """ Counters and histograms of one ingestion run (or one fan-out persist task). """
+    def __init__(self, counters=None, histograms=None, started_at=None):
+        self.counters = Counter(counters or {}) # series key -> value
+        self.histograms = {key: list(values) for key, values in (histograms or {}).items()} # series key -> bucket counts + [sum, count]
+        self.started_at = started_at or timezone.now()
+
+    def inc(self, name, amount=1, **labels):
+        self.counters[series_key(name, labels)] += amount
+
+    def observe(self, name, value, **labels):
+        key = series_key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None: histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+        histogram[bisect_left(LATENCY_BUCKETS, value)] += 1 # Non-cumulative here; cumulated when flushed
+        histogram[-2] += value; histogram[-1] += 1
+
+    def count(self, name, **labels):
+        return int(self.counters.get(series_key(name, labels), 0))
+
+    def stage_seconds(self):
+        """ {stage: total seconds} for the run summary. """
+        prefix = STAGE_SECONDS + '{stage="'
+        return {key[len(prefix):-2]: round(values[-2], 6) for key, values in self.histograms.items() if key.startswith(prefix)}
+
+    def label_counts(self, name, label):
+        prefix = f'{name}{{{label}="'
+        return {key[len(prefix):-2]: int(value) for key, value in self.counters.items() if key.startswith(prefix)}
+
+    def to_dict(self):
+        """ JSON-serialisable form, for handing a run to the fan-out callback. """
+        return {'counters': dict(self.counters), 'histograms': self.histograms, 'started_at': self.started_at.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(data.get('counters'), data.get('histograms'), parse_datetime(data['started_at']) if data.get('started_at') else None)
+
+    def series(self):
+        """ {series key: value} in exposition form (histograms as cumulative _bucket, _sum and _count series). """
+        values = dict(self.counters)
+        for key, histogram in self.histograms.items():
+            name, _, labels = key.partition('{'); labels = labels[:-1]
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                values[f'{name}_bucket{{{labels + "," if labels else ""}le="{le}"}}'] = cumulative
+            values[f'{name}_sum' + (f'{{{labels}}}' if labels else '')] = histogram[-2]
+            values[f'{name}_count' + (f'{{{labels}}}' if labels else '')] = histogram[-1]
+        return values
+
+
+# --- Instrumentation Points ---
+_current = ContextVar('ingest_metrics', default=None)
+
+@contextmanager
+def collect(run=None):
+    """ Makes `run` (a new RunMetrics by default) the collector for the enclosed code. """
+    run = run or RunMetrics()
+    token = _current.set(run)
+    try: yield run
+    finally: _current.reset(token)
+
+def current():
+    return _current.get()
+
+def inc(name, amount=1, **labels):
+    run = _current.get()
+    if run is not None: run.inc(name, amount, **labels)
+
+def skip(reason):
+    """ Counts an email that will not become a bug update (no_message_id, no_bug_id, no_body, ...). """
+    inc(SKIPPED, reason=reason)
+
+def count_outcomes(outcomes=(), **extra):
+    """ Counts persist outcomes plus `extra` counts by outcome name (e.g. duplicate=3); duplicates are also a skip reason. """
+    run = _current.get()
+    if run is None: return
+    for outcome, count in (Counter(outcomes) + Counter(extra)).items():
+        run.inc(EMAILS, count, outcome=outcome)
+        if outcome == 'duplicate': run.inc(SKIPPED, count, reason='duplicate')
+
+@contextmanager
+def stage(name):
+    """ Times the enclosed block into bugtracker_ingest_stage_seconds{stage=name}. """
+    run = _current.get()
+    if run is None: yield; return
+    started = time.perf_counter()
+    try: yield
+    finally: run.observe(STAGE_SECONDS, time.perf_counter() - started, stage=name)
+# --- END Instrumentation Points ---
+
+
+def flush_totals(run):
+    """ Adds a run's series to the cumulative IngestionMetric rows (a fixed number of queries per run). """
+    deltas = run.series() # Zero-count buckets included: every histogram exposes its full bucket set
+    if not deltas: return
+    with transaction.atomic():
+        IngestionMetric.objects.bulk_create([IngestionMetric(series=key) for key in deltas], ignore_conflicts=True)
+        rows = list(IngestionMetric.objects.select_for_update().filter(series__in=list(deltas)))
+        for row in rows: row.value += deltas[row.series]
+        IngestionMetric.objects.bulk_update(rows, ['value'])
+
+def record_run(run, stopped_early=False, error='', mailbox='', folder=''):
+    """ Persists the IngestionRun summary of a finished run and flushes its series to the totals. Returns the row. """
+    finished_at = timezone.now()
+    duration = (finished_at - run.started_at).total_seconds()
+    run.inc('bugtracker_ingest_runs_total'); run.observe('bugtracker_ingest_run_seconds', duration)
+    outcomes = run.label_counts(EMAILS, 'outcome')
+    summary = IngestionRun.objects.create(
+        started_at=run.started_at, mailbox=mailbox, folder=folder, duration_seconds=duration, processed=outcomes.get('processed', 0), duplicates=outcomes.get('duplicate', 0),
+        skipped=outcomes.get('skipped', 0), failed=outcomes.get('failed', 0), bytes_fetched=run.count('bugtracker_ingest_fetched_bytes_total'),
+        stage_seconds=run.stage_seconds(), skip_reasons=run.label_counts(SKIPPED, 'reason'), stopped_early=stopped_early, error=error[:1000],
+    )
+    flush_totals(run)
+    return summary
+
+
+def _exposition_order(series):
+    """ Sorts histogram buckets by numeric le, everything else by name. """
+    name, _, labels = series.partition('{')
+    le = labels.rsplit('le="', 1)[1][:-2] if 'le="' in labels else None
+    return (name.rsplit('_bucket', 1)[0], labels.split('le="')[0], float(le) if le else 0.0, series)
+
+def render_prometheus():
+    """ The cumulative ingestion metrics in Prometheus text exposition format (version 0.0.4). """
+    totals = dict(IngestionMetric.objects.values_list('series', 'value'))
+    by_family = {}
+    for series, value in totals.items():
+        name = series.partition('{')[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES: name = name[:-len(suffix)]
+        by_family.setdefault(name, []).append((series, value))
+    lines = []
+    for family, (kind, help_text) in FAMILIES.items():
+        lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+        for series, value in sorted(by_family.get(family, []), key=lambda item: _exposition_order(item[0])):
+            lines.append(f"{series} {int(value) if float(value).is_integer() else repr(value)}")
+    last_run = IngestionRun.objects.order_by('-started_at').values_list('started_at', 'duration_seconds').first()
+    if last_run:
+        lines += ["# HELP bugtracker_ingest_last_run_timestamp_seconds End time of the most recent ingestion run.",
+                  "# TYPE bugtracker_ingest_last_run_timestamp_seconds gauge",
+                  f"bugtracker_ingest_last_run_timestamp_seconds {last_run[0].timestamp() + last_run[1]:.3f}"]
+    intervals = MailboxSyncState.objects.order_by('mailbox__name', 'folder').values_list('mailbox__name', 'folder', 'poll_interval_seconds')
+    if intervals:
+        lines += ["# HELP bugtracker_ingest_poll_interval_seconds Current adaptive poll interval per mailbox folder.",
+                  "# TYPE bugtracker_ingest_poll_interval_seconds gauge"]
+        lines += [f'{series_key("bugtracker_ingest_poll_interval_seconds", {"mailbox": mailbox, "folder": folder})} {interval:g}' for mailbox, folder, interval in intervals]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_delete_emaillog_alter_bug_bug_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailboxSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "folder",
+                    models.CharField(
+                        help_text="IMAP folder name (e.g. inbox)",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "uid_validity",
+                    models.BigIntegerField(
+                        blank=True,
+                        help_text="UIDVALIDITY seen at the last sync; a change forces a full resync",
+                        null=True,
+                    ),
+                ),
+                (
+                    "last_uid",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Highest UID processed; the next sync fetches UID last_uid+1:*",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Mailbox Sync State",
+                "verbose_name_plural": "Mailbox Sync States",
+                "ordering": ["folder"],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_mailboxsyncstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="fanout_started_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Set while a fan-out ingestion chord is in flight for this folder",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_message_ids(apps, schema_editor):
+    ProcessedEmail = apps.get_model("api", "ProcessedEmail")
+    batch = []
+    for record in ProcessedEmail.objects.only("pk", "message_id").iterator(chunk_size=10000):
+        record.message_hash = hashlib.blake2b(record.message_id.encode("utf-8", "surrogateescape"), digest_size=16).digest()
+        batch.append(record)
+        if len(batch) == 10000:
+            ProcessedEmail.objects.bulk_update(batch, ["message_hash"]); batch = []
+    ProcessedEmail.objects.bulk_update(batch, ["message_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_mailboxsyncstate_fanout_started_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processedemail",
+            name="message_hash",
+            field=models.BinaryField(max_length=16, null=True),
+        ),
+        migrations.RunPython(hash_message_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="processedemail",
+            name="message_hash",
+            field=models.BinaryField(
+                help_text="BLAKE2b-128 digest of the Message-ID header",
+                max_length=16,
+                unique=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="processedemail",
+            name="message_id",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Raw Message-ID header (not indexed; empty when DEDUPE_STORE_MESSAGE_ID is off)",
+                max_length=500,
+            ),
+        ),
+    ]
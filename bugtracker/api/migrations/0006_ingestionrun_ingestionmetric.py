@@ -0,0 +1,89 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_processedemail_message_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "series",
+                    models.CharField(
+                        help_text='e.g. bugtracker_ingest_skipped_total{reason="no_body"}',
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                ("value", models.FloatField(default=0)),
+            ],
+            options={
+                "ordering": ["series"],
+            },
+        ),
+        migrations.CreateModel(
+            name="IngestionRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField(db_index=True)),
+                ("duration_seconds", models.FloatField(default=0)),
+                ("processed", models.IntegerField(default=0)),
+                ("duplicates", models.IntegerField(default=0)),
+                ("skipped", models.IntegerField(default=0)),
+                ("failed", models.IntegerField(default=0)),
+                (
+                    "bytes_fetched",
+                    models.BigIntegerField(
+                        default=0, help_text="Message bytes downloaded from IMAP"
+                    ),
+                ),
+                (
+                    "stage_seconds",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Seconds spent per stage (login, select, search, fetch, parse, dedupe, persist, store)",
+                    ),
+                ),
+                (
+                    "skip_reasons",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Emails not ingested, by reason (no_message_id, no_bug_id, no_body, duplicate)",
+                    ),
+                ),
+                (
+                    "stopped_early",
+                    models.BooleanField(
+                        default=False, help_text="The run budget ran out with UIDs left"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_ingestionrun_ingestionmetric"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeadLetterEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("folder", models.CharField(max_length=255)),
+                (
+                    "uid_validity",
+                    models.BigIntegerField(
+                        blank=True,
+                        help_text="UIDVALIDITY the UID belongs to",
+                        null=True,
+                    ),
+                ),
+                ("uid", models.BigIntegerField()),
+                (
+                    "message_id",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Message-ID, if the headers could be read",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("fetch", "Fetch"),
+                            ("parse", "Parse"),
+                            ("persist", "Persist"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+                ("attempts", models.IntegerField(default=1)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("resolved", "Resolved"),
+                            ("exhausted", "Exhausted"),
+                            ("discarded", "Discarded"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When the retry task may try again (exponential backoff)",
+                        null=True,
+                    ),
+                ),
+                ("first_failed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "last_failed_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Dead-Letter Email",
+                "verbose_name_plural": "Dead-Letter Emails",
+                "ordering": ["-last_failed_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="api_deadlet_status_39dc12_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("folder", "uid_validity", "uid"),
+                        name="unique_dead_letter_uid",
+                    )
+                ],
+            },
+        ),
+    ]
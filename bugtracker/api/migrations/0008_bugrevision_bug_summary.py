@@ -0,0 +1,92 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_deadletteremail"),
+    ]
+
+    # Schema only: 0009 copies the descriptions into BugRevision and 0010 drops Bug.description, each in its own
+    # transaction (on PostgreSQL the deferred FK checks of the copy would block the ALTER TABLE), so the copied
+    # revisions can be checked before the source column is gone.
+    operations = [
+        migrations.AddField(
+            model_name="bug",
+            name="summary",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Start of the current description; full texts are kept in BugRevision",
+                max_length=300,
+            ),
+        ),
+        migrations.CreateModel(
+            name="BugRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "number",
+                    models.PositiveIntegerField(
+                        help_text="1 for the creating email, then one per update"
+                    ),
+                ),
+                (
+                    "subject",
+                    models.CharField(
+                        help_text="Subject line of the email that produced this revision",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(help_text="zlib-compressed UTF-8 description"),
+                ),
+                (
+                    "size",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Uncompressed size in bytes"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "bug",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="api.bug",
+                    ),
+                ),
+                (
+                    "modification_log",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="revision",
+                        to="api.bugmodificationlog",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["bug", "-number"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("bug", "number"), name="unique_bug_revision_number"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:54
+
+import zlib
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def move_descriptions_to_revisions(apps, schema_editor):
+    """ Each bug's current description becomes its latest revision (numbered after its updates, linked to the last one). """
+    Bug = apps.get_model("api", "Bug")
+    BugModificationLog = apps.get_model("api", "BugModificationLog")
+    BugRevision = apps.get_model("api", "BugRevision")
+    last_log = BugModificationLog.objects.filter(bug=OuterRef("pk")).order_by("-modified_at", "-pk").values("pk")[:1]
+    bugs = Bug.objects.annotate(last_log=Subquery(last_log)).order_by("pk").values_list("pk", "subject", "description", "modified_count", "updated_at", "last_log")
+    last_pk = 0
+    while True:
+        chunk = list(bugs.filter(pk__gt=last_pk)[:2000])
+        if not chunk: break
+        revisions = []; summaries = []
+        for pk, subject, description, modified_count, updated_at, log_pk in chunk:
+            raw = (description or "").encode("utf-8", "surrogateescape")
+            revisions.append(BugRevision(bug_id=pk, number=modified_count + 1, subject=subject, data=zlib.compress(raw, 6), size=len(raw), created_at=updated_at, modification_log_id=log_pk))
+            text = " ".join((description or "").split())
+            summaries.append(Bug(pk=pk, summary=text if len(text) <= 300 else text[:299] + "\u2026"))
+        BugRevision.objects.bulk_create(revisions); Bug.objects.bulk_update(summaries, ["summary"])
+        last_pk = chunk[-1][0]
+
+
+def restore_descriptions(apps, schema_editor):
+    """ Reverse: each bug's description is its latest revision again (0010 re-adds the column empty). """
+    Bug = apps.get_model("api", "Bug")
+    BugRevision = apps.get_model("api", "BugRevision")
+    for bug_pk in Bug.objects.order_by().values_list("pk", flat=True).iterator():
+        latest = BugRevision.objects.filter(bug_id=bug_pk).order_by("-number").values_list("data", flat=True).first()
+        if latest is not None:
+            Bug.objects.filter(pk=bug_pk).update(description=zlib.decompress(bytes(latest)).decode("utf-8", "surrogateescape"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_bugrevision_bug_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(move_descriptions_to_revisions, restore_descriptions),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_move_descriptions_to_revisions"),
+    ]
+
+    # The default only lets the reverse re-add the column to existing rows; 0009's reverse then fills it.
+    operations = [
+        migrations.AlterField(
+            model_name="bug",
+            name="description",
+            field=models.TextField(default="", help_text="Email body content"),
+        ),
+        migrations.RemoveField(
+            model_name="bug",
+            name="description",
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_remove_bug_description"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="next_poll_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When schedule_mailbox_polls next enqueues a poll of this folder",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="poll_interval_seconds",
+            field=models.FloatField(
+                default=0,
+                help_text="Current adaptive poll interval (see api/polling.py)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="poll_max_seconds",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Longest poll interval, reached by backing off while idle (empty: INGEST_POLL_MAX_SECONDS)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="poll_min_seconds",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Shortest poll interval, used while mail keeps arriving (empty: INGEST_POLL_MIN_SECONDS)",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,187 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_default_mailbox(apps, schema_editor):
+    """ Existing sync states and dead letters belong to the IMAP_* settings account, now the 'default' mailbox. """
+    mailbox, _ = apps.get_model("api", "Mailbox").objects.get_or_create(name="default")
+    for model_name in ("MailboxSyncState", "DeadLetterEmail"):
+        apps.get_model("api", model_name).objects.filter(mailbox__isnull=True).update(mailbox=mailbox)
+
+
+def mailbox_field(related_name, **options):
+    return models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name=related_name, to="api.mailbox", **options)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_mailboxsyncstate_adaptive_poll"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Mailbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.SlugField(
+                        help_text="Short name, used in task arguments, lease keys and metrics",
+                        max_length=100,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "server",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="IMAP host (empty: IMAP_SERVER)",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "port",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Empty: IMAP_PORT", null=True
+                    ),
+                ),
+                (
+                    "use_ssl",
+                    models.BooleanField(
+                        blank=True, help_text="Empty: IMAP_USE_SSL", null=True
+                    ),
+                ),
+                (
+                    "username",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Empty: IMAP_USER",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "password",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Empty: IMAP_PASSWORD (only used together with the server and username of this row)",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "folders",
+                    models.CharField(
+                        default="inbox",
+                        help_text="Comma-separated IMAP folders to ingest",
+                        max_length=1000,
+                    ),
+                ),
+                (
+                    "enabled",
+                    models.BooleanField(
+                        default=True,
+                        help_text="Disabled mailboxes are not polled and their dead letters are not retried",
+                    ),
+                ),
+                (
+                    "max_messages_per_run",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Emails per run (empty: INGEST_MAX_MESSAGES)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "max_seconds_per_run",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Seconds per run (empty: INGEST_MAX_SECONDS)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "max_bytes_per_run",
+                    models.PositiveBigIntegerField(
+                        blank=True,
+                        help_text="Bytes downloaded per run (empty: INGEST_MAX_BYTES)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "poll_min_seconds",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Shortest poll interval of its folders (empty: INGEST_POLL_MIN_SECONDS)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "poll_max_seconds",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Longest poll interval of its folders (empty: INGEST_POLL_MAX_SECONDS)",
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Mailbox",
+                "verbose_name_plural": "Mailboxes",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="mailboxsyncstate",
+            options={
+                "ordering": ["mailbox", "folder"],
+                "verbose_name": "Mailbox Sync State",
+                "verbose_name_plural": "Mailbox Sync States",
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name="deadletteremail",
+            name="unique_dead_letter_uid",
+        ),
+        migrations.AddField(
+            model_name="ingestionrun",
+            name="folder",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="ingestionrun",
+            name="mailbox",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Mailbox name (empty for pushed emails)",
+                max_length=100,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="mailboxsyncstate",
+            name="folder",
+            field=models.CharField(
+                help_text="IMAP folder name (e.g. inbox)", max_length=255
+            ),
+        ),
+        # Nullable and filled here; 0013_mailbox_required makes them NOT NULL in its own transaction, since on
+        # PostgreSQL the deferred FK checks of this UPDATE block any later ALTER TABLE in the same one.
+        migrations.AddField(model_name="deadletteremail", name="mailbox", field=mailbox_field("dead_letters", null=True)),
+        migrations.AddField(model_name="mailboxsyncstate", name="mailbox", field=mailbox_field("sync_states", null=True)),
+        migrations.RunPython(assign_default_mailbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:05
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mailbox_field(related_name, **options):
+    return models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name=related_name, to="api.mailbox", **options)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_mailbox"),
+    ]
+
+    operations = [
+        # The model default (api.models.default_mailbox) queries the live Mailbox model, so it is only added to the state.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(model_name="deadletteremail", name="mailbox", field=mailbox_field("dead_letters")),
+                migrations.AlterField(model_name="mailboxsyncstate", name="mailbox", field=mailbox_field("sync_states")),
+            ],
+            state_operations=[
+                migrations.AlterField(model_name="deadletteremail", name="mailbox", field=mailbox_field("dead_letters", default=api.models.default_mailbox)),
+                migrations.AlterField(model_name="mailboxsyncstate", name="mailbox", field=mailbox_field("sync_states", default=api.models.default_mailbox)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="deadletteremail",
+            constraint=models.UniqueConstraint(
+                fields=("mailbox", "folder", "uid_validity", "uid"),
+                name="unique_dead_letter_uid",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="mailboxsyncstate",
+            constraint=models.UniqueConstraint(
+                fields=("mailbox", "folder"), name="unique_mailbox_folder"
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:10
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    """ Counts the existing modification logs per day and current bug priority. """
+    BugModificationLog = apps.get_model("api", "BugModificationLog")
+    BugModificationDaily = apps.get_model("api", "BugModificationDaily")
+    totals = (BugModificationLog.objects.order_by().annotate(date=TruncDate("modified_at")).values("date", "bug__priority")
+              .annotate(count=Count("id")).values_list("date", "bug__priority", "count"))
+    BugModificationDaily.objects.bulk_create([BugModificationDaily(date=date, priority=priority, count=count) for date, priority, count in totals], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_mailbox_required"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BugModificationDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date",
+                    models.DateField(help_text="Day of the modifications (TIME_ZONE)"),
+                ),
+                (
+                    "priority",
+                    models.CharField(
+                        choices=[
+                            ("low", "Low"),
+                            ("medium", "Medium"),
+                            ("high", "High"),
+                        ],
+                        help_text="Current priority of the modified bugs",
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Daily Modification Count",
+                "verbose_name_plural": "Daily Modification Counts",
+                "ordering": ["date", "priority"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "priority"),
+                        name="unique_modification_day_priority",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+import zlib
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# The index as this migration creates it; later changes to api/search.py need their own migration.
+CREATE_SQL = {
+    'sqlite': ["CREATE VIRTUAL TABLE IF NOT EXISTS api_bug_fts USING fts5(bug_id, subject, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+               "CREATE TRIGGER IF NOT EXISTS api_bug_fts_bug_delete AFTER DELETE ON api_bug BEGIN DELETE FROM api_bug_fts WHERE rowid = old.id; END"],
+    'postgresql': ["CREATE TABLE IF NOT EXISTS api_bug_search (bug_id bigint PRIMARY KEY REFERENCES api_bug (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)",
+                   "CREATE INDEX IF NOT EXISTS api_bug_search_document ON api_bug_search USING GIN (document)"],
+}
+INSERT_SQL = {
+    'sqlite': "INSERT INTO api_bug_fts (rowid, bug_id, subject, description) VALUES (%s, %s, %s, %s)",
+    'postgresql': ("INSERT INTO api_bug_search (bug_id, document) VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || "
+                   "setweight(to_tsvector('english', %s), 'B') || setweight(to_tsvector('english', %s), 'C'))"),
+}
+DROP_SQL = {
+    'sqlite': ["DROP TRIGGER IF EXISTS api_bug_fts_bug_delete", "DROP TABLE IF EXISTS api_bug_fts"],
+    'postgresql': ["DROP TABLE IF EXISTS api_bug_search"],
+}
+
+
+def create_search_index(apps, schema_editor):
+    """ Creates the full-text index of this database (FTS5 table or tsvector table) and fills it from the existing bugs. """
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL: return # Searches keep using SearchFilter
+    Bug = apps.get_model("api", "Bug"); BugRevision = apps.get_model("api", "BugRevision")
+    latest = BugRevision.objects.filter(bug=OuterRef('pk')).order_by('-number').values('data')[:1]
+    bugs = Bug.objects.order_by('pk').annotate(latest_data=Subquery(latest)).values_list('pk', 'bug_id', 'subject', 'latest_data')
+    with schema_editor.connection.cursor() as cursor:
+        for statement in CREATE_SQL[vendor]: cursor.execute(statement)
+        last_pk = 0
+        while True:
+            batch = list(bugs.filter(pk__gt=last_pk)[:2000])
+            if not batch: break
+            cursor.executemany(INSERT_SQL[vendor], [(pk, bug_id, subject, zlib.decompress(bytes(data)).decode('utf-8', 'surrogateescape') if data else '') for pk, bug_id, subject, data in batch])
+            last_pk = batch[-1][0]
+
+
+def drop_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_SQL.get(schema_editor.connection.vendor, []): cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_bugmodificationdaily"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_bug_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bug",
+            index=models.Index(fields=["created_at", "id"], name="bug_created_keyset"),
+        ),
+    ]
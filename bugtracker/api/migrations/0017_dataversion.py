@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:11
+
+import time
+
+from django.db import migrations, models
+
+
+def seed_data_version(apps, schema_editor):
+    """ The single row api/caching.py reads and bumps, so reads never have to create it. """
+    apps.get_model("api", "DataVersion").objects.get_or_create(pk=1, defaults={"version": int(time.time() * 1000)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_bug_created_keyset_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "version",
+                    models.BigIntegerField(
+                        help_text="Millisecond time of the last committed write"
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(seed_data_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0017_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailboxsyncstate",
+            name="resync_since",
+            field=models.DateField(
+                blank=True,
+                help_text="Set during a resync after a UIDVALIDITY change: only mail received since this day is fetched, older dedupe records may be pruned",
+                null=True,
+            ),
+        ),
+    ]
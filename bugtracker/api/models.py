@@ -1,22 +1,79 @@
 # api/models.py
-from django.db import models
+import hashlib
+import zlib
+from collections import Counter
+
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.db.models import F
+from django.db.models import Count, F, Max
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.db.models.functions import TruncDate
+
+from .caching import on_commit_bump
+from .search import index_documents
 
 class Bug(models.Model):
     class Status(models.TextChoices): OPEN = 'open', _('Open'); IN_PROGRESS = 'in_progress', _('In Progress'); RESOLVED = 'resolved', _('Resolved'); CLOSED = 'closed', _('Closed')
     class Priority(models.TextChoices): LOW = 'low', _('Low'); MEDIUM = 'medium', _('Medium'); HIGH = 'high', _('High')
     bug_id = models.CharField(max_length=100, unique=True, db_index=True, help_text="Unique identifier (e.g., BUG-1234)")
     subject = models.CharField(max_length=255, help_text="Full subject line")
-    description = models.TextField(help_text="Email body content")
+    summary = models.CharField(max_length=300, blank=True, default='', help_text="Start of the current description; full texts are kept in BugRevision")
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.OPEN)
     priority = models.CharField(max_length=20, choices=Priority.choices, default=Priority.MEDIUM)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     modified_count = models.IntegerField(default=0, help_text="Incremented on email updates")
+    SUMMARY_LENGTH = 300
+    @classmethod
+    def summarize(cls, text):
+        """ The summary column for a description: whitespace collapsed, cut to SUMMARY_LENGTH. """
+        text = ' '.join((text or '').split())
+        return text if len(text) <= cls.SUMMARY_LENGTH else text[:cls.SUMMARY_LENGTH - 1] + '\u2026'
+    @property
+    def description(self):
+        """ Full current description, decompressed from the latest revision on first access. """
+        if '_description' not in self.__dict__:
+            latest = self.revisions.order_by('-number').only('data').first() if self.pk else None
+            self._description = latest.text if latest else ''
+        return self._description
+    @description.setter
+    def description(self, text):
+        """ Sets the summary now; the full text becomes a new revision on the next save(). """
+        self._description = text; self._description_changed = True; self.summary = self.summarize(text)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        bug = super().from_db(db, field_names, values)
+        if 'priority' in field_names: bug._saved_priority = bug.priority # Tells save() to move the bug's rollup counts on a priority change
+        return bug
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        record = self.__dict__.get('_description_changed') and (update_fields is None or 'summary' in update_fields)
+        saved_priority = self.__dict__.get('_saved_priority')
+        moved = saved_priority not in (None, self.priority) and (update_fields is None or 'priority' in update_fields)
+        if self._state.adding: on_commit_bump() # A new bug changes list counts (api/pagination.py)
+        if moved:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                BugModificationDaily.apply(BugModificationDaily.move_deltas({self.pk: (saved_priority, self.priority)}))
+                on_commit_bump()
+        else:
+            super().save(*args, **kwargs)
+        self._saved_priority = self.priority
+        if record:
+            self._description_changed = False
+            number = (self.revisions.aggregate(number=Max('number'))['number'] or 0) + 1
+            BugRevision.of(self._description, bug=self, number=number, subject=self.subject).save()
+        if record or update_fields is None or 'subject' in update_fields: index_documents([(self.pk, self.bug_id, self.subject, self.description)]) # Search document (api/search.py)
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('_description', None); self.__dict__.pop('_description_changed', None)
+        if 'priority' in self.__dict__: self._saved_priority = self.priority
     def __str__(self): return f"{self.bug_id}: {self.subject}"
-    class Meta: ordering = ['-created_at']
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at', 'id'], name='bug_created_keyset')] # Keyset pages of the bug list (api/pagination.py)
 
 class BugModificationLog(models.Model):
     bug = models.ForeignKey(Bug, on_delete=models.CASCADE, related_name='modification_logs')
@@ -24,8 +81,191 @@ class BugModificationLog(models.Model):
     def __str__(self): return f"Mod for {self.bug.bug_id} at {self.modified_at}"
     class Meta: ordering = ['-modified_at']
 
+class BugModificationDaily(models.Model):
+    """
+    Modification logs per day and current priority of their bug: the dashboard series, read instead of
+    grouping BugModificationLog. Kept in step in the transactions that write logs (persistence.persist_batch),
+    change a bug's priority (Bug.save) or delete bugs or logs (the pre_delete handlers below). Writes that
+    bypass all of them (QuerySet.update, raw SQL) need `manage.py rebuild_modification_rollup`.
+    """
+    date = models.DateField(help_text="Day of the modifications (TIME_ZONE)")
+    priority = models.CharField(max_length=20, choices=Bug.Priority.choices, help_text="Current priority of the modified bugs")
+    count = models.IntegerField(default=0)
+    @staticmethod
+    def day(moment): return timezone.localdate(moment) # The day TruncDate('modified_at') gives
+    @classmethod
+    def apply(cls, deltas):
+        """ Adds {(date, priority): change} to the counts (changes may be negative); three queries for any number of keys. """
+        deltas = {key: change for key, change in deltas.items() if change}
+        if not deltas: return
+        cls.objects.bulk_create([cls(date=date, priority=priority) for date, priority in deltas], ignore_conflicts=True)
+        rows = [row for row in cls.objects.select_for_update().filter(date__in={date for date, _ in deltas}, priority__in={priority for _, priority in deltas})
+                if (row.date, row.priority) in deltas]
+        for row in rows: row.count += deltas[(row.date, row.priority)]
+        cls.objects.bulk_update(rows, ['count'])
+    @classmethod
+    def move_deltas(cls, moves):
+        """ Deltas moving every logged day of the bugs in {bug pk: (old priority, new priority)} from the old series to the new one. """
+        deltas = Counter()
+        for bug_pk, date, count in (BugModificationLog.objects.filter(bug_id__in=list(moves)).annotate(date=TruncDate('modified_at'))
+                                    .values('bug_id', 'date').annotate(count=Count('id')).values_list('bug_id', 'date', 'count')):
+            old, new = moves[bug_pk]; deltas[(date, old)] -= count; deltas[(date, new)] += count
+        return deltas
+    @staticmethod
+    def remove_deltas(logs):
+        """ Deltas taking the BugModificationLog rows of the queryset `logs` out of their days' counts (one GROUP BY). """
+        return Counter({(date, priority): -count for date, priority, count in logs.order_by().annotate(date=TruncDate('modified_at'))
+                        .values('date', 'bug__priority').annotate(count=Count('id')).values_list('date', 'bug__priority', 'count')})
+    @staticmethod
+    def totals_from_logs():
+        """ (date, priority, count) rows computed from BugModificationLog with one GROUP BY. """
+        return (BugModificationLog.objects.order_by().annotate(date=TruncDate('modified_at')).values('date', 'bug__priority')
+                .annotate(count=Count('id')).values_list('date', 'bug__priority', 'count'))
+    @classmethod
+    def rebuild(cls):
+        """ Recomputes the whole table from the logs. Returns the number of rows. """
+        with transaction.atomic():
+            cls.objects.all().delete(); on_commit_bump()
+            return len(cls.objects.bulk_create([cls(date=date, priority=priority, count=count) for date, priority, count in cls.totals_from_logs()], batch_size=1000))
+    def __str__(self): return f"{self.date} {self.priority}: {self.count}"
+    class Meta:
+        verbose_name = "Daily Modification Count"; verbose_name_plural = "Daily Modification Counts"; ordering = ['date', 'priority']
+        constraints = [models.UniqueConstraint(fields=['date', 'priority'], name='unique_modification_day_priority')]
+
+@receiver(pre_delete, sender=Bug)
+def remove_deleted_bug_from_rollup(sender, instance, **kwargs):
+    """ A deleted bug's logs leave the dashboard series (runs inside the delete's transaction, before the cascade). """
+    BugModificationDaily.apply(BugModificationDaily.remove_deltas(BugModificationLog.objects.filter(bug_id=instance.pk))); on_commit_bump()
+
+@receiver(pre_delete, sender=BugModificationLog)
+def remove_deleted_log_from_rollup(sender, instance, origin=None, **kwargs):
+    """ A log deleted on its own leaves its day's count; logs cascading from a bug were removed with it. """
+    if isinstance(origin, Bug) or getattr(origin, 'model', None) is Bug: return
+    BugModificationDaily.apply(BugModificationDaily.remove_deltas(BugModificationLog.objects.filter(pk=instance.pk))); on_commit_bump()
+
+class BugRevision(models.Model):
+    """ One version of a bug's description, zlib-compressed. Revision 1 is the creating email; later ones link to their modification log. """
+    bug = models.ForeignKey(Bug, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField(help_text="1 for the creating email, then one per update")
+    modification_log = models.OneToOneField(BugModificationLog, null=True, blank=True, on_delete=models.SET_NULL, related_name='revision')
+    subject = models.CharField(max_length=255, help_text="Subject line of the email that produced this revision")
+    data = models.BinaryField(help_text="zlib-compressed UTF-8 description")
+    size = models.PositiveIntegerField(default=0, help_text="Uncompressed size in bytes")
+    created_at = models.DateTimeField(default=timezone.now)
+    @classmethod
+    def of(cls, text, **fields):
+        """ Unsaved revision holding `text`, compressed. """
+        raw = (text or '').encode('utf-8', 'surrogateescape')
+        return cls(data=zlib.compress(raw, 6), size=len(raw), **fields)
+    @property
+    def text(self): return zlib.decompress(bytes(self.data)).decode('utf-8', 'surrogateescape')
+    def __str__(self): return f"Revision {self.number} of bug {self.bug_id}"
+    class Meta:
+        ordering = ['bug', '-number']
+        constraints = [models.UniqueConstraint(fields=['bug', 'number'], name='unique_bug_revision_number')]
+
 class ProcessedEmail(models.Model):
-    message_id = models.CharField(max_length=500, unique=True, db_index=True, help_text="Unique Message-ID header")
+    """ Dedupe record of an ingested email, keyed by a fixed-width hash of its Message-ID (see dedupe.py). """
+    message_hash = models.BinaryField(max_length=16, unique=True, help_text="BLAKE2b-128 digest of the Message-ID header")
+    message_id = models.CharField(max_length=500, blank=True, default='', help_text="Raw Message-ID header (not indexed; empty when DEDUPE_STORE_MESSAGE_ID is off)")
     processed_at = models.DateTimeField(auto_now_add=True)
-    def __str__(self): return self.message_id
-    class Meta: verbose_name = "Processed Email Record"; verbose_name_plural = "Processed Email Records"; ordering = ['-processed_at']
\ No newline at end of file
+    @staticmethod
+    def hash_message_id(message_id): return hashlib.blake2b(message_id.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
+    def save(self, *args, **kwargs):
+        if not self.message_hash: self.message_hash = self.hash_message_id(self.message_id)
+        super().save(*args, **kwargs)
+    def __str__(self): return self.message_id or bytes(self.message_hash).hex()
+    class Meta: verbose_name = "Processed Email Record"; verbose_name_plural = "Processed Email Records"; ordering = ['-processed_at']
+
+DEFAULT_MAILBOX = 'default' # Created by migration 0010; its empty connection fields use the IMAP_* settings
+
+class Mailbox(models.Model):
+    """ An IMAP account to ingest from, polled folder by folder (see api/polling.py). Empty connection fields fall back to the IMAP_* settings. """
+    name = models.SlugField(max_length=100, unique=True, help_text="Short name, used in task arguments, lease keys and metrics")
+    server = models.CharField(max_length=255, blank=True, default='', help_text="IMAP host (empty: IMAP_SERVER)")
+    port = models.PositiveIntegerField(null=True, blank=True, help_text="Empty: IMAP_PORT")
+    use_ssl = models.BooleanField(null=True, blank=True, help_text="Empty: IMAP_USE_SSL")
+    username = models.CharField(max_length=255, blank=True, default='', help_text="Empty: IMAP_USER")
+    password = models.CharField(max_length=255, blank=True, default='', help_text="Empty: IMAP_PASSWORD (only used together with the server and username of this row)")
+    folders = models.CharField(max_length=1000, default='inbox', help_text="Comma-separated IMAP folders to ingest")
+    enabled = models.BooleanField(default=True, help_text="Disabled mailboxes are not polled and their dead letters are not retried")
+    max_messages_per_run = models.PositiveIntegerField(null=True, blank=True, help_text="Emails per run (empty: INGEST_MAX_MESSAGES)")
+    max_seconds_per_run = models.PositiveIntegerField(null=True, blank=True, help_text="Seconds per run (empty: INGEST_MAX_SECONDS)")
+    max_bytes_per_run = models.PositiveBigIntegerField(null=True, blank=True, help_text="Bytes downloaded per run (empty: INGEST_MAX_BYTES)")
+    poll_min_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Shortest poll interval of its folders (empty: INGEST_POLL_MIN_SECONDS)")
+    poll_max_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Longest poll interval of its folders (empty: INGEST_POLL_MAX_SECONDS)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    @classmethod
+    def default(cls): return cls.objects.get_or_create(name=DEFAULT_MAILBOX)[0]
+    def folder_list(self): return list(dict.fromkeys(folder.strip() for folder in self.folders.split(',') if folder.strip()))
+    def __str__(self): return self.name
+    class Meta: verbose_name = "Mailbox"; verbose_name_plural = "Mailboxes"; ordering = ['name']
+
+def default_mailbox(): return Mailbox.default().pk
+
+class MailboxSyncState(models.Model):
+    """ IMAP sync checkpoint per mailbox folder: the folder's UIDVALIDITY and the highest UID already ingested. """
+    mailbox = models.ForeignKey(Mailbox, on_delete=models.CASCADE, default=default_mailbox, related_name='sync_states')
+    folder = models.CharField(max_length=255, help_text="IMAP folder name (e.g. inbox)")
+    uid_validity = models.BigIntegerField(null=True, blank=True, help_text="UIDVALIDITY seen at the last sync; a change forces a full resync")
+    last_uid = models.BigIntegerField(default=0, help_text="Highest UID processed; the next sync fetches UID last_uid+1:*")
+    fanout_started_at = models.DateTimeField(null=True, blank=True, help_text="Set while a fan-out ingestion chord is in flight for this folder")
+    poll_min_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Shortest poll interval, used while mail keeps arriving (empty: INGEST_POLL_MIN_SECONDS)")
+    poll_max_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Longest poll interval, reached by backing off while idle (empty: INGEST_POLL_MAX_SECONDS)")
+    poll_interval_seconds = models.FloatField(default=0, help_text="Current adaptive poll interval (see api/polling.py)")
+    next_poll_at = models.DateTimeField(null=True, blank=True, help_text="When schedule_mailbox_polls next enqueues a poll of this folder")
+    resync_since = models.DateField(null=True, blank=True, help_text="Set during a resync after a UIDVALIDITY change: only mail received since this day is fetched, older dedupe records may be pruned")
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self): return f"{self.folder} (UIDVALIDITY {self.uid_validity}, last UID {self.last_uid})"
+    class Meta:
+        verbose_name = "Mailbox Sync State"; verbose_name_plural = "Mailbox Sync States"; ordering = ['mailbox', 'folder']
+        constraints = [models.UniqueConstraint(fields=['mailbox', 'folder'], name='unique_mailbox_folder')]
+
+class IngestionRun(models.Model):
+    """ Summary of one email ingestion run (see api/metrics.py). """
+    started_at = models.DateTimeField(db_index=True)
+    mailbox = models.CharField(max_length=100, blank=True, default='', help_text="Mailbox name (empty for pushed emails)"); folder = models.CharField(max_length=255, blank=True, default='')
+    duration_seconds = models.FloatField(default=0)
+    processed = models.IntegerField(default=0); duplicates = models.IntegerField(default=0); skipped = models.IntegerField(default=0); failed = models.IntegerField(default=0)
+    bytes_fetched = models.BigIntegerField(default=0, help_text="Message bytes downloaded from IMAP")
+    stage_seconds = models.JSONField(default=dict, help_text="Seconds spent per stage (login, select, search, fetch, parse, dedupe, persist, store)")
+    skip_reasons = models.JSONField(default=dict, help_text="Emails not ingested, by reason (no_message_id, no_bug_id, no_body, duplicate)")
+    stopped_early = models.BooleanField(default=False, help_text="The run budget ran out with UIDs left")
+    error = models.TextField(blank=True, default='')
+    def __str__(self): return f"Ingestion run at {self.started_at} ({self.processed} processed in {self.duration_seconds:.1f}s)"
+    class Meta: ordering = ['-started_at']
+
+class IngestionMetric(models.Model):
+    """ Cumulative value of one Prometheus series over all ingestion runs, served by /metrics. """
+    series = models.CharField(max_length=255, unique=True, help_text='e.g. bugtracker_ingest_skipped_total{reason="no_body"}')
+    value = models.FloatField(default=0)
+    def __str__(self): return f"{self.series} {self.value}"
+    class Meta: ordering = ['series']
+
+class DataVersion(models.Model):
+    """ Single row holding the data version of api/caching.py, so ETags survive a cache eviction or a cache-less deployment. """
+    version = models.BigIntegerField(help_text="Millisecond time of the last committed write")
+    def __str__(self): return str(self.version)
+
+class DeadLetterEmail(models.Model):
+    """ An email that failed to fetch, parse or persist, parked for isolated retries (see api/dead_letters.py). """
+    class Status(models.TextChoices): PENDING = 'pending', _('Pending'); RESOLVED = 'resolved', _('Resolved'); EXHAUSTED = 'exhausted', _('Exhausted'); DISCARDED = 'discarded', _('Discarded')
+    class Stage(models.TextChoices): FETCH = 'fetch', _('Fetch'); PARSE = 'parse', _('Parse'); PERSIST = 'persist', _('Persist')
+    mailbox = models.ForeignKey(Mailbox, on_delete=models.CASCADE, default=default_mailbox, related_name='dead_letters')
+    folder = models.CharField(max_length=255)
+    uid_validity = models.BigIntegerField(null=True, blank=True, help_text="UIDVALIDITY the UID belongs to")
+    uid = models.BigIntegerField()
+    message_id = models.CharField(max_length=500, blank=True, default='', help_text="Message-ID, if the headers could be read")
+    stage = models.CharField(max_length=20, choices=Stage.choices)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=1)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, help_text="When the retry task may try again (exponential backoff)")
+    first_failed_at = models.DateTimeField(auto_now_add=True)
+    last_failed_at = models.DateTimeField(default=timezone.now)
+    def __str__(self): return f"UID {self.uid} in {self.folder} ({self.status}, {self.attempts} attempts)"
+    class Meta:
+        verbose_name = "Dead-Letter Email"; verbose_name_plural = "Dead-Letter Emails"; ordering = ['-last_failed_at']
+        constraints = [models.UniqueConstraint(fields=['mailbox', 'folder', 'uid_validity', 'uid'], name='unique_dead_letter_uid')]
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
@@ -0,0 +1,91 @@
+# api/pagination.py
+"""
+Keyset (cursor) pagination for the bug list.
+
+PageNumberPagination counts the whole filtered queryset on every request and
+reads page N with OFFSET, which walks and discards every earlier row. Requests
+with a `cursor` parameter (empty for the first page) are paged by keyset
+instead. Rows are ordered newest first by (created_at, id). A cursor holds the
+(created_at, id) of the row a page starts after, so every page is one index
+range read of page_size + 1 rows, however deep it is. With a search, the page
+is read in the same order (not by relevance), so the cursor stays valid.
+`next` and `previous` are links with opaque cursors. The total is only returned
+with `include_count=true`. It is counted once per data version and kept in the
+cache (api/caching.py), so it is counted again only after a write.
+"""
+import base64
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import caching
+
+
+class KeysetPagination(pagination.BasePagination):
+    """ Newest-first pages keyed on (created_at, id); used by BugListView when the request has a cursor. """
+    cursor_query_param = 'cursor'; page_size_query_param = 'page_size'; count_query_param = 'include_count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def requested(cls, request): return cls.cursor_query_param in request.query_params
+
+    def get_page_size(self, request):
+        rest_settings = getattr(settings, 'REST_FRAMEWORK', {})
+        try: size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError): size = rest_settings.get('PAGE_SIZE', 10)
+        return max(1, min(size, rest_settings.get('MAX_PAGE_SIZE', 100)))
+
+    def encode_cursor(self, backward, row):
+        token = f"{'p' if backward else 'n'}|{row.created_at.isoformat()}|{row.pk}"
+        return replace_query_param(self.base_url, self.cursor_query_param, base64.urlsafe_b64encode(token.encode()).decode().rstrip('='))
+
+    def decode_cursor(self, request):
+        """ (backward, (created_at, pk) or None for the first page); raises NotFound for a malformed cursor. """
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded: return False, None
+        try:
+            direction, created_at, pk = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if direction not in ('n', 'p') or created_at is None: raise ValueError(direction)
+            return direction == 'p', (created_at, int(pk))
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri(); self.page_size = self.get_page_size(request)
+        self.backward, position = self.decode_cursor(request)
+        self.count = self.total(queryset, request) if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true') else None
+        if position:
+            created_at, pk = position
+            # `created_at <= c` bounds the index range; the OR only settles rows sharing c
+            if self.backward: queryset = queryset.filter(Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(pk__gt=pk)))
+            else: queryset = queryset.filter(Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(pk__lt=pk)))
+        rows = list(queryset.order_by(*(('created_at', 'pk') if self.backward else ('-created_at', '-pk')))[:self.page_size + 1])
+        more = len(rows) > self.page_size; rows = rows[:self.page_size]
+        if self.backward: rows.reverse()
+        self.next = self.encode_cursor(False, rows[-1]) if rows and (more if not self.backward else position) else None
+        self.previous = self.encode_cursor(True, rows[0]) if rows and (more if self.backward else position) else None
+        return rows
+
+    def total(self, queryset, request):
+        """ Rows of the filtered queryset, counted once per data version for each set of filters. """
+        filters = sorted((key, value) for key, value in request.query_params.items() if key not in (self.cursor_query_param, self.page_size_query_param, self.count_query_param))
+        return caching.cached_value(f"bug_count:{hashlib.sha1(repr(filters).encode()).hexdigest()}", queryset.count)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict([('next', self.next), ('previous', self.previous)])
+        if self.count is not None: body['count'] = self.count
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {'type': 'object', 'required': ['results'], 'properties': {
+            'next': {'type': 'string', 'nullable': True, 'format': 'uri'}, 'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'count': {'type': 'integer', 'description': f'Only with {self.count_query_param}=true'}, 'results': schema}}
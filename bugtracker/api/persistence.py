@@ -0,0 +1,158 @@
+# api/persistence.py
+"""
+Batch persistence stage for parsed bug emails.
+
+A chunk of parsed emails is written with a fixed number of queries regardless
+of its size: at most one IN query resolves already-seen Message-IDs, Bug rows are
+upserted with a single bulk_create(update_conflicts=True), and modification
+logs, description revisions and processed-email records are bulk-inserted.
+The dashboard's daily rollup (BugModificationDaily) is adjusted in the same
+transaction.
+Bug rows only carry a short summary; every email's full description is kept
+as a compressed BugRevision.
+"""
+import logging
+from collections import Counter
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import on_commit_bump
+from .dedupe import seen_message_ids, remember_message_ids
+from .models import Bug, BugModificationDaily, BugModificationLog, BugRevision, ProcessedEmail
+from .search import index_documents
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of ingesting a single message. PROCESSED and DUPLICATE messages are marked Seen;
+# FAILED ones (DB errors) are retried on the next run, SKIPPED ones (unusable email) are not.
+PROCESSED, DUPLICATE, SKIPPED, FAILED = 'processed', 'duplicate', 'skipped', 'failed'
+
+
+@dataclass
+class ParsedEmail:
+    """ The fields of a bug email that ingestion persists. """
+    message_id: str
+    bug_id: str
+    subject: str
+    description: str
+    priority: Optional[str] = None # Parsed from the body; None keeps the current/default priority
+    modified_at: Optional[datetime] = None # Modification log timestamp; None means "now"
+
+    def to_dict(self):
+        """ JSON-serialisable form, for passing parsed emails between Celery tasks. """
+        data = asdict(self)
+        if self.modified_at: data['modified_at'] = self.modified_at.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if data.get('modified_at'): data['modified_at'] = parse_datetime(data['modified_at'])
+        return cls(**data)
+
+
+def persist_batch(emails, trust_filter=True, errors=None):
+    """
+    Persists a chunk of ParsedEmail objects in email order and returns one outcome
+    (PROCESSED, DUPLICATE or FAILED) per email.
+    Semantics match processing the emails one by one: the first email for an unknown
+    Bug ID creates it (parsed priority or MEDIUM), every later one updates subject,
+    summary, priority (if parsed), increments modified_count and is logged. Each
+    email's description is stored as the bug's next revision.
+    Message-IDs the dedupe Bloom filter rules out are not looked up (see dedupe.py).
+    If the batch cannot be written, it is retried once with every Message-ID checked
+    against the database (a filter miss surfaces as a unique-key conflict), then each
+    email in its own transaction so one bad message does not fail the others.
+    If `errors` is a dict, the error of each FAILED email is stored under its Message-ID.
+    """
+    if not emails: return []
+    try:
+        with transaction.atomic():
+            return _persist_batch(emails, trust_filter)
+    except Exception as batch_error:
+        if trust_filter:
+            logger.info(f"Batch persist of {len(emails)} emails failed ({batch_error}). Rechecking Message-IDs against the database.")
+            return persist_batch(emails, trust_filter=False, errors=errors)
+        if len(emails) == 1:
+            logger.error(f"DB error processing {emails[0].message_id} for bug {emails[0].bug_id}: {batch_error}", exc_info=True)
+            if errors is not None: errors[emails[0].message_id] = f"{type(batch_error).__name__}: {batch_error}"
+            return [FAILED]
+        logger.warning(f"Batch persist of {len(emails)} emails failed ({batch_error}). Retrying one by one.")
+        return [persist_batch([parsed], trust_filter=False, errors=errors)[0] for parsed in emails]
+
+
+def _persist_batch(emails, trust_filter=True):
+    outcomes = [None] * len(emails)
+    now = timezone.now()
+
+    # 1. Resolve already processed Message-IDs: the Bloom filter, then at most one IN query on the hash index (duplicates within the batch count too)
+    seen = seen_message_ids({e.message_id for e in emails}, trust_filter)
+    accepted = []
+    for index, parsed in enumerate(emails):
+        if parsed.message_id in seen:
+            logger.info(f"Email {parsed.message_id} already processed. Marking Seen."); outcomes[index] = DUPLICATE; continue
+        seen.add(parsed.message_id); accepted.append(index)
+    if not accepted: return outcomes
+    remember_message_ids([emails[index].message_id for index in accepted])
+
+    # 2. Fold the accepted emails into one final row per bug, in email order
+    bug_ids = {emails[index].bug_id for index in accepted}
+    last_revision = BugRevision.objects.filter(bug=OuterRef('pk')).order_by('-number').values('number')[:1]
+    existing = {
+        bug_id: (priority, modified_count, last_number or 0) for bug_id, priority, modified_count, last_number in
+        Bug.objects.select_for_update().filter(bug_id__in=bug_ids).annotate(last_revision=Subquery(last_revision))
+        .values_list('bug_id', 'priority', 'modified_count', 'last_revision')
+    }
+    rows = {}; log_entries = []; revisions = [] # revisions: (bug_id, number, parsed, index into log_entries or None)
+    numbers = {bug_id: state[2] for bug_id, state in existing.items()}
+    for index in accepted:
+        parsed = emails[index]; outcomes[index] = PROCESSED
+        numbers[parsed.bug_id] = numbers.get(parsed.bug_id, 0) + 1
+        row = rows.get(parsed.bug_id)
+        if row is None and parsed.bug_id not in existing:
+            rows[parsed.bug_id] = Bug(bug_id=parsed.bug_id, subject=parsed.subject, summary=Bug.summarize(parsed.description), priority=parsed.priority or Bug.Priority.MEDIUM)
+            revisions.append((parsed.bug_id, numbers[parsed.bug_id], parsed, None))
+            logger.info(f"Created new Bug: {parsed.bug_id} (Priority: {rows[parsed.bug_id].priority}) from email {parsed.message_id}")
+            continue
+        if row is None:
+            priority, modified_count, _ = existing[parsed.bug_id]
+            row = rows[parsed.bug_id] = Bug(bug_id=parsed.bug_id, priority=priority, modified_count=modified_count)
+        row.subject = parsed.subject; row.summary = Bug.summarize(parsed.description)
+        row.modified_count += 1
+        if parsed.priority and parsed.priority != row.priority:
+            row.priority = parsed.priority
+            logger.info(f"Updating priority for Bug {parsed.bug_id} to '{parsed.priority}'.")
+        revisions.append((parsed.bug_id, numbers[parsed.bug_id], parsed, len(log_entries)))
+        log_entries.append((parsed.bug_id, parsed.modified_at or now))
+        logger.info(f"Updated existing Bug: {parsed.bug_id} (Mod count: {row.modified_count}, Priority: {row.priority}) from email {parsed.message_id}")
+
+    # 3. Upsert bugs (status and created_at are left untouched on conflict), then bulk insert logs, revisions and records
+    Bug.objects.bulk_create(
+        rows.values(), update_conflicts=True, unique_fields=['bug_id'],
+        update_fields=['subject', 'summary', 'priority', 'modified_count', 'updated_at'],
+    )
+    # The daily rollup: a bug whose priority changed moves its earlier days to the new series (before this batch's logs exist), then the new logs are added
+    moves = {rows[bug_id].pk: (existing[bug_id][0], rows[bug_id].priority) for bug_id in rows if bug_id in existing and existing[bug_id][0] != rows[bug_id].priority}
+    daily = BugModificationDaily.move_deltas(moves) if moves else Counter()
+    for bug_id, modified_at in log_entries: daily[(BugModificationDaily.day(modified_at), rows[bug_id].priority)] += 1
+    BugModificationDaily.apply(daily)
+    logs = BugModificationLog.objects.bulk_create([BugModificationLog(bug_id=rows[bug_id].pk, modified_at=modified_at) for bug_id, modified_at in log_entries]) if log_entries else []
+    BugRevision.objects.bulk_create([
+        BugRevision.of(parsed.description, bug_id=rows[bug_id].pk, number=number, subject=parsed.subject, created_at=parsed.modified_at or now,
+                       modification_log_id=logs[log_index].pk if log_index is not None else None)
+        for bug_id, number, parsed, log_index in revisions
+    ])
+    index_documents({bug_id: (rows[bug_id].pk, bug_id, parsed.subject, parsed.description) for bug_id, _, parsed, _ in revisions}.values()) # Each bug's latest email
+    ProcessedEmail.objects.bulk_create([
+        ProcessedEmail(message_hash=ProcessedEmail.hash_message_id(emails[index].message_id), message_id=emails[index].message_id if settings.DEDUPE_STORE_MESSAGE_ID else '')
+        for index in accepted
+    ])
+    on_commit_bump() # Cached dashboard responses are invalidated once this chunk is committed
+    return outcomes
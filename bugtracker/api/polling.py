@@ -0,0 +1,70 @@
+# api/polling.py
+"""
+Adaptive poll scheduling for mailbox ingestion.
+
+Beat does not poll IMAP at a fixed rate. It runs the cheap
+schedule_mailbox_polls task every INGEST_POLL_TICK_SECONDS. That task only
+reads Mailbox and MailboxSyncState and enqueues one process_incoming_emails per
+(mailbox, folder) whose next_poll_at has passed. Each runs as its own task, with
+its own connection, lease and budget, so a slow or failing mailbox does not hold
+up the others. A poll that finds new mail drops the folder's interval to its
+minimum, so bursts are picked up quickly. Each empty poll multiplies the
+interval by INGEST_POLL_BACKOFF, up to the maximum, so a quiet mailbox costs
+little IMAP and worker time. The bounds can be set per folder or per mailbox
+(in the admin); empty fields fall back to the INGEST_POLL_* settings.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Mailbox, MailboxSyncState
+
+logger = logging.getLogger(__name__)
+
+
+def poll_bounds(state):
+    """ (minimum, maximum) poll interval of a folder in seconds: the folder's, else its mailbox's, else the settings. """
+    mailbox = state.mailbox
+    minimum = state.poll_min_seconds or mailbox.poll_min_seconds or getattr(settings, 'INGEST_POLL_MIN_SECONDS', 30)
+    return minimum, max(minimum, state.poll_max_seconds or mailbox.poll_max_seconds or getattr(settings, 'INGEST_POLL_MAX_SECONDS', 900))
+
+def next_interval(state, new_messages):
+    """ The minimum after a poll that found mail, else the current interval backed off towards the maximum. """
+    minimum, maximum = poll_bounds(state)
+    if new_messages: return float(minimum)
+    return float(min(maximum, max(state.poll_interval_seconds, minimum) * getattr(settings, 'INGEST_POLL_BACKOFF', 2.0)))
+
+def record_poll(state, new_messages):
+    """ Reschedules a folder after a poll that found `new_messages` new UIDs. """
+    interval = next_interval(state, new_messages)
+    if interval != state.poll_interval_seconds:
+        logger.debug(f"Poll interval of '{state.mailbox.name}/{state.folder}': {state.poll_interval_seconds:.0f}s -> {interval:.0f}s ({new_messages} new emails).")
+    state.poll_interval_seconds = interval; state.next_poll_at = timezone.now() + timedelta(seconds=interval)
+    state.save(update_fields=['poll_interval_seconds', 'next_poll_at', 'updated_at'])
+
+def claim_due_folders():
+    """
+    (mailbox name, folder) pairs of enabled mailboxes whose next poll is due. Each is claimed
+    by pushing next_poll_at one interval ahead (a conditional UPDATE, so overlapping ticks do
+    not enqueue a folder twice, and a folder whose polls keep failing is retried at its current
+    interval rather than every tick). A folder polled for the first time gets its sync state here.
+    """
+    now = timezone.now(); due = []
+    mailboxes = list(Mailbox.objects.filter(enabled=True))
+    states = {(state.mailbox_id, state.folder): state for state in MailboxSyncState.objects.filter(mailbox__in=mailboxes)}
+    for mailbox in mailboxes:
+        for folder in mailbox.folder_list():
+            state = states.get((mailbox.pk, folder))
+            if state is None:
+                state = MailboxSyncState(mailbox=mailbox, folder=folder)
+                _, created = MailboxSyncState.objects.get_or_create(mailbox=mailbox, folder=folder, defaults={'next_poll_at': now + timedelta(seconds=poll_bounds(state)[0])})
+                if created: due.append((mailbox.name, folder))
+                continue
+            if state.next_poll_at is not None and state.next_poll_at > now: continue
+            state.mailbox = mailbox
+            interval = max(state.poll_interval_seconds, poll_bounds(state)[0])
+            if MailboxSyncState.objects.filter(pk=state.pk, next_poll_at=state.next_poll_at).update(next_poll_at=now + timedelta(seconds=interval)):
+                due.append((mailbox.name, folder))
+    return due
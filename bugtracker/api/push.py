@@ -0,0 +1,125 @@
+# api/push.py
+"""
+Push ingestion: raw bug emails POSTed by a mail relay (see views.ingest_email_view).
+
+A relay can pipe mail straight to POST /api/ingest/email/ instead of
+delivering it to the polled IMAP inbox. Each request carries one or more raw
+RFC822 messages, sent in one of three forms:
+  * message/rfc822: the body is one message,
+  * multipart/form-data: every uploaded file is one message, in upload order,
+  * application/x-ndjson: one JSON object per line, {"raw": "<message>"} or
+    {"raw_base64": "<base64 message>"}.
+Messages are parsed in the request with the same streaming parser as IMAP
+ingestion, so attachments are never buffered. A message without a Message-ID,
+a Bug ID or a plain text body is rejected, and so is a Message-ID already
+processed. The rest are handed to the persist_pushed_emails task, which writes
+them through persist_batch like a polled chunk. The response reports the
+outcome of every message.
+Bodies are read from the request stream in chunks against INGEST_PUSH_MAX_BYTES
+rather than through request.body, so Django's DATA_UPLOAD_MAX_MEMORY_SIZE does
+not apply. Larger requests are answered with 413.
+"""
+import base64
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig, TooManyFilesSent
+from kombu.exceptions import KombuError
+
+from . import metrics
+from .dedupe import seen_message_ids
+from .tasks import parse_email, persist_pushed_emails
+
+logger = logging.getLogger(__name__)
+
+QUEUED, DUPLICATE, REJECTED = 'queued', 'duplicate', 'rejected'
+BROKER_ERRORS = (KombuError, OSError) # What apply_async raises when the broker is unreachable (answered with 503)
+CHUNK_SIZE = 64 * 1024
+
+
+class PushError(ValueError):
+    """ The request body cannot be read as raw messages (answered with 400). """
+    status_code = 400
+
+class PushTooLarge(PushError):
+    """ The request is larger than INGEST_PUSH_MAX_BYTES (answered with 413). """
+    status_code = 413
+
+
+def max_bytes(): return getattr(settings, 'INGEST_PUSH_MAX_BYTES', 50 * 1024 * 1024)
+
+def read_body(request):
+    """ The request body as a list of chunks, read from the stream; raises PushTooLarge past INGEST_PUSH_MAX_BYTES. """
+    limit = max_bytes(); chunks = []; size = 0
+    while True:
+        chunk = request.read(CHUNK_SIZE)
+        if not chunk: return chunks
+        size += len(chunk)
+        if size > limit: raise PushTooLarge(f"Requests are limited to {limit} bytes.")
+        chunks.append(chunk)
+
+def read_messages(request):
+    """ The raw messages of a push request, as bytes or chunk iterables (uploaded files are not read into memory). """
+    content_type = request.content_type or ''
+    try: declared = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError: declared = 0
+    if declared > max_bytes(): raise PushTooLarge(f"Requests are limited to {max_bytes()} bytes.")
+    if content_type == 'multipart/form-data':
+        try: uploads = [upload for _, files in request.FILES.lists() for upload in files]
+        except TooManyFilesSent: raise PushError(f"At most {getattr(settings, 'INGEST_PUSH_MAX_MESSAGES', 500)} messages per request.")
+        except RequestDataTooBig: raise PushTooLarge("The form fields are too large.")
+        if sum(upload.size for upload in uploads) > max_bytes(): raise PushTooLarge(f"Requests are limited to {max_bytes()} bytes.")
+        messages = [upload.chunks() for upload in uploads]
+    elif content_type in ('application/x-ndjson', 'application/jsonl'):
+        messages = []
+        for number, line in enumerate(b''.join(read_body(request)).splitlines(), 1):
+            if not line.strip(): continue
+            try:
+                item = json.loads(line)
+                messages.append(base64.b64decode(item['raw_base64'], validate=True) if 'raw_base64' in item else item['raw'].encode('utf-8', 'surrogateescape'))
+            except (ValueError, KeyError, TypeError, AttributeError) as line_error:
+                raise PushError(f"Line {number} is not a JSON object with 'raw' or 'raw_base64': {line_error}")
+    elif content_type == 'message/rfc822':
+        chunks = read_body(request)
+        messages = [chunks] if any(chunk.strip() for chunk in chunks) else []
+    else:
+        raise PushError("Send message/rfc822, multipart/form-data or application/x-ndjson.")
+    if not messages: raise PushError("No messages in the request.")
+    limit = getattr(settings, 'INGEST_PUSH_MAX_MESSAGES', 500)
+    if len(messages) > limit: raise PushError(f"At most {limit} messages per request.")
+    return messages
+
+
+def accept_messages(messages):
+    """
+    Parses pushed messages and enqueues the usable ones, in order, as one persist task.
+    Returns (one result dict per message, task id or None). Raises if the task cannot be
+    enqueued (broker down); the relay should then retry the request.
+    """
+    results = []; queued = []
+    with metrics.collect() as run:
+        for index, raw in enumerate(messages):
+            skips_before = run.label_counts(metrics.SKIPPED, 'reason')
+            try:
+                with metrics.stage('parse'): parsed = parse_email(raw, f"push #{index}")
+            except Exception as parse_error:
+                logger.warning(f"Could not parse pushed email #{index}: {parse_error}"); metrics.skip('unparseable'); parsed = None
+            if parsed is None:
+                reason = next((reason for reason, count in run.label_counts(metrics.SKIPPED, 'reason').items() if count > skips_before.get(reason, 0)), 'unparseable')
+                results.append({'index': index, 'status': REJECTED, 'reason': reason}); continue
+            results.append({'index': index, 'status': QUEUED, 'message_id': parsed.message_id, 'bug_id': parsed.bug_id}); queued.append((index, parsed))
+
+        with metrics.stage('dedupe'): seen = seen_message_ids({parsed.message_id for _, parsed in queued})
+        unique = []
+        for index, parsed in queued:
+            if parsed.message_id in seen: results[index]['status'] = DUPLICATE; continue
+            seen.add(parsed.message_id); unique.append(parsed)
+        metrics.count_outcomes(skipped=sum(result['status'] == REJECTED for result in results), duplicate=len(queued) - len(unique))
+    try: metrics.flush_totals(run)
+    except Exception as metrics_error: logger.error(f"Could not record push ingestion metrics: {metrics_error}")
+
+    if not unique: return results, None
+    task = persist_pushed_emails.apply_async(args=[[parsed.to_dict() for parsed in unique]])
+    logger.info(f"Queued {len(unique)} of {len(results)} pushed emails (task {task.id}).")
+    return results, task.id
@@ -0,0 +1,71 @@
+# api/reply_parser.py
+"""
+Separates the new text of a reply email from the history it quotes.
+
+Bug updates are mostly replies, and mail clients quote the whole thread below
+(or around) the answer. Stored as-is, every revision would repeat all earlier
+ones. split_reply keeps the lines written for this email and drops:
+  * `>`-quoted lines (inline replies keep their own, unquoted lines),
+  * everything from an attribution line ("On <date>, <name> wrote:", which
+    clients may wrap over up to three lines) or an Outlook-style header block
+    ("-----Original Message-----", or "From:" followed by "Sent:"/"Date:"),
+  * a trailing signature, starting at the RFC 3676 "-- " delimiter (dash, dash,
+    space; a bare "--" is ordinary text) or a "Sent from my ..." line.
+Quotes and signatures are only dropped from replies (In-Reply-To, References or
+a "Re:" subject, see is_reply). A new report keeps its `>` lines, which are
+usually pasted shell prompts or logs, and only loses what follows an attribution
+or forwarded-header block.
+Bodies with none of these markers are returned unchanged (a substring check
+rules most of them out before any line is looked at).
+"""
+import re
+from email.header import decode_header, make_header
+
+# --- Precompiled Patterns ---
+_ATTRIBUTION_RE = re.compile(r'^\s*On\b.{0,400}\bwrote:\s*$', re.DOTALL)
+_ORIGINAL_MESSAGE_RE = re.compile(r'^\s*-{2,}\s*(Original Message|Forwarded message)\s*-{2,}\s*$', re.IGNORECASE)
+_OUTLOOK_RULE_RE = re.compile(r'^\s*_{20,}\s*$')
+_OUTLOOK_FROM_RE = re.compile(r'^\s*\*?From:\*?\s+\S')
+_OUTLOOK_SENT_RE = re.compile(r'^\s*\*?(Sent|Date):\*?\s+\S')
+_SIGNATURE_RE = re.compile(r'^(-- |Sent from my .{1,60}\s*)$')
+_REPLY_SUBJECT_RE = re.compile(r'^\s*(re|aw|sv|antw)\s*(\[\d+\])?\s*:', re.IGNORECASE)
+_MARKERS = ('>', 'wrote:', '\n--', '-----', '____', 'From:', 'Sent from my ')
+# --- END Precompiled Patterns ---
+
+
+def _starts_history(lines, index):
+    """ True if lines[index] starts the quoted history (attribution or forwarded-header block). """
+    line = lines[index]
+    if line.lstrip().startswith('On ') and any(_ATTRIBUTION_RE.match(''.join(lines[index:index + count]).rstrip()) for count in (1, 2, 3)): return True
+    if _ORIGINAL_MESSAGE_RE.match(line): return True
+    if _OUTLOOK_RULE_RE.match(line) and any(_OUTLOOK_FROM_RE.match(next_line) for next_line in lines[index + 1:index + 3]): return True
+    return bool(_OUTLOOK_FROM_RE.match(line) and any(_OUTLOOK_SENT_RE.match(next_line) for next_line in lines[index + 1:index + 4]))
+
+def is_reply(msg):
+    """ True if a message's headers mark it as a reply (In-Reply-To, References or a "Re:"-style subject, RFC 2047-decoded). """
+    if msg.get('In-Reply-To') or msg.get('References'): return True
+    subject = str(msg.get('Subject', ''))
+    try: subject = str(make_header(decode_header(subject)))
+    except (LookupError, UnicodeError, ValueError): pass # Undecodable: match the raw header
+    return bool(_REPLY_SUBJECT_RE.match(subject))
+
+def split_reply(text, reply=True):
+    """
+    (new content, dropped text) of an email body; the new content ends with one newline if anything was dropped.
+    With reply=False only an attribution or forwarded-header block and what follows it are dropped.
+    """
+    if not text or not any(marker in text for marker in _MARKERS): return text, ''
+    lines = text.splitlines(keepends=True)
+    kept = []; dropped = []
+    for index, line in enumerate(lines):
+        if _starts_history(lines, index) or (reply and _SIGNATURE_RE.match(line.rstrip('\r\n')) and kept):
+            dropped += lines[index:]; break
+        (dropped if reply and line.startswith('>') else kept).append(line)
+    if not dropped: return text, ''
+    new = ''.join(kept).rstrip()
+    return (new + '\n' if new else ''), ''.join(dropped)
+
+def strip_reply(text, reply=True):
+    """ The new content of an email body, or the whole body if nothing new is left (e.g. a bare forward). """
+    new, _ = split_reply(text, reply)
+    return new or text
@@ -0,0 +1,151 @@
+# api/search.py
+"""
+Full-text search over bugs for BugListView's `search` parameter.
+
+DRF's SearchFilter turns a search into `LIKE '%term%'` over every searched
+column, which scans every row and cannot rank. Instead, each bug has one index
+document (its bug_id, subject and full current description) in a full-text index:
+  * SQLite: an FTS5 table (api_bug_fts, rowid = bug pk), ranked with bm25,
+  * PostgreSQL: a tsvector table (api_bug_search) with a GIN index, ranked with
+    ts_rank. The bug_id is weighted highest, then the subject, then the description.
+Every word of the search must match, and the last one also matches as a prefix
+("crash sav" finds "crash on save"). Results are ordered by relevance, newest
+first among equals.
+Documents are written in the transactions that change them: persist_batch for
+ingested emails and Bug.save for edits. Deleted bugs leave the index through a
+trigger (SQLite) or a cascading foreign key (PostgreSQL). Writes that bypass
+both need `manage.py rebuild_search_index`. On other databases, with
+SEARCH_FULL_TEXT=False, or for searches without a word character, the list
+falls back to SearchFilter over bug_id, subject and the summary. Descriptions are
+stored compressed, so words past the summary's first 300 characters are only
+found through the index. The flag only affects queries: the index is kept up to
+date whenever it exists, so turning the flag back on serves current results.
+"""
+import logging
+import re
+import zlib
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def search_words(term):
+    """ The words of a search, lowercased (at most 16; punctuation separates words as the index tokenizers do). """
+    return [word.lower() for word in _WORD_RE.findall(term or '')][:16]
+
+
+class SqliteSearchBackend:
+    """ FTS5 virtual table keyed by bug pk. """
+    name = 'fts5'; table = 'api_bug_fts'
+
+    def create(self, cursor):
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5(bug_id, subject, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {self.table}_bug_delete AFTER DELETE ON api_bug BEGIN DELETE FROM {self.table} WHERE rowid = old.id; END")
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_bug_delete"); cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def write(self, cursor, documents):
+        cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(documents))})", [pk for pk, *_ in documents])
+        cursor.executemany(f"INSERT INTO {self.table} (rowid, bug_id, subject, description) VALUES (%s, %s, %s, %s)", documents)
+
+    def clear(self, cursor): cursor.execute(f"DELETE FROM {self.table}")
+
+    def filter(self, queryset, words, ranked=True):
+        query = ' '.join('"' + word.replace('"', '""') + '"' for word in words) + '*' # Implicit AND; the last word is a prefix
+        bugs = queryset.model._meta.db_table
+        queryset = queryset.extra(tables=[self.table], where=[f'{self.table}.rowid = "{bugs}".id', f'{self.table} MATCH %s'], params=[query])
+        if not ranked: return queryset
+        # bm25: lower is better; it normalises by the whole row's length, so short fields need heavy weights
+        return queryset.extra(select={'search_rank': f'bm25({self.table}, 20.0, 10.0, 1.0)'}).order_by('search_rank', '-created_at')
+
+    def available(self, cursor):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table])
+        return cursor.fetchone() is not None
+
+
+class PostgresSearchBackend:
+    """ Weighted tsvector per bug pk, GIN-indexed. """
+    name = 'tsvector'; table = 'api_bug_search'
+    document_sql = ("setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('english', %s), 'B') || "
+                    "setweight(to_tsvector('english', %s), 'C')")
+
+    def create(self, cursor):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (bug_id bigint PRIMARY KEY REFERENCES api_bug (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_document ON {self.table} USING GIN (document)")
+
+    def drop(self, cursor): cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def write(self, cursor, documents):
+        cursor.executemany(f"INSERT INTO {self.table} (bug_id, document) VALUES (%s, {self.document_sql}) ON CONFLICT (bug_id) DO UPDATE SET document = EXCLUDED.document", documents)
+
+    def clear(self, cursor): cursor.execute(f"TRUNCATE {self.table}")
+
+    def filter(self, queryset, words, ranked=True):
+        query = ' & '.join(words) + ':*' # Words are \w+ only, so they need no escaping in to_tsquery
+        bugs = queryset.model._meta.db_table
+        queryset = queryset.extra(tables=[self.table], where=[f'{self.table}.bug_id = "{bugs}".id', f"{self.table}.document @@ to_tsquery('english', %s)"], params=[query])
+        if not ranked: return queryset
+        return queryset.extra(select={'search_rank': f"ts_rank({self.table}.document, to_tsquery('english', %s))"}, select_params=[query]).order_by('-search_rank', '-created_at')
+
+    def available(self, cursor):
+        cursor.execute("SELECT to_regclass(%s)", [self.table])
+        return cursor.fetchone()[0] is not None
+
+
+BACKENDS = {'sqlite': SqliteSearchBackend, 'postgresql': PostgresSearchBackend}
+_available = {} # connection alias -> backend or None, checked once per process
+
+def get_backend():
+    """ The backend searches should query: index_backend(), unless SEARCH_FULL_TEXT is off. """
+    if not getattr(settings, 'SEARCH_FULL_TEXT', True): return None
+    return index_backend()
+
+def index_backend():
+    """ The full-text backend of the default connection if its index exists (whatever SEARCH_FULL_TEXT says), else None. """
+    backend_class = BACKENDS.get(connection.vendor)
+    if backend_class is None: return None
+    if connection.alias not in _available:
+        backend = backend_class()
+        with connection.cursor() as cursor: _available[connection.alias] = backend if backend.available(cursor) else None
+        if _available[connection.alias] is None: logger.warning(f"No {backend.name} search index (run migrations); bug search falls back to LIKE scans.")
+    return _available[connection.alias]
+
+
+def index_documents(documents):
+    """ Writes (bug pk, bug_id, subject, description) documents, replacing earlier ones of the same bugs. Call inside the write's transaction. """
+    documents = [tuple(document) for document in documents]
+    backend = index_backend()
+    if not documents or backend is None: return 0
+    with connection.cursor() as cursor: backend.write(cursor, documents)
+    return len(documents)
+
+def rebuild(bug_model, revision_model, batch_size=2000):
+    """ Rewrites the whole index from the bugs and their latest revisions. Returns the number of documents. """
+    backend = index_backend()
+    if backend is None: return 0
+    with connection.cursor() as cursor: backend.clear(cursor)
+    latest = revision_model.objects.filter(bug=OuterRef('pk')).order_by('-number').values('data')[:1]
+    bugs = bug_model.objects.order_by('pk').annotate(latest_data=Subquery(latest)).values_list('pk', 'bug_id', 'subject', 'latest_data')
+    written = 0; last_pk = 0
+    while True:
+        batch = list(bugs.filter(pk__gt=last_pk)[:batch_size])
+        if not batch: return written
+        written += index_documents((pk, bug_id, subject, zlib.decompress(bytes(data)).decode('utf-8', 'surrogateescape') if data else '') for pk, bug_id, subject, data in batch)
+        last_pk = batch[-1][0]
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """ SearchFilter that uses the full-text index when there is one (and the view's search_fields otherwise). Views with ranked_search = False keep their own order. """
+
+    def filter_queryset(self, request, queryset, view):
+        words = search_words(request.query_params.get(self.search_param, ''))
+        backend = get_backend() if words else None
+        if backend is None: return super().filter_queryset(request, queryset, view)
+        return backend.filter(queryset, words, ranked=getattr(view, 'ranked_search', True))
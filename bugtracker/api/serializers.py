@@ -1,20 +1,42 @@
 # api/serializers.py
 from rest_framework import serializers
-from .models import Bug
+from .models import Bug, BugRevision
 # Import User model, Group model, password validation
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 
-class BugSerializer(serializers.ModelSerializer):
-    """ Serializer for displaying Bug details. """
+class BugListSerializer(serializers.ModelSerializer):
+    """ Serializer for bug lists: the summary column only, no revision lookups. """
     status = serializers.CharField(source='get_status_display', read_only=True)
     priority = serializers.CharField(source='get_priority_display', read_only=True)
     status_key = serializers.CharField(source='status', read_only=True) # Expose internal key
     class Meta:
         model = Bug
-        fields = [ 'id', 'bug_id', 'subject', 'description', 'status', 'status_key', 'priority', 'created_at', 'updated_at', 'modified_count', ]
-        read_only_fields = [ 'id', 'bug_id', 'subject', 'description', 'priority', 'created_at', 'updated_at', 'modified_count' ]
+        fields = [ 'id', 'bug_id', 'subject', 'summary', 'status', 'status_key', 'priority', 'created_at', 'updated_at', 'modified_count', ]
+        read_only_fields = fields
+
+class BugSerializer(BugListSerializer):
+    """ Serializer for displaying Bug details, including the full current description (latest revision). """
+    description = serializers.CharField(read_only=True)
+    class Meta(BugListSerializer.Meta):
+        fields = BugListSerializer.Meta.fields[:4] + ['description'] + BugListSerializer.Meta.fields[4:]
+        read_only_fields = fields
+
+class BugRevisionSerializer(serializers.ModelSerializer):
+    """ Revision metadata for a bug's history list (the text is fetched per revision). """
+    modified_at = serializers.DateTimeField(source='modification_log.modified_at', read_only=True, default=None)
+    class Meta:
+        model = BugRevision
+        fields = ['number', 'subject', 'size', 'created_at', 'modified_at']
+        read_only_fields = fields
+
+class BugRevisionDetailSerializer(BugRevisionSerializer):
+    """ One revision with its decompressed description. """
+    description = serializers.CharField(source='text', read_only=True)
+    class Meta(BugRevisionSerializer.Meta):
+        fields = BugRevisionSerializer.Meta.fields + ['description']
+        read_only_fields = fields
 
 class BugStatusUpdateSerializer(serializers.Serializer):
     """ Serializer for validating status updates via PATCH. """
@@ -2,16 +2,27 @@
 import email
 import imaplib
 import logging
-import re # Import regex module
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
 from email.header import decode_header
+from itertools import chain
+from typing import Optional
 
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import F
 
-from .models import Bug, BugModificationLog, ProcessedEmail # Import Bug model
+from .email_parser import BUG_ID_RE, PRIORITY_RE, parse_message, parse_date_header
+from .imap_utils import connect_imap, uid_sequence_set, iter_fetch_response, parse_fetch_response, find_text_plain_part, decode_body_section
+from .reply_parser import is_reply, strip_reply
+from . import dead_letters, locks, metrics, polling
+from .dedupe import seen_message_ids, prune_processed_emails
+from .models import DEFAULT_MAILBOX, Bug, DeadLetterEmail, Mailbox, MailboxSyncState
+from .persistence import ParsedEmail, persist_batch, PROCESSED, DUPLICATE, SKIPPED, FAILED
 
 logger = logging.getLogger(__name__)
 
@@ -62,7 +73,7 @@ def parse_priority_from_body(body_text):
     # Regex to find "Priority:" (case-insensitive) at the start of a line,
     # followed by optional space, then the priority level.
     # It captures 'high', 'medium', or 'low' case-insensitively.
-    match = re.search(r'^\s*priority:\s*(high|medium|low)\s*$', body_text, re.IGNORECASE | re.MULTILINE)
+    match = PRIORITY_RE.search(body_text) # Precompiled in email_parser
 
     if match:
         parsed_level = match.group(1).lower()
@@ -79,117 +90,654 @@ def parse_priority_from_body(body_text):
 # --- END Priority Parsing Helper ---
 
 
+
+
+# --- Message Ingestion ---
+def parse_bug_headers(msg, label):
+    """
+    Extracts (message_id, subject, bug_id, reply) from a message's headers; `reply` is whether it answers earlier mail.
+    Returns None (and logs why) if the email has no Message-ID or no Bug ID in its subject.
+    """
+    message_id_header = msg.get('Message-ID')
+    if not message_id_header:
+        logger.warning(f"Email {label} missing Message-ID. Skipping."); metrics.skip('no_message_id'); return None
+    message_id = message_id_header.strip()
+    subject_header = msg.get('Subject', ''); subject = decode_subject(subject_header)
+    match = BUG_ID_RE.search(subject)
+    if not match:
+        logger.warning(f"No Bug ID in subject: '{subject}'. Skipping {message_id}."); metrics.skip('no_bug_id'); return None
+    return message_id, subject, match.group(1).strip(), is_reply(msg)
+
+def build_parsed_email(message_id, subject, bug_id, reply, description):
+    """
+    Combines parsed headers and the plain text body. Quoted history and signatures are
+    stripped from the body first (EMAIL_STRIP_QUOTED, see reply_parser.py), so priority
+    comes from the new text only. Quotes and signatures are kept unless `reply`.
+    """
+    if getattr(settings, 'EMAIL_STRIP_QUOTED', True):
+        body = description; description = strip_reply(body, reply)
+        metrics.inc('bugtracker_ingest_stripped_chars_total', len(body) - len(description))
+    return ParsedEmail(message_id=message_id, bug_id=bug_id, subject=subject, description=description, priority=parse_priority_from_body(description))
+
+def parse_email(raw_email, label, keep_date=False):
+    """
+    Parses one raw RFC822 message into a ParsedEmail (no DB access).
+    `label` identifies the message in log lines (e.g. "ID 3" or "UID 17").
+    With `keep_date` the modification is dated by the email's Date header (backfills).
+    Returns None if the email cannot become a bug update (no Message-ID, Bug ID or plain text body).
+    """
+    msg, stats = parse_message(raw_email, getattr(settings, 'EMAIL_MAX_BODY_BYTES', 256 * 1024)) # Attachments are never buffered
+    logger.debug(f"Parsed email {label}: {stats}.")
+    headers = parse_bug_headers(msg, label)
+    if headers is None: return None
+    description = get_plain_text_body(msg)
+    if description is None:
+        logger.warning(f"No plain text body in {headers[0]}. Skipping."); metrics.skip('no_body'); return None
+    parsed = build_parsed_email(*headers, description)
+    if keep_date: parsed.modified_at = parse_date_header(msg.get('Date'))
+    return parsed
+
+def ingest_message(raw_email, label):
+    """ Parses and persists a single raw message. Returns PROCESSED, DUPLICATE, SKIPPED or FAILED. """
+    parsed = parse_email(raw_email, label)
+    if parsed is None: return SKIPPED
+    return persist_batch([parsed])[0]
+# --- END Message Ingestion ---
+
+
+
+
+# --- Chunk Fetch Strategies ---
+HEADER_FETCH_ITEMS = '(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID SUBJECT IN-REPLY-TO REFERENCES)])'
+
+@dataclass
+class FetchedChunk:
+    """ Result of fetching one UID chunk: parsed emails ready to persist, plus UIDs settled during the fetch. """
+    parsed: list = field(default_factory=list) # [(uid, ParsedEmail)] in UID order
+    duplicates: list = field(default_factory=list) # Already processed; marked Seen without downloading the body
+    skipped: list = field(default_factory=list) # Unusable emails; left unseen
+    failed: list = field(default_factory=list) # Fetch/parse errors; dead-lettered for isolated retries
+    errors: dict = field(default_factory=dict) # uid -> (stage, error, message_id) for each failed UID
+    bytes: int = 0 # Message data downloaded (headers, bodies), for the per-run byte budget
+
+    def fail(self, uid, stage, error, message_id=''):
+        self.failed.append(uid); self.errors[uid] = (stage, str(error), message_id)
+
+def fetch_full_messages(mail, chunk):
+    """ Downloads each message in full (BODY.PEEK[]) and parses it locally. """
+    result = FetchedChunk()
+    with metrics.stage('fetch'): res, msg_data = mail.uid('FETCH', uid_sequence_set(chunk), '(UID BODY.PEEK[])')
+    if res != 'OK':
+        logger.warning(f"Failed to fetch UIDs {uid_sequence_set(chunk)}.")
+        for uid in chunk: result.fail(uid, 'fetch', f"UID FETCH returned {res}")
+        return result
+    for uid, raw_email in iter_fetch_response(msg_data):
+        result.bytes += len(raw_email)
+        try:
+            with metrics.stage('parse'): parsed = parse_email(raw_email, f"UID {uid}")
+        except Exception as processing_error:
+            logger.error(f"Error processing email UID {uid}: {processing_error}", exc_info=True); result.fail(uid, 'parse', processing_error); continue
+        if parsed is None: result.skipped.append(uid)
+        else: result.parsed.append((uid, parsed))
+    return result
+
+def fetch_header_first(mail, chunk):
+    """
+    Two-phase fetch that avoids downloading emails we would reject:
+    1. Message-ID/Subject/threading headers plus BODYSTRUCTURE for the whole chunk.
+    2. Emails without a Bug ID, without a text/plain part, or already processed are settled on headers alone.
+    3. Only the MIME section holding the text/plain body is downloaded for the rest
+       (one UID FETCH per distinct section path, usually one or two per chunk), and only
+       its first EMAIL_MAX_BODY_BYTES bytes (a partial fetch), the cap full-message parsing applies.
+    """
+    result = FetchedChunk()
+    with metrics.stage('fetch'): res, msg_data = mail.uid('FETCH', uid_sequence_set(chunk), HEADER_FETCH_ITEMS)
+    if res != 'OK':
+        logger.warning(f"Failed to fetch headers for UIDs {uid_sequence_set(chunk)}.")
+        for uid in chunk: result.fail(uid, 'fetch', f"UID FETCH (headers) returned {res}")
+        return result
+
+    candidates = [] # (uid, (message_id, subject, bug_id), (section, encoding, charset))
+    for message in parse_fetch_response(msg_data):
+        if 'UID' not in message: continue # Unsolicited FETCH (e.g. a flag change)
+        uid = int(message['UID'])
+        try:
+            with metrics.stage('parse'):
+                header_bytes = next((value for key, value in message.items() if key.startswith('BODY[HEADER')), None) or b''
+                result.bytes += len(header_bytes)
+                headers = parse_bug_headers(email.message_from_bytes(header_bytes), f"UID {uid}")
+                part = find_text_plain_part(message.get('BODYSTRUCTURE')) if headers is not None else None
+            if headers is None: result.skipped.append(uid); continue
+        except Exception as processing_error:
+            logger.error(f"Error processing headers of email UID {uid}: {processing_error}", exc_info=True); result.fail(uid, 'parse', processing_error); continue
+        if part is None:
+            logger.warning(f"No plain text body in {headers[0]}. Skipping."); metrics.skip('no_body'); result.skipped.append(uid); continue
+        candidates.append((uid, headers, part))
+
+    # Drop already processed Message-IDs before any body is downloaded
+    message_ids = {headers[0] for _, headers, _ in candidates}
+    with metrics.stage('dedupe'): processed = seen_message_ids(message_ids)
+    wanted = []
+    for uid, headers, part in sorted(candidates):
+        if headers[0] in processed:
+            logger.info(f"Email {headers[0]} already processed. Marking Seen."); result.duplicates.append(uid)
+        else: wanted.append((uid, headers, part))
+
+    bodies = {}
+    by_section = {}
+    limit = getattr(settings, 'EMAIL_MAX_BODY_BYTES', 256 * 1024)
+    for uid, _, (section, _, _) in wanted: by_section.setdefault(section, []).append(uid)
+    for section, uids in by_section.items():
+        with metrics.stage('fetch'): res, msg_data = mail.uid('FETCH', uid_sequence_set(uids), f'(UID BODY.PEEK[{section}]<0.{limit}>)')
+        if res != 'OK':
+            logger.warning(f"Failed to fetch section {section} for UIDs {uid_sequence_set(uids)}."); continue
+        for message in parse_fetch_response(msg_data):
+            body = message.get(f'BODY[{section}]<0>', message.get(f'BODY[{section}]'))
+            if 'UID' in message and body is not None: bodies[int(message['UID'])] = body[:limit] # Also capped if the server ignored the partial
+    result.bytes += sum(len(body) for body in bodies.values())
+
+    for uid, headers, (section, encoding, charset) in wanted:
+        if uid not in bodies: result.fail(uid, 'fetch', f"Body section {section} not returned", headers[0]); continue
+        try:
+            with metrics.stage('parse'): result.parsed.append((uid, build_parsed_email(*headers, decode_body_section(bodies[uid], encoding, charset))))
+        except Exception as processing_error:
+            logger.error(f"Error decoding body of email UID {uid}: {processing_error}", exc_info=True); result.fail(uid, 'parse', processing_error, headers[0])
+    return result
+# --- END Chunk Fetch Strategies ---
+
+
+@dataclass
+class RunBudget:
+    """
+    Limits on the work one ingestion run may do, so a large backlog is drained in
+    bounded slices (flat memory, runs well inside Celery time limits) instead of one
+    long task. A limit of None means unlimited. Checked between UID chunks.
+    """
+    max_messages: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+    messages: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+    stopped_early: bool = False # A limit was hit with UIDs left and the checkpoint at the stopping point
+    cancelled: bool = False # Set by cancel(), e.g. when the run loses its ingestion lease
+
+    @classmethod
+    def from_settings(cls, mailbox=None):
+        """ The Mailbox's per-run limits when set, else INGEST_MAX_MESSAGES / INGEST_MAX_SECONDS / INGEST_MAX_BYTES (0 disables a limit). """
+        def limit(field, name):
+            value = getattr(mailbox, field, None)
+            return (getattr(settings, name, 0) if value is None else value) or None
+        return cls(max_messages=limit('max_messages_per_run', 'INGEST_MAX_MESSAGES'), max_seconds=limit('max_seconds_per_run', 'INGEST_MAX_SECONDS'),
+                   max_bytes=limit('max_bytes_per_run', 'INGEST_MAX_BYTES'))
+
+    def chunk_size(self, batch_size):
+        """ UIDs the next chunk may take (0 once the run is over budget). """
+        if self.spent(): return 0
+        return batch_size if self.max_messages is None else min(batch_size, self.max_messages - self.messages)
+
+    def charge(self, messages, num_bytes):
+        self.messages += messages; self.bytes += num_bytes
+
+    def cancel(self):
+        """ Ends the run at the next chunk boundary (thread-safe: a single flag write). """
+        self.cancelled = True
+
+    def spent(self):
+        return (self.cancelled or (self.max_messages is not None and self.messages >= self.max_messages)
+                or (self.max_seconds is not None and time.monotonic() - self.started >= self.max_seconds)
+                or (self.max_bytes is not None and self.bytes >= self.max_bytes))
+
+def open_sync_state(mail, folder, mailbox):
+    """
+    Selects `folder` of a Mailbox, validates its checkpoint against UIDVALIDITY and searches for UIDs
+    above it; the result reschedules the folder's next adaptive poll (see polling.py).
+    Returns (MailboxSyncState, sorted new UIDs), or (None, []) on IMAP failure.
+    """
+    with metrics.stage('select'): status, _ = mail.select(folder)
+    if status != 'OK':
+        logger.error(f"Failed to select folder '{folder}'."); return None, []
+    _, validity_data = mail.response('UIDVALIDITY')
+    uid_validity = int(validity_data[0]) if validity_data and validity_data[0] else None
+
+    state, _ = MailboxSyncState.objects.get_or_create(mailbox=mailbox, folder=folder); state.mailbox = mailbox
+    if state.uid_validity != uid_validity:
+        if state.uid_validity is not None:
+            logger.warning(f"UIDVALIDITY of '{folder}' changed ({state.uid_validity} -> {uid_validity}). Full resync.")
+            # Dedupe records of mail older than MAILBOX_RETENTION_DAYS may be pruned: refetching it would count it again.
+            # The day after the cutoff, so mail received on the cutoff day itself is not taken either.
+            retention_days = settings.MAILBOX_RETENTION_DAYS
+            state.resync_since = (timezone.now() - timedelta(days=retention_days - 1)).date() if retention_days > 0 else None
+        state.uid_validity = uid_validity; state.last_uid = 0
+        state.save(update_fields=['uid_validity', 'last_uid', 'resync_since', 'updated_at'])
+
+    criteria = f'UID {state.last_uid + 1}:*'
+    with metrics.stage('search'):
+        status, messages = mail.uid('SEARCH', None, criteria)
+        if status == 'OK' and state.resync_since: # Listed first: mail arriving before the second search is in its result
+            listed = messages; status, messages = mail.uid('SEARCH', None, f'{criteria} SINCE {state.resync_since:%d-%b-%Y}')
+    if status != 'OK':
+        logger.error("Failed to search emails."); return None, []
+    # 'n:*' always matches the highest UID, even when it is below n
+    uids = [uid for uid in map(int, messages[0].split()) if uid > state.last_uid]
+    if state.resync_since and not uids: # Resync done; what is left predates the dedupe records, so the checkpoint moves past it
+        older = [uid for uid in map(int, listed[0].split()) if uid > state.last_uid]
+        if older: logger.info(f"Resync of '{folder}' skipped {len(older)} emails received before {state.resync_since} (MAILBOX_RETENTION_DAYS).")
+        state.last_uid = max(older, default=state.last_uid); state.resync_since = None
+        state.save(update_fields=['last_uid', 'resync_since', 'updated_at'])
+    parked = dead_letters.parked_uids(mailbox, folder, uid_validity, state.last_uid) if uids else set() # Left to retry_dead_letters (e.g. after a resync)
+    uids = sorted(uid for uid in uids if uid not in parked)
+    polling.record_poll(state, len(uids))
+    return state, uids
+
+def park_failures(mailbox, folder, uid_validity, failures):
+    """
+    Dead-letters failed UIDs (uid -> (stage, error, message_id)) so the checkpoint can move
+    past them. Returns the UIDs that could not be parked; the checkpoint must stay below those.
+    """
+    if not failures: return []
+    try:
+        dead_letters.record_failures(mailbox, folder, uid_validity, failures)
+        metrics.inc('bugtracker_ingest_dead_lettered_total', len(failures)); return []
+    except Exception as park_error:
+        logger.error(f"Could not dead-letter UIDs {sorted(failures)} of '{folder}': {park_error}", exc_info=True); return sorted(failures)
+
+def chunk_fetcher():
+    """ The chunk fetch strategy selected by IMAP_HEADER_FIRST. """
+    return fetch_header_first if getattr(settings, 'IMAP_HEADER_FIRST', True) else fetch_full_messages
+
+def sync_mailbox(mail, folder='inbox', batch_size=100, budget=None, on_progress=None, mailbox=None):
+    """
+    Incrementally ingests a folder of `mailbox` (the default Mailbox if None) using its
+    UID checkpoint (MailboxSyncState).
+    Only UIDs above the stored last_uid are fetched, so the cost of a poll does not
+    depend on folder size or on \\Seen flags set by other clients. A changed
+    UIDVALIDITY invalidates the checkpoint and triggers a full resync (already
+    processed Message-IDs are then skipped as duplicates).
+    Messages are fetched with UID FETCH in chunks of `batch_size` (header-first unless
+    IMAP_HEADER_FIRST is False) and flagged Seen with one UID STORE per chunk.
+    An optional RunBudget stops the run between chunks (the checkpoint is saved per
+    chunk, so the next run resumes there); `on_progress(dict)` is called after each chunk.
+    Returns (processed, skipped).
+    """
+    mailbox = mailbox or Mailbox.default()
+    state, uids = open_sync_state(mail, folder, mailbox)
+    if state is None: return 0, 0
+    logger.info(f"Found {len(uids)} new emails in '{folder}' after UID {state.last_uid} (batch size {batch_size}).")
+    processed_count = 0; skipped_count = 0
+    checkpoint_held = False # Set once a failure cannot be dead-lettered; later chunks are processed but the checkpoint stays below it
+
+    fetch_chunk = chunk_fetcher()
+    budget = budget or RunBudget()
+
+    start = 0
+    while start < len(uids):
+        size = budget.chunk_size(batch_size)
+        if not size:
+            # Only ask for an immediate follow-up run if it can make progress past a failure-held checkpoint
+            budget.stopped_early = not checkpoint_held
+            logger.info(f"Run budget reached after {budget.messages} emails / {budget.bytes} bytes; {len(uids) - start} left in '{folder}'.")
+            break
+        chunk = uids[start:start + size]; start += size
+        seen_uids = []; failures = {}; handled = 0; fetched = None
+        try:
+            fetched = fetch_chunk(mail, chunk)
+            seen_uids = list(fetched.duplicates); failures = dict(fetched.errors)
+            handled = len(fetched.duplicates) + len(fetched.skipped) + len(fetched.failed)
+            skipped_count += handled
+
+            # One set-based write for the whole chunk
+            persist_errors = {}
+            with metrics.stage('persist'): outcomes = persist_batch([parsed for _, parsed in fetched.parsed], errors=persist_errors)
+            metrics.count_outcomes(outcomes, duplicate=len(fetched.duplicates), skipped=len(fetched.skipped), failed=len(fetched.failed))
+            for (uid, parsed), outcome in zip(fetched.parsed, outcomes):
+                if outcome in (PROCESSED, DUPLICATE): seen_uids.append(uid)
+                elif outcome == FAILED: failures[uid] = ('persist', persist_errors.get(parsed.message_id, 'Persist failed'), parsed.message_id)
+                if outcome == PROCESSED: processed_count += 1
+                else: skipped_count += 1
+                handled += 1
+            # UIDs expunged between SEARCH and FETCH return nothing; the checkpoint moves past them
+
+            if seen_uids:
+                with metrics.stage('store'): mail.uid('STORE', uid_sequence_set(seen_uids), '+FLAGS', '(\\Seen)')
+                logger.debug(f"Marked {len(seen_uids)} emails as Seen.")
+        except Exception as chunk_error:
+            logger.error(f"Error processing UID chunk {uid_sequence_set(chunk)}: {chunk_error}", exc_info=True)
+            failures = {uid: failures.get(uid, ('fetch', f"{type(chunk_error).__name__}: {chunk_error}", '')) for uid in chunk}
+            skipped_count += len(chunk) - handled
+            metrics.count_outcomes(failed=len(chunk) - handled)
+
+        failed_uids = park_failures(mailbox, folder, state.uid_validity, failures)
+        if not checkpoint_held:
+            # Failures that could not be dead-lettered are retried on the next run, so never checkpoint past them
+            state.last_uid = min(failed_uids) - 1 if failed_uids else chunk[-1]
+            checkpoint_held = bool(failed_uids)
+            state.save(update_fields=['last_uid', 'updated_at'])
+        budget.charge(len(chunk), fetched.bytes if fetched else 0)
+        metrics.inc('bugtracker_ingest_fetched_bytes_total', fetched.bytes if fetched else 0)
+        if on_progress:
+            on_progress({'folder': folder, 'processed': processed_count, 'skipped': skipped_count, 'last_uid': state.last_uid, 'remaining': len(uids) - start})
+
+    return processed_count, skipped_count
+
+
+# --- Fan-out Ingestion (Celery chord) ---
+def bug_partition(bug_id, partitions):
+    """ Stable partition of a Bug ID (crc32, not hash(), so every worker agrees). """
+    return zlib.crc32(bug_id.encode('utf-8')) % partitions
+
+def fan_out_mailbox(mail, folder='inbox', batch_size=100, partitions=4, budget=None, mailbox=None):
+    """
+    Fetcher stage of the fan-out pipeline. New messages are fetched and parsed chunk by
+    chunk as in sync_mailbox, but instead of being persisted inline they are partitioned
+    by Bug ID and handed to a chord: one persist_email_partition task per non-empty
+    partition (routed to INGEST_PERSIST_QUEUE), with finalize_email_ingest as callback.
+    All updates to one bug land in the same partition, in UID order, so they are applied
+    in message order while different bugs are written by parallel workers.
+    Only one fan-out per folder is in flight; the checkpoint moves when the callback runs.
+    A RunBudget bounds the fetch window; if it stops early the callback re-enqueues
+    process_incoming_emails to fetch the next window.
+    Returns the chord's AsyncResult, or None if nothing was dispatched.
+    """
+    mailbox = mailbox or Mailbox.default()
+    state, uids = open_sync_state(mail, folder, mailbox)
+    if state is None: return None
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'INGEST_FANOUT_TIMEOUT', 15 * 60))
+    if state.fanout_started_at and state.fanout_started_at > stale_before:
+        logger.info(f"Fan-out for '{folder}' in flight since {state.fanout_started_at}. Skipping."); return None
+    if not uids: return None
+    # Claim the folder; a concurrent fetcher that read the same state loses the conditional update
+    if not MailboxSyncState.objects.filter(pk=state.pk, fanout_started_at=state.fanout_started_at).update(fanout_started_at=timezone.now()):
+        logger.info(f"Another fetcher claimed '{folder}'. Skipping."); return None
+    logger.info(f"Found {len(uids)} new emails in '{folder}' after UID {state.last_uid}. Fanning out over {partitions} partitions.")
+
+    fetch_chunk = chunk_fetcher()
+    budget = budget or RunBudget()
+    buckets = [[] for _ in range(partitions)]
+    settled = {'mailbox': mailbox.name, 'folder': folder, 'uid_validity': state.uid_validity, 'last_uid': state.last_uid, 'seen': [], 'failed': [], 'skipped': 0, 'backlog': False} # failed: [uid, stage, error, message_id]
+    start = 0
+    while start < len(uids):
+        size = budget.chunk_size(batch_size)
+        if not size:
+            settled['backlog'] = True
+            logger.info(f"Run budget reached after {budget.messages} emails; {len(uids) - start} left in '{folder}' for the next window."); break
+        chunk = uids[start:start + size]; start += size
+        settled['last_uid'] = chunk[-1]
+        try:
+            fetched = fetch_chunk(mail, chunk)
+        except Exception as chunk_error:
+            logger.error(f"Error fetching UID chunk {uid_sequence_set(chunk)}: {chunk_error}", exc_info=True)
+            settled['failed'] += [[uid, 'fetch', f"{type(chunk_error).__name__}: {chunk_error}", ''] for uid in chunk]
+            settled['skipped'] += len(chunk); budget.charge(len(chunk), 0); metrics.count_outcomes(failed=len(chunk)); continue
+        budget.charge(len(chunk), fetched.bytes)
+        metrics.inc('bugtracker_ingest_fetched_bytes_total', fetched.bytes)
+        metrics.count_outcomes(duplicate=len(fetched.duplicates), skipped=len(fetched.skipped), failed=len(fetched.failed))
+        settled['seen'] += fetched.duplicates; settled['failed'] += [[uid, *fetched.errors[uid]] for uid in fetched.failed]
+        settled['skipped'] += len(fetched.duplicates) + len(fetched.skipped) + len(fetched.failed)
+        for uid, parsed in fetched.parsed:
+            buckets[bug_partition(parsed.bug_id, partitions)].append([uid, parsed.to_dict()])
+
+    header = [persist_email_partition.s(bucket) for bucket in buckets if bucket]
+    if not header: # Nothing to persist; settle the run on this connection
+        budget.stopped_early = commit_fan_out(mail, [], settled, mailbox)[2]; return None
+    run = metrics.current()
+    if run is not None: settled['metrics'] = run.to_dict() # The callback records the run once the partitions are persisted
+    try:
+        return chord(header)(finalize_email_ingest.s(settled))
+    except Exception:
+        MailboxSyncState.objects.filter(pk=state.pk).update(fanout_started_at=None) # Broker unavailable: let the next run retry
+        raise
+
+def commit_fan_out(mail, partition_results, settled, mailbox=None):
+    """
+    Final stage: flags processed/duplicate UIDs Seen, dead-letters failures, advances the
+    checkpoint (held below a failure only if it could not be dead-lettered, as in
+    sync_mailbox) and releases the folder.
+    Returns (processed, skipped, resume); `resume` means the run's budget left UIDs behind
+    and the checkpoint reached the stopping point, so an immediate next run makes progress.
+    """
+    mailbox = mailbox or Mailbox.objects.get(name=settled.get('mailbox', DEFAULT_MAILBOX)); folder = settled['folder']; seen = list(settled['seen'])
+    failures = {uid: (stage, error, message_id) for uid, stage, error, message_id in settled['failed']}
+    processed_count = 0; skipped_count = settled['skipped']
+    partition_results = list(chain.from_iterable(partition_results))
+    metrics.count_outcomes(outcome for _, outcome, *_ in partition_results)
+    for uid, outcome, *detail in partition_results:
+        if outcome in (PROCESSED, DUPLICATE): seen.append(uid)
+        elif outcome == FAILED: failures[uid] = ('persist', *detail) if detail else ('persist', 'Persist failed', '')
+        if outcome == PROCESSED: processed_count += 1
+        else: skipped_count += 1
+
+    if seen:
+        seen.sort(); step = max(getattr(settings, 'IMAP_FETCH_BATCH_SIZE', 100), 1)
+        for start in range(0, len(seen), step): # Bounded command length for scattered UIDs
+            with metrics.stage('store'): mail.uid('STORE', uid_sequence_set(seen[start:start + step]), '+FLAGS', '(\\Seen)')
+        logger.debug(f"Marked {len(seen)} emails as Seen.")
+
+    failed = park_failures(mailbox, folder, settled['uid_validity'], failures)
+    with transaction.atomic():
+        state = MailboxSyncState.objects.select_for_update().get(mailbox=mailbox, folder=folder)
+        if state.uid_validity == settled['uid_validity']:
+            state.last_uid = min(failed) - 1 if failed else settled['last_uid']
+        else:
+            logger.warning(f"UIDVALIDITY of '{folder}' changed during fan-out. Checkpoint not advanced.")
+        state.fanout_started_at = None
+        state.save(update_fields=['last_uid', 'fanout_started_at', 'updated_at'])
+    logger.info(f"Fan-out of '{folder}' finished. Processed: {processed_count}, Skipped: {skipped_count}.")
+    return processed_count, skipped_count, bool(settled.get('backlog')) and not failed
+
+@shared_task
+def persist_email_partition(items):
+    """
+    Persist stage: writes one Bug ID partition, given as [uid, ParsedEmail dict] pairs in
+    UID order, in IMAP_FETCH_BATCH_SIZE slices. Returns [[uid, outcome], ...]; FAILED
+    entries carry [uid, outcome, error, message_id] for the dead-letter queue.
+    """
+    step = max(getattr(settings, 'IMAP_FETCH_BATCH_SIZE', 100), 1); results = []
+    with metrics.collect() as run: # Persist timings only; the outcomes are counted by the callback
+        for start in range(0, len(items), step):
+            batch = items[start:start + step]; errors = {}
+            with metrics.stage('persist'): outcomes = persist_batch([ParsedEmail.from_dict(data) for _, data in batch], errors=errors)
+            results += [[uid, outcome] + ([errors.get(data['message_id'], 'Persist failed'), data['message_id']] if outcome == FAILED else [])
+                        for (uid, data), outcome in zip(batch, outcomes)]
+    metrics.flush_totals(run)
+    return results
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def finalize_email_ingest(self, partition_results, settled):
+    """ Chord callback: aggregates the partition outcomes and commits them (see commit_fan_out). """
+    mail = None; mailbox = Mailbox.objects.get(name=settled.get('mailbox', DEFAULT_MAILBOX))
+    with metrics.collect(metrics.RunMetrics.from_dict(settled.get('metrics'))) as run:
+        try:
+            with metrics.stage('login'): mail = connect_imap(mailbox)
+            with metrics.stage('select'): mail.select(settled['folder'])
+            processed_count, skipped_count, resume = commit_fan_out(mail, partition_results, settled, mailbox)
+            metrics.record_run(run, stopped_early=resume, mailbox=mailbox.name, folder=settled['folder'])
+            if resume: process_incoming_emails.apply_async(kwargs={'folder': settled['folder'], 'mailbox': mailbox.name}) # The budget cut this window short: fetch the next one now
+            return {'processed': processed_count, 'skipped': skipped_count}
+        except imaplib.IMAP4.error as imap_error:
+            logger.error(f"IMAP error finalizing fan-out: {imap_error}", exc_info=True)
+            raise self.retry(exc=imap_error)
+        finally:
+            if mail is not None:
+                try: mail.logout()
+                except Exception as logout_err: logger.error(f"IMAP logout error: {logout_err}")
+# --- END Fan-out Ingestion ---
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def process_incoming_emails(self):
+def process_incoming_emails(self, batch_size=None, folder='inbox', mailbox=DEFAULT_MAILBOX):
+    """
+    Celery task to fetch new emails from one folder of a Mailbox (given by name; UID
+    checkpointed, see sync_mailbox), parse them (including priority from body), and
+    create/update Bug records. Each run opens its own connection to that mailbox.
+    `batch_size` defaults to settings.IMAP_FETCH_BATCH_SIZE; 1 means one FETCH per message.
+    With INGEST_PARTITIONS > 1 this task only fetches and parses; persistence fans out
+    over a Celery chord (see fan_out_mailbox).
+    Each run stops at the mailbox's budgets (default: INGEST_MAX_*) and re-enqueues itself
+    until the backlog is drained; progress is published as the custom 'PROGRESS' task state.
+    Runs of a folder hold its 'process_incoming_emails:<mailbox>:<folder>' lease (see locks.py): an
+    invocation that finds it taken exits at once. The result reports counts and the lease
+    stats under 'lock'. Polls are enqueued by schedule_mailbox_polls at an adaptive rate.
+    """
+    logger.info(f"Starting email processing task for '{mailbox}/{folder}'...")
+    if batch_size is None: batch_size = getattr(settings, 'IMAP_FETCH_BATCH_SIZE', 100)
+    name = mailbox; mailbox = Mailbox.objects.filter(name=name, enabled=True).first()
+    if mailbox is None:
+        logger.warning(f"Mailbox '{name}' does not exist or is disabled. Skipping."); return {'mailbox': name, 'disabled': True}
+    budget = RunBudget.from_settings(mailbox)
+    def report_progress(meta):
+        if self.request.id and not self.request.is_eager: self.update_state(state='PROGRESS', meta=meta) # Only when running in a worker
+    result = {}; run_error = ''; deferred = False # A dispatched fan-out is recorded by its chord callback
+    with metrics.collect() as run, locks.lease(f'process_incoming_emails:{mailbox.name}:{folder}', on_lost=budget.cancel) as lease:
+        run.observe(metrics.STAGE_SECONDS, lease.wait_seconds, stage='lock')
+        if not lease.acquired:
+            logger.info(f"Another ingestion run holds the lease ({lease.holder}). Exiting.")
+            metrics.inc('bugtracker_ingest_lock_contended_total')
+            try: metrics.flush_totals(run)
+            except Exception as metrics_error: logger.error(f"Could not record lock contention: {metrics_error}")
+            return {'lock': lease.to_dict()}
+        try:
+            with metrics.stage('login'): mail = connect_imap(mailbox)
+            partitions = getattr(settings, 'INGEST_PARTITIONS', 1)
+            if partitions > 1:
+                chord_result = fan_out_mailbox(mail, folder, max(batch_size, 1), partitions, budget, mailbox)
+                deferred = chord_result is not None; result['chord'] = chord_result.id if chord_result else None
+                logger.info(f"Finished fetching. Fan-out chord: {chord_result.id if chord_result else 'not dispatched'}.")
+            else:
+                result['processed'], result['skipped'] = sync_mailbox(mail, folder, max(batch_size, 1), budget, report_progress, mailbox)
+                logger.info(f"Finished. Processed: {result['processed']}, Skipped: {result['skipped']}.")
+
+        except imaplib.IMAP4.error as imap_error: # ... IMAP error handling ...
+            logger.error(f"IMAP connection error: {imap_error}", exc_info=True); run_error = f"IMAP error: {imap_error}"
+            try: self.retry(exc=imap_error)
+            except self.MaxRetriesExceededError: logger.critical("Max retries exceeded for email task.")
+        except Exception as e: # ... General error handling ...
+            logger.error(f"Unexpected error in email task: {e}", exc_info=True); run_error = f"{type(e).__name__}: {e}"
+        finally: # ... IMAP logout ...
+            if 'mail' in locals() and mail.state == 'SELECTED':
+                try: mail.close(); mail.logout(); logger.info("IMAP logged out.")
+                except Exception as logout_err: logger.error(f"IMAP logout error: {logout_err}")
+            if not deferred:
+                try: metrics.record_run(run, stopped_early=budget.stopped_early, error=run_error, mailbox=mailbox.name, folder=folder)
+                except Exception as metrics_error: logger.error(f"Could not record ingestion run metrics: {metrics_error}")
+    if budget.stopped_early and not lease.lost: # Re-enqueued only once the lease is released, or the next run would find it taken
+        logger.info("Backlog remains after this run's budget. Re-enqueueing.")
+        self.apply_async(kwargs={'batch_size': batch_size, 'folder': folder, 'mailbox': mailbox.name})
+    return {**result, 'lock': lease.to_dict()}
+
+
+@shared_task
+def schedule_mailbox_polls():
     """
-    Celery task to fetch emails, parse them (including priority from body),
-    and create/update Bug records.
+    Beat tick (INGEST_POLL_TICK_SECONDS): enqueues one process_incoming_emails per mailbox
+    folder whose adaptive poll is due (see polling.py). Reads only the database, never IMAP.
+    Returns the enqueued folders as '<mailbox>/<folder>'.
     """
-    logger.info("Starting email processing task...")
+    due = polling.claim_due_folders()
+    for mailbox, folder in due: process_incoming_emails.apply_async(kwargs={'folder': folder, 'mailbox': mailbox})
+    if due: logger.debug(f"Enqueued polls of {due}.")
+    return [f"{mailbox}/{folder}" for mailbox, folder in due]
+
+
+@shared_task
+def prune_dedupe_records(retention_days=None):
+    """ Daily (CELERY_BEAT_SCHEDULE): drops dedupe records older than MAILBOX_RETENTION_DAYS so the Message-ID index stays bounded. """
+    return prune_processed_emails(retention_days)
+
+
+# --- Dead-Letter Retries ---
+def replay_dead_letter(mail, entry):
+    """
+    Retries one dead-lettered email on its own (full fetch, parse, single-email persist)
+    and resolves it, or records the failure and schedules the next attempt.
+    Returns 'resolved', 'retry', 'exhausted' or 'discarded'.
+    """
+    stage, message_id = DeadLetterEmail.Stage.FETCH, entry.message_id
     try:
-        mail = imaplib.IMAP4_SSL(settings.IMAP_SERVER, settings.IMAP_PORT)
-        mail.login(settings.IMAP_USER, settings.IMAP_PASSWORD)
-        logger.info(f"Logged in as {settings.IMAP_USER}")
-        mail.select('inbox')
-        status, messages = mail.search(None, '(UNSEEN)')
-        if status != 'OK': # ... error handling ...
-            logger.error("Failed to search emails."); mail.logout(); return
-
-        email_ids = messages[0].split()
-        logger.info(f"Found {len(email_ids)} unread emails.")
-        processed_count = 0; skipped_count = 0
-
-        for email_id in email_ids:
-            msg_data = None
-            try:
-                res, msg_data = mail.fetch(email_id, '(RFC822)')
-                if res != 'OK' or not msg_data or not msg_data[0]: # ... error handling ...
-                     logger.warning(f"Failed to fetch email ID {email_id.decode()}. Skipping."); skipped_count += 1; continue
-                if isinstance(msg_data[0], tuple) and len(msg_data[0]) >= 2: raw_email = msg_data[0][1]
-                else: logger.warning(f"Unexpected structure in msg_data for email ID {email_id.decode()}. Skipping."); skipped_count += 1; continue
-
-                msg = email.message_from_bytes(raw_email)
-
-                # 1. Get Message-ID & Check if Processed
-                message_id_header = msg.get('Message-ID')
-                if not message_id_header: # ... skip if no Message-ID ...
-                    logger.warning(f"Email ID {email_id.decode()} missing Message-ID. Skipping."); skipped_count += 1; continue
-                message_id = message_id_header.strip()
-                if ProcessedEmail.objects.filter(message_id=message_id).exists(): # ... skip if processed ...
-                    logger.info(f"Email {message_id} already processed. Marking Seen."); mail.store(email_id, '+FLAGS', '\\Seen'); skipped_count += 1; continue
-
-                # 2. Parse Subject for Bug ID
-                subject_header = msg.get('Subject', ''); subject = decode_subject(subject_header)
-                match = re.search(r'Bug ID:\s*([\w-]+)', subject, re.IGNORECASE)
-                if not match: # ... skip if no Bug ID ...
-                    logger.warning(f"No Bug ID in subject: '{subject}'. Skipping {message_id}."); skipped_count += 1; continue
-                extracted_bug_id = match.group(1).strip()
-
-                # 3. Parse Body for Description AND Priority
-                description = get_plain_text_body(msg)
-                if description is None: # ... skip if no body ...
-                    logger.warning(f"No plain text body in {message_id}. Skipping."); skipped_count += 1; continue
-                # --- Call the new parser ---
-                parsed_priority = parse_priority_from_body(description)
-                # ---------------------------
-
-                # 4. Database Interaction
+        fetched = fetch_full_messages(mail, [entry.uid])
+        if fetched.failed:
+            stage, error, message_id = fetched.errors[entry.uid]; raise RuntimeError(error)
+        if not fetched.parsed and not fetched.skipped: # Expunged since it failed
+            dead_letters.close(entry, DeadLetterEmail.Status.DISCARDED, "Message no longer in the mailbox."); return 'discarded'
+        outcome = SKIPPED
+        if fetched.parsed:
+            parsed = fetched.parsed[0][1]; stage, message_id = DeadLetterEmail.Stage.PERSIST, parsed.message_id; errors = {}
+            outcome = persist_batch([parsed], errors=errors)[0]
+            if outcome == FAILED: raise RuntimeError(errors.get(parsed.message_id, 'Persist failed'))
+        if outcome in (PROCESSED, DUPLICATE): mail.uid('STORE', str(entry.uid), '+FLAGS', '(\\Seen)')
+        dead_letters.close(entry, DeadLetterEmail.Status.RESOLVED, f"Resolved on attempt {entry.attempts + 1} ({outcome})."); return 'resolved'
+    except Exception as retry_error:
+        logger.warning(f"Retry of dead-lettered UID {entry.uid} in '{entry.folder}' failed: {retry_error}")
+        dead_letters.mark_failed(entry, stage, retry_error, message_id)
+        return 'exhausted' if entry.status == DeadLetterEmail.Status.EXHAUSTED else 'retry'
+
+def replay_mailbox_dead_letters(mail, entries):
+    """ Replays one mailbox's due entries folder by folder; yields each entry's result. """
+    for folder in dict.fromkeys(entry.folder for entry in entries):
+        status, _ = mail.select(folder)
+        if status != 'OK':
+            logger.error(f"Failed to select folder '{folder}' for dead-letter retries."); continue
+        _, validity_data = mail.response('UIDVALIDITY')
+        uid_validity = int(validity_data[0]) if validity_data and validity_data[0] else None
+        for entry in (entry for entry in entries if entry.folder == folder):
+            if entry.uid_validity != uid_validity:
+                dead_letters.close(entry, DeadLetterEmail.Status.DISCARDED, f"UIDVALIDITY changed ({entry.uid_validity} -> {uid_validity})."); yield 'discarded'
+            else: yield replay_dead_letter(mail, entry)
+
+@shared_task
+def retry_dead_letters(limit=None, pks=None):
+    """
+    Low-priority retry of dead-lettered emails (routed to INGEST_RETRY_QUEUE, scheduled in
+    CELERY_BEAT_SCHEDULE). Only entries whose backoff has elapsed are taken, up to
+    DEAD_LETTER_RETRY_BATCH per run, and each is retried in isolation (see replay_dead_letter).
+    Entries whose folder has a new UIDVALIDITY are discarded (their UIDs no longer exist).
+    `pks` restricts the run to those entries (the admin's replay action).
+    Each mailbox is retried on its own connection; one that cannot be reached keeps its
+    entries for the next run without holding up the others.
+    """
+    due = dead_letters.due_entries(limit or getattr(settings, 'DEAD_LETTER_RETRY_BATCH', 50), pks)
+    results = {}
+    if not due: return results
+    with metrics.collect() as run:
+        try:
+            for mailbox in {entry.mailbox_id: entry.mailbox for entry in due}.values():
+                mail = None
                 try:
-                    with transaction.atomic():
-                        bug, created = Bug.objects.get_or_create(
-                            bug_id=extracted_bug_id,
-                            # Remove priority from defaults here, set it explicitly below
-                            defaults={'subject': subject, 'description': description}
-                        )
-
-                        if created:
-                            # --- Set priority for NEW bug ---
-                            bug.priority = parsed_priority or Bug.Priority.MEDIUM # Use parsed or default
-                            bug.save() # Save the priority along with other defaults
-                            # --------------------------------
-                            logger.info(f"Created new Bug: {bug.bug_id} (Priority: {bug.priority}) from email {message_id}")
-                        else:
-                            # Update existing bug
-                            update_fields = ['description', 'subject', 'updated_at'] # Start list of fields to update
-                            bug.description = description
-                            bug.subject = subject # Update subject too
-                            bug.modified_count = F('modified_count') + 1
-                            update_fields.append('modified_count')
-
-                            # --- Update priority for EXISTING bug IF parsed ---
-                            if parsed_priority and parsed_priority != bug.priority:
-                                bug.priority = parsed_priority
-                                update_fields.append('priority') # Add priority to fields being updated
-                                logger.info(f"Updating priority for Bug {bug.bug_id} to '{parsed_priority}'.")
-                            # -----------------------------------------------
-
-                            bug.save(update_fields=update_fields) # Save only changed fields
-                            bug.refresh_from_db() # Reload to get updated modified_count
-
-                            BugModificationLog.objects.create(bug=bug, modified_at=timezone.now())
-                            logger.info(f"Updated existing Bug: {bug.bug_id} (Mod count: {bug.modified_count}, Priority: {bug.priority}) from email {message_id}")
-
-                        # 5. Record Processed Email & Mark Seen
-                        ProcessedEmail.objects.create(message_id=message_id)
-                        mail.store(email_id, '+FLAGS', '\\Seen')
-                        logger.debug(f"Marked email ID {email_id.decode()} as Seen.")
-                        processed_count += 1
-
-                except Exception as db_error: # ... DB error handling ...
-                     logger.error(f"DB error processing {message_id} for bug {extracted_bug_id}: {db_error}", exc_info=True); skipped_count += 1; continue
-
-            except Exception as processing_error: # ... Other error handling ...
-                 logger.error(f"Error processing email ID {email_id.decode()}: {processing_error}", exc_info=True); skipped_count += 1; continue
-
-        logger.info(f"Finished. Processed: {processed_count}, Skipped: {skipped_count}.")
-
-    except imaplib.IMAP4.error as imap_error: # ... IMAP error handling ...
-        logger.error(f"IMAP connection error: {imap_error}", exc_info=True);
-        try: self.retry(exc=imap_error)
-        except self.MaxRetriesExceededError: logger.critical("Max retries exceeded for email task.")
-    except Exception as e: # ... General error handling ...
-        logger.error(f"Unexpected error in email task: {e}", exc_info=True)
-    finally: # ... IMAP logout ...
-        if 'mail' in locals() and mail.state == 'SELECTED':
-            try: mail.close(); mail.logout(); logger.info("IMAP logged out.")
-            except Exception as logout_err: logger.error(f"IMAP logout error: {logout_err}")
\ No newline at end of file
+                    mail = connect_imap(mailbox)
+                    for result in replay_mailbox_dead_letters(mail, [entry for entry in due if entry.mailbox_id == mailbox.pk]):
+                        results[result] = results.get(result, 0) + 1
+                        metrics.inc('bugtracker_ingest_dead_letter_retries_total', result=result)
+                except (imaplib.IMAP4.error, OSError) as connection_error:
+                    logger.error(f"Dead-letter retries of mailbox '{mailbox.name}' failed: {connection_error}")
+                    results['unreachable_mailboxes'] = results.get('unreachable_mailboxes', 0) + 1
+                finally:
+                    if mail is not None:
+                        try: mail.logout()
+                        except Exception as logout_err: logger.error(f"IMAP logout error: {logout_err}")
+        finally:
+            metrics.flush_totals(run)
+    logger.info(f"Dead-letter retries: {results or 'none attempted'}.")
+    return results
+# --- END Dead-Letter Retries ---
+
+
+# --- Push Ingestion ---
+@shared_task(bind=True, max_retries=5)
+def persist_pushed_emails(self, items):
+    """
+    Persist stage for emails POSTed to /api/ingest/email/ (see push.py), given as ParsedEmail
+    dicts in arrival order. There is no mailbox to refetch them from, so emails that fail to
+    persist are retried by this task itself, with exponential backoff.
+    """
+    errors = {}
+    with metrics.collect() as run:
+        with metrics.stage('persist'): outcomes = persist_batch([ParsedEmail.from_dict(data) for data in items], errors=errors)
+        metrics.count_outcomes(outcomes)
+    metrics.flush_totals(run)
+    failed = [data for data, outcome in zip(items, outcomes) if outcome == FAILED]
+    if failed:
+        logger.warning(f"{len(failed)} pushed emails failed to persist (attempt {self.request.retries + 1}): {sorted(set(errors.values()))}")
+        if self.request.retries < self.max_retries: raise self.retry(args=[failed], countdown=30 * 2 ** self.request.retries)
+        logger.error(f"Giving up on pushed emails {[data['message_id'] for data in failed]}.")
+    return dict(Counter(outcomes))
+# --- END Push Ingestion ---
@@ -1,18 +1,43 @@
 # api/tests.py
 
+import base64
 import email
-import imaplib # Import the real library so we can mock it
+import email.policy
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
 from email.message import Message
-from unittest.mock import patch, MagicMock, call # Import mocking tools
+from unittest.mock import patch # Import mocking tools
 
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms.models import model_to_dict
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings # To access potentially needed settings
-from django.db.models import F # In case needed for manual checks
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from rest_framework.test import APIClient
 
 # Import the task function and models
-from .tasks import process_incoming_emails, parse_priority_from_body # Import helper if testing separately
-from .models import Bug, BugModificationLog, ProcessedEmail
+from .tasks import parse_email, process_incoming_emails, schedule_mailbox_polls, parse_priority_from_body, get_plain_text_body, HEADER_FETCH_ITEMS, RunBudget, sync_mailbox, retry_dead_letters
+from .email_parser import parse_message
+from .reply_parser import is_reply, split_reply, strip_reply
+from .imap_utils import uid_sequence_set, connect_imap, idle_wait
+from .fake_imap import FakeIMAPServer, make_bug_email, _body_structure, _section_data
+from .loadgen import fill_mailbox, generate_bug_emails
+from .importer import iter_mbox
+from .persistence import ParsedEmail, persist_batch, PROCESSED, DUPLICATE
+from .locks import lease, get_backend
+from .admin import MailboxAdminForm
+from .dedupe import BloomFilter, get_filter, reset_filter, prune_processed_emails
+from .models import DEFAULT_MAILBOX, Bug, BugModificationDaily, BugModificationLog, ProcessedEmail, Mailbox, MailboxSyncState, IngestionRun, DeadLetterEmail
+from bugtracker.celery import app as celery_app
 
 # --- Helper Function to Create Mock Emails ---
 def create_mock_email(subject="Test Subject", body="Test body content.", from_addr="test@example.com", to_addr="bugs@example.com", message_id="<test12345@example.com>"):
@@ -33,18 +58,54 @@ def create_mock_email_bytes(subject="Test Subject", body="Test body content.", f
     msg = create_mock_email(subject, body, from_addr, to_addr, message_id)
     email_bytes = msg.as_bytes()
     # Construct the header part realistically (adjust UID if needed)
-    # Example: b'1 (RFC822 {512}'
-    fetch_header = f"{uid.decode()} (RFC822 {{{len(email_bytes)}}})".encode()
+    # Example: b'1 (UID 1 BODY[] {512}'
+    fetch_header = f"{uid.decode()} (UID {uid.decode()} BODY[] {{{len(email_bytes)}}}".encode()
     # The actual fetch response item is often a tuple containing the header and bytes
     return (fetch_header, email_bytes)
 
+def configure_uid_commands(mock_instance, uid, fetch_item, uid_validity=b'1'):
+    """
+    Makes mock_instance.uid() answer SEARCH/FETCH/STORE like a folder holding one message with the given UID.
+    FETCH serves the header-first phase (headers + BODYSTRUCTURE), single body sections and full bodies.
+    """
+    mock_instance.response.return_value = ('UIDVALIDITY', [uid_validity])
+    raw = fetch_item[1]
+    def uid_command(command, *args):
+        if command == 'SEARCH': return ('OK', [uid])
+        if command != 'FETCH': return ('OK', [])
+        items = args[1]
+        if 'BODYSTRUCTURE' in items:
+            header_section = re.search(r'\[(HEADER\.FIELDS [^]]+)\]', items).group(1)
+            headers = _section_data(raw, header_section)
+            structure = _body_structure(email.message_from_bytes(raw)).encode()
+            prefix = b'1 (UID %s BODYSTRUCTURE %s BODY[%s] {%d}' % (uid, structure, header_section.encode(), len(headers))
+            return ('OK', [(prefix, headers), b')'])
+        section = re.search(r'BODY\.PEEK\[([\d.]+)\]<0\.(\d+)>', items)
+        if section:
+            data = _section_data(raw, section.group(1))[:int(section.group(2))]
+            return ('OK', [(b'1 (UID %s BODY[%s]<0> {%d}' % (uid, section.group(1).encode(), len(data)), data), b')'])
+        return ('OK', [fetch_item, b')'])
+    mock_instance.uid.side_effect = uid_command
+
+def body_fetches_sent(mock_instance):
+    """ Item lists of the UID FETCH commands that downloaded message bodies (full or a single section). """
+    return [c.args[2] for c in mock_instance.uid.call_args_list if c.args[0] == 'FETCH' and 'BODYSTRUCTURE' not in c.args[2]]
+
+def uid_commands_sent(mock_instance):
+    """ Names of the UID commands issued, in order. """
+    return [c.args[0] for c in mock_instance.uid.call_args_list]
+
 # --- Test Class ---
 
 # Patch 'imaplib.IMAP4_SSL' globally for all tests in this class
 # Target where IMAP4_SSL is *used* (within the tasks module)
 @patch('api.tasks.imaplib.IMAP4_SSL')
+@override_settings(INGEST_LOCK_URL='') # Per-process ingestion lease (no Redis in tests)
 class EmailProcessingTests(TestCase):
 
+    def setUp(self):
+        reset_filter() # The Message-ID Bloom filter is rebuilt from this test's records on first use
+
     def test_create_new_bug_from_email(self, MockIMAP4_SSL):
         """ Test that a valid email creates a new Bug record correctly. """
         # --- Arrange ---
@@ -53,18 +114,14 @@ class EmailProcessingTests(TestCase):
         mock_instance.login.return_value = ('OK', [b'Login successful.'])
         mock_instance.select.return_value = ('OK', [b'INBOX selected.'])
         mock_instance.state = 'SELECTED' # Simulate successful select state
-        # Simulate search finding one unseen email with UID '1'
-        mock_instance.search.return_value = ('OK', [b'1'])
-        # Simulate fetch returning our mock email for UID '1'
         mock_email_subject = "Bug ID: NEW-001 - Creation Test"
         mock_email_body = "This is the description.\nPriority: High\nShould be high priority."
         mock_email_msg_id = "<new-bug-test@example.com>"
         mock_fetch_response_item = create_mock_email_bytes(
             subject=mock_email_subject, body=mock_email_body, message_id=mock_email_msg_id, uid=b'1'
         )
-        # fetch returns list containing tuples like (header_bytes, email_bytes) and a closing paren
-        mock_instance.fetch.return_value = ('OK', [mock_fetch_response_item, b')'])
-        mock_instance.store.return_value = ('OK', [b'Store successful.'])
+        # UID SEARCH finds UID 1; UID FETCH returns its headers and BODYSTRUCTURE, then this body
+        configure_uid_commands(mock_instance, b'1', mock_fetch_response_item)
         mock_instance.close.return_value = ('OK', [b'Closed.'])
         mock_instance.logout.return_value = ('OK', [b'Logout successful.'])
 
@@ -99,12 +156,13 @@ class EmailProcessingTests(TestCase):
         self.assertEqual(processed_email.message_id, mock_email_msg_id)
 
         # 4. Check mock calls (verify IMAP interactions happened as expected)
-        MockIMAP4_SSL.assert_called_once_with(settings.IMAP_SERVER, settings.IMAP_PORT)
+        MockIMAP4_SSL.assert_called_once_with(settings.IMAP_SERVER, settings.IMAP_PORT, timeout=settings.IMAP_TIMEOUT)
         mock_instance.login.assert_called_once_with(settings.IMAP_USER, settings.IMAP_PASSWORD)
         mock_instance.select.assert_called_once_with('inbox')
-        mock_instance.search.assert_called_once_with(None, '(UNSEEN)')
-        mock_instance.fetch.assert_called_once_with(b'1', '(RFC822)')
-        mock_instance.store.assert_called_once_with(b'1', '+FLAGS', '\\Seen') # Check marked as Seen
+        mock_instance.uid.assert_any_call('SEARCH', None, 'UID 1:*') # Fresh checkpoint: everything from UID 1
+        mock_instance.uid.assert_any_call('FETCH', '1', HEADER_FETCH_ITEMS)
+        mock_instance.uid.assert_any_call('FETCH', '1', f'(UID BODY.PEEK[1]<0.{settings.EMAIL_MAX_BODY_BYTES}>)') # Only the text/plain section is downloaded
+        mock_instance.uid.assert_any_call('STORE', '1', '+FLAGS', '(\\Seen)') # Check marked as Seen
         mock_instance.close.assert_called_once() # Check close was called
         mock_instance.logout.assert_called_once() # Check logout was called
 
@@ -125,7 +183,6 @@ class EmailProcessingTests(TestCase):
         mock_instance = MockIMAP4_SSL.return_value
         mock_instance.login.return_value = ('OK', []); mock_instance.select.return_value = ('OK', [])
         mock_instance.state = 'SELECTED' # Set state
-        mock_instance.search.return_value = ('OK', [b'2']) # Use UID '2'
 
         update_subject = f"Bug ID: {initial_bug_id} - Updated Details"
         update_body = "Description updated.\nPriority: Medium" # New priority in body
@@ -133,8 +190,8 @@ class EmailProcessingTests(TestCase):
         mock_fetch_response_item = create_mock_email_bytes(
             subject=update_subject, body=update_body, message_id=update_msg_id, uid=b'2'
         )
-        mock_instance.fetch.return_value = ('OK', [mock_fetch_response_item, b')'])
-        mock_instance.store.return_value = ('OK', []); mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
+        configure_uid_commands(mock_instance, b'2', mock_fetch_response_item)
+        mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
 
         # 3. Initial state check
         self.assertEqual(Bug.objects.count(), 1)
@@ -168,8 +225,9 @@ class EmailProcessingTests(TestCase):
         self.assertTrue(timezone.now() - mod_log.modified_at < timezone.timedelta(seconds=10))
 
         # 5. Check mock calls
-        mock_instance.fetch.assert_called_once_with(b'2', '(RFC822)')
-        mock_instance.store.assert_called_once_with(b'2', '+FLAGS', '\\Seen')
+        mock_instance.uid.assert_any_call('FETCH', '2', HEADER_FETCH_ITEMS)
+        mock_instance.uid.assert_any_call('FETCH', '2', f'(UID BODY.PEEK[1]<0.{settings.EMAIL_MAX_BODY_BYTES}>)') # Only the text/plain section is downloaded
+        mock_instance.uid.assert_any_call('STORE', '2', '+FLAGS', '(\\Seen)')
         mock_instance.close.assert_called_once()
         mock_instance.logout.assert_called_once()
 
@@ -183,13 +241,12 @@ class EmailProcessingTests(TestCase):
         mock_instance = MockIMAP4_SSL.return_value
         mock_instance.login.return_value = ('OK', []); mock_instance.select.return_value = ('OK', [])
         mock_instance.state = 'SELECTED' # Set state
-        mock_instance.search.return_value = ('OK', [b'3']) # UID 3
 
         mock_fetch_response_item = create_mock_email_bytes(
             subject="Bug ID: DUP-TEST", body="Body", message_id=existing_msg_id, uid=b'3'
         )
-        mock_instance.fetch.return_value = ('OK', [mock_fetch_response_item, b')'])
-        mock_instance.store.return_value = ('OK', []); mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
+        configure_uid_commands(mock_instance, b'3', mock_fetch_response_item)
+        mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
 
         self.assertEqual(Bug.objects.count(), 0)
         self.assertEqual(ProcessedEmail.objects.count(), 1) # Starts with 1 processed
@@ -202,9 +259,10 @@ class EmailProcessingTests(TestCase):
         self.assertEqual(ProcessedEmail.objects.count(), 1, "Processed count shouldn't increase.")
         self.assertEqual(BugModificationLog.objects.count(), 0)
 
-        mock_instance.fetch.assert_called_once_with(b'3', '(RFC822)')
+        mock_instance.uid.assert_any_call('FETCH', '3', HEADER_FETCH_ITEMS)
+        self.assertEqual(body_fetches_sent(mock_instance), [], "Duplicates are settled on headers; no body download.")
         # Should still be marked Seen to avoid retrying the duplicate check constantly
-        mock_instance.store.assert_called_once_with(b'3', '+FLAGS', '\\Seen')
+        mock_instance.uid.assert_any_call('STORE', '3', '+FLAGS', '(\\Seen)')
         mock_instance.close.assert_called_once()
         mock_instance.logout.assert_called_once()
 
@@ -215,13 +273,11 @@ class EmailProcessingTests(TestCase):
         mock_instance = MockIMAP4_SSL.return_value
         mock_instance.login.return_value = ('OK', []); mock_instance.select.return_value = ('OK', [])
         mock_instance.state = 'SELECTED' # Set state
-        mock_instance.search.return_value = ('OK', [b'4']) # UID 4
 
         mock_fetch_response_item = create_mock_email_bytes(
             subject="Invalid Subject", body="Body", message_id="<invalid-subj@example.com>", uid=b'4'
         )
-        mock_instance.fetch.return_value = ('OK', [mock_fetch_response_item, b')'])
-        mock_instance.store.return_value = ('OK', []) # Should NOT be called
+        configure_uid_commands(mock_instance, b'4', mock_fetch_response_item) # STORE should NOT be issued
         mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
 
         self.assertEqual(Bug.objects.count(), 0)
@@ -235,8 +291,9 @@ class EmailProcessingTests(TestCase):
         self.assertEqual(ProcessedEmail.objects.count(), 0)
         self.assertEqual(BugModificationLog.objects.count(), 0)
 
-        mock_instance.fetch.assert_called_once_with(b'4', '(RFC822)')
-        mock_instance.store.assert_not_called() # IMPORTANT: Not marked Seen
+        mock_instance.uid.assert_any_call('FETCH', '4', HEADER_FETCH_ITEMS)
+        self.assertEqual(body_fetches_sent(mock_instance), []) # Rejected on headers alone
+        self.assertNotIn('STORE', uid_commands_sent(mock_instance)) # IMPORTANT: Not marked Seen
         mock_instance.close.assert_called_once() # Finally block still runs
         mock_instance.logout.assert_called_once()
 
@@ -247,14 +304,12 @@ class EmailProcessingTests(TestCase):
         mock_instance = MockIMAP4_SSL.return_value
         mock_instance.login.return_value = ('OK', []); mock_instance.select.return_value = ('OK', [])
         mock_instance.state = 'SELECTED' # Set state
-        mock_instance.search.return_value = ('OK', [b'5']) # UID 5
 
         # Use helper to create email bytes *without* Message-ID header
         mock_fetch_response_item = create_mock_email_bytes(
             subject="Bug ID: NO-MSGID", body="Body", message_id=None, uid=b'5'
         )
-        mock_instance.fetch.return_value = ('OK', [mock_fetch_response_item, b')'])
-        mock_instance.store.return_value = ('OK', []) # Should NOT be called
+        configure_uid_commands(mock_instance, b'5', mock_fetch_response_item) # STORE should NOT be issued
         mock_instance.close.return_value = ('OK', []); mock_instance.logout.return_value = ('OK', [])
 
         self.assertEqual(Bug.objects.count(), 0)
@@ -268,8 +323,9 @@ class EmailProcessingTests(TestCase):
         self.assertEqual(ProcessedEmail.objects.count(), 0)
         self.assertEqual(BugModificationLog.objects.count(), 0)
 
-        mock_instance.fetch.assert_called_once_with(b'5', '(RFC822)')
-        mock_instance.store.assert_not_called() # IMPORTANT: Not marked Seen
+        mock_instance.uid.assert_any_call('FETCH', '5', HEADER_FETCH_ITEMS)
+        self.assertEqual(body_fetches_sent(mock_instance), []) # Rejected on headers alone
+        self.assertNotIn('STORE', uid_commands_sent(mock_instance)) # IMPORTANT: Not marked Seen
         mock_instance.close.assert_called_once()
         mock_instance.logout.assert_called_once()
 
@@ -283,4 +339,1020 @@ class EmailProcessingTests(TestCase):
          self.assertEqual(parse_priority_from_body("No priority mentioned."), None)
          self.assertEqual(parse_priority_from_body("Priority: Critical"), None) # Invalid level
          self.assertEqual(parse_priority_from_body(""), None)
-         self.assertIsNone(parse_priority_from_body(None))
\ No newline at end of file
+         self.assertIsNone(parse_priority_from_body(None))
+
+
+# --- Batched / Incremental Sync Tests (against the in-process fake IMAP server) ---
+class FakeIMAPServerTests(TestCase):
+
+    def setUp(self):
+        reset_filter()
+        self.server = FakeIMAPServer().start()
+        self.addCleanup(self.server.stop)
+        imap_settings = override_settings(
+            IMAP_SERVER='127.0.0.1', IMAP_PORT=self.server.port, IMAP_USE_SSL=False,
+            IMAP_USER=self.server.username, IMAP_PASSWORD=self.server.password, INGEST_LOCK_URL='', METRICS_PUBLIC=True,
+        )
+        imap_settings.enable(); self.addCleanup(imap_settings.disable)
+
+    def run_celery_eagerly(self):
+        """ Runs chords/subtasks in-process (no broker) for the rest of the test. """
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+
+    def test_batched_fetch_processes_all_chunks(self):
+        """ Emails spread over several chunks are all ingested; valid ones are marked Seen, invalid ones are not. """
+        for i in range(5):
+            self.server.mailbox.append(make_bug_email("BATCH-1", f"Update {i}\nPriority: Low", f"<batch-{i}@example.com>"))
+        invalid_uid = self.server.mailbox.append(make_bug_email("X", "Body", "<invalid@example.com>", subject="No id here"))
+
+        process_incoming_emails(batch_size=2)
+
+        bug = Bug.objects.get(bug_id="BATCH-1")
+        self.assertEqual(bug.modified_count, 4, "First email creates, the other four update.")
+        self.assertEqual(bug.description, "Update 4\nPriority: Low\n")
+        self.assertEqual(bug.priority, Bug.Priority.LOW)
+        self.assertEqual(ProcessedEmail.objects.count(), 5)
+        self.assertEqual(BugModificationLog.objects.count(), 4)
+        flags = {msg.uid: msg.flags for msg in self.server.mailbox.folder('inbox')['messages']}
+        self.assertNotIn('\\Seen', flags.pop(invalid_uid), "Skipped email must stay UNSEEN.")
+        self.assertTrue(all('\\Seen' in f for f in flags.values()))
+
+    def test_batched_fetch_marks_duplicates_seen(self):
+        """ Already-processed Message-IDs are skipped but still flagged Seen. """
+        ProcessedEmail.objects.create(message_id="<dup@example.com>")
+        uid = self.server.mailbox.append(make_bug_email("DUP-1", "Body", "<dup@example.com>"))
+
+        process_incoming_emails(batch_size=10)
+
+        self.assertEqual(Bug.objects.count(), 0)
+        message = next(m for m in self.server.mailbox.folder('inbox')['messages'] if m.uid == uid)
+        self.assertIn('\\Seen', message.flags)
+
+    def test_header_first_fetch_downloads_only_text_section(self):
+        """ A report with a large attachment is ingested from its text/plain section; the attachment never crosses the wire. """
+        msg = email.message_from_bytes(make_bug_email("ATT-1", "Crash on save\nPriority: High", "<att@example.com>"), policy=email.policy.default)
+        msg.add_attachment(b'\x00' * 200_000, maintype='application', subtype='octet-stream', filename='core.dump')
+        self.server.mailbox.append(msg.as_bytes())
+
+        process_incoming_emails()
+
+        bug = Bug.objects.get(bug_id="ATT-1")
+        self.assertEqual(bug.description, "Crash on save\nPriority: High\n")
+        self.assertEqual(bug.priority, Bug.Priority.HIGH)
+        self.assertLess(self.server.bytes_sent, 10_000, "Only headers and the text section should be fetched.")
+
+    def test_header_first_fetch_skips_duplicate_bodies(self):
+        """ Already processed Message-IDs are recognised from headers, so no body bytes are fetched. """
+        ProcessedEmail.objects.create(message_id="<seen@example.com>")
+        self.server.mailbox.append(make_bug_email("DUP-2", "x" * 50_000, "<seen@example.com>"))
+
+        process_incoming_emails()
+
+        self.assertEqual(Bug.objects.count(), 0)
+        self.assertLess(self.server.bytes_sent, 1_000)
+        self.assertIn('\\Seen', self.server.mailbox.folder('inbox')['messages'][0].flags)
+
+    @override_settings(EMAIL_MAX_BODY_BYTES=4096)
+    def test_header_first_fetch_caps_oversized_text_bodies(self):
+        """ The text/plain section is fetched partially, so EMAIL_MAX_BODY_BYTES holds on the header-first path as on full fetches. """
+        self.server.mailbox.append(make_bug_email("BIG-1", "line of text\n" * 20_000, "<big-1@example.com>"))
+        encoded = email.message.EmailMessage(); encoded['Subject'] = "Bug ID: BIG-2 - Encoded"; encoded['Message-ID'] = "<big-2@example.com>"
+        encoded.set_content("r\u00e9sum\u00e9 line\n" * 10_000, cte='base64')
+        self.server.mailbox.append(encoded.as_bytes())
+
+        process_incoming_emails()
+
+        plain, decoded = Bug.objects.get(bug_id="BIG-1").description, Bug.objects.get(bug_id="BIG-2").description
+        self.assertTrue(plain.startswith("line of text\n") and len(plain) <= 4096)
+        self.assertTrue(decoded.startswith("r\u00e9sum\u00e9 line\n") and len(decoded.encode()) <= 4096 * 3 // 4, "base64 cut mid-quantum still decodes.")
+        self.assertLess(self.server.bytes_sent, 12_000, "Only the first EMAIL_MAX_BODY_BYTES of each text section are downloaded.")
+
+    def test_run_records_stage_timings_and_skip_reasons(self):
+        """ Each run leaves an IngestionRun summary; /metrics serves the cumulative series in Prometheus format. """
+        ProcessedEmail.objects.create(message_id="<seen@example.com>")
+        self.server.mailbox.append(make_bug_email("MET-1", "Body", "<met-1@example.com>"))
+        self.server.mailbox.append(make_bug_email("MET-1", "Body", "<seen@example.com>"))
+        self.server.mailbox.append(make_bug_email(None, "Body", "<nobug@example.com>", subject="Lunch on Friday?"))
+
+        process_incoming_emails()
+
+        run = IngestionRun.objects.get()
+        self.assertEqual((run.processed, run.duplicates, run.skipped, run.failed), (1, 1, 1, 0))
+        self.assertEqual(run.skip_reasons, {'duplicate': 1, 'no_bug_id': 1})
+        self.assertTrue({'login', 'select', 'search', 'fetch', 'parse', 'persist', 'store'} <= set(run.stage_seconds))
+        self.assertGreater(run.bytes_fetched, 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE bugtracker_ingest_stage_seconds histogram', body)
+        self.assertIn('bugtracker_ingest_emails_total{outcome="processed"} 1\n', body)
+        self.assertIn('bugtracker_ingest_skipped_total{reason="no_bug_id"} 1\n', body)
+        self.assertIn('bugtracker_ingest_runs_total 1\n', body)
+        buckets = re.findall(r'bugtracker_ingest_stage_seconds_bucket\{stage="fetch",le="([^"]+)"\} (\d+)', body)
+        self.assertEqual([le for le, _ in buckets][-2:], ['300.0', '+Inf'], "Buckets are exposed in increasing le order.")
+        self.assertEqual([int(count) for _, count in buckets], sorted(int(count) for _, count in buckets), "Bucket counts are cumulative.")
+
+        process_incoming_emails()
+        self.assertIn('bugtracker_ingest_runs_total 2\n', self.client.get('/metrics').content.decode(), "Totals accumulate across runs.")
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with override_settings(METRICS_PUBLIC=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 401, "No token and no opt-out: closed by default.")
+
+    @override_settings(IMAP_HEADER_FIRST=False)
+    def test_full_message_fetch_mode(self):
+        """ IMAP_HEADER_FIRST=False falls back to downloading whole messages. """
+        self.server.mailbox.append(make_bug_email("FULL-1", "Body\nPriority: Low", "<full@example.com>"))
+
+        process_incoming_emails()
+
+        self.assertEqual(Bug.objects.get(bug_id="FULL-1").priority, Bug.Priority.LOW)
+
+    @override_settings(INGEST_PARTITIONS=4)
+    def test_fan_out_persists_partitions_in_message_order(self):
+        """ With INGEST_PARTITIONS > 1 persistence runs as a chord; each bug still sees its updates in UID order. """
+        for i in range(12):
+            self.server.mailbox.append(make_bug_email(f"FAN-{i % 3}", f"Update {i}", f"<fan-{i}@example.com>"))
+        self.server.mailbox.append(make_bug_email("X", "Body", "<fan-invalid@example.com>", subject="No id here"))
+
+        self.run_celery_eagerly()
+        process_incoming_emails(batch_size=5)
+
+        for n in range(3):
+            bug = Bug.objects.get(bug_id=f"FAN-{n}")
+            self.assertEqual(bug.modified_count, 3)
+            self.assertEqual(bug.description, f"Update {9 + n}\n", "The last email for a bug must win.")
+        state = MailboxSyncState.objects.get(folder='inbox')
+        self.assertEqual(state.last_uid, 13)
+        self.assertIsNone(state.fanout_started_at, "The chord callback releases the folder.")
+        seen = [m.uid for m in self.server.mailbox.folder('inbox')['messages'] if '\\Seen' in m.flags]
+        self.assertEqual(seen, list(range(1, 13)))
+
+    @override_settings(INGEST_PARTITIONS=4)
+    def test_fan_out_skips_folder_with_chord_in_flight(self):
+        MailboxSyncState.objects.create(folder='inbox', uid_validity=1, fanout_started_at=timezone.now())
+        self.server.mailbox.append(make_bug_email("FAN-9", "Body", "<fan-9@example.com>"))
+
+        self.run_celery_eagerly()
+        process_incoming_emails()
+
+        self.assertEqual(Bug.objects.count(), 0)
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 0)
+
+    @override_settings(INGEST_MAX_MESSAGES=3)
+    def test_budgeted_runs_reenqueue_until_drained(self):
+        """ A backlog larger than the per-run message budget is drained by consecutive runs. """
+        for i in range(7):
+            self.server.mailbox.append(make_bug_email(f"BUDGET-{i}", "Body", f"<budget-{i}@example.com>"))
+
+        self.run_celery_eagerly()
+        with patch('api.tasks.connect_imap', wraps=connect_imap) as connect:
+            process_incoming_emails(batch_size=2)
+
+        self.assertEqual(connect.call_count, 3, "3 + 3 + 1 messages.")
+        self.assertEqual(Bug.objects.count(), 7)
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 7)
+
+    def test_overlapping_run_exits_while_lease_is_held(self):
+        """ A run that finds the ingestion lease taken neither logs in nor fetches, and reports the contention. """
+        self.server.mailbox.append(make_bug_email("LOCK-1", "Body", "<lock-1@example.com>"))
+        get_backend().acquire("bugtracker:lock:process_incoming_emails:default:inbox", "other-worker", 60)
+        with patch('api.tasks.connect_imap') as connect:
+            result = process_incoming_emails()
+        connect.assert_not_called()
+        self.assertEqual((result['lock']['acquired'], result['lock']['contended'], result['lock']['holder']), (False, True, "other-worker"))
+        self.assertFalse(Bug.objects.exists())
+        self.assertIn("bugtracker_ingest_lock_contended_total 1", self.client.get('/metrics').content.decode())
+
+        get_backend().release("bugtracker:lock:process_incoming_emails:default:inbox", "other-worker")
+        result = process_incoming_emails()
+        self.assertEqual((result['processed'], result['lock']['acquired'], result['lock']['contended']), (1, True, False))
+        self.assertGreaterEqual(result['lock']['wait_seconds'], 0)
+        self.assertTrue(get_backend().acquire("bugtracker:lock:process_incoming_emails:default:inbox", "next", 60)[0], "The lease is released after the run.")
+        get_backend().release("bugtracker:lock:process_incoming_emails:default:inbox", "next")
+
+    def test_lease_heartbeat_renews_and_reports_loss(self):
+        lost = threading.Event()
+        with lease("heartbeat-test", ttl=0.15, on_lost=lost.set) as held:
+            time.sleep(0.35)
+            self.assertGreaterEqual(held.renewals, 2, "Renewed past its TTL.")
+            self.assertFalse(get_backend().acquire("bugtracker:lock:heartbeat-test", "intruder", 60)[0])
+            with lease("heartbeat-test") as nested: self.assertEqual((nested.acquired, nested.backend), (True, 'reentrant'))
+            get_backend()._leases["bugtracker:lock:heartbeat-test"] = ("intruder", time.monotonic() + 60) # Taken over, e.g. after a long GC pause
+            self.assertTrue(lost.wait(1))
+        self.assertTrue(held.lost)
+        self.assertFalse(get_backend().acquire("bugtracker:lock:heartbeat-test", "third", 60)[0], "A lost lease is not released from under its new holder.")
+        get_backend().release("bugtracker:lock:heartbeat-test", "intruder")
+
+    @override_settings(INGEST_LOCK_URL='redis://127.0.0.1:1/0')
+    def test_unreachable_lock_backend_runs_without_lease(self):
+        self.server.mailbox.append(make_bug_email("LOCK-2", "Body", "<lock-2@example.com>"))
+        result = process_incoming_emails()
+        self.assertEqual((result['processed'], result['lock']['backend']), (1, 'unavailable'))
+
+    @override_settings(INGEST_POLL_MIN_SECONDS=30, INGEST_POLL_MAX_SECONDS=200, INGEST_POLL_BACKOFF=2.0)
+    def test_adaptive_poll_backs_off_while_idle_and_resets_on_mail(self):
+        """ Empty polls back off exponentially to the ceiling; new mail drops the interval to the minimum. Ticks in between poll nothing. """
+        self.run_celery_eagerly()
+        def tick(): # The next poll is made due, as if its interval had elapsed
+            MailboxSyncState.objects.filter(folder='inbox').update(next_poll_at=timezone.now())
+            self.assertEqual(schedule_mailbox_polls(), ['default/inbox'])
+            return MailboxSyncState.objects.get(folder='inbox')
+
+        self.assertEqual(schedule_mailbox_polls(), ['default/inbox'], "The inbox is polled before it has a sync state.")
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').poll_interval_seconds, 60)
+        with patch('api.tasks.connect_imap') as connect:
+            self.assertEqual(schedule_mailbox_polls(), [], "Not due yet: no IMAP session.")
+        connect.assert_not_called()
+        self.assertEqual([tick().poll_interval_seconds for _ in range(3)], [120, 200, 200])
+
+        self.server.mailbox.append(make_bug_email("POLL-1", "Body", "<poll-1@example.com>"))
+        state = tick()
+        self.assertEqual(state.poll_interval_seconds, 30)
+        self.assertTrue(Bug.objects.filter(bug_id="POLL-1").exists())
+        self.assertAlmostEqual((state.next_poll_at - timezone.now()).total_seconds(), 30, delta=5)
+
+        MailboxSyncState.objects.filter(folder='inbox').update(poll_max_seconds=45) # Per-folder ceiling
+        self.assertEqual([tick().poll_interval_seconds for _ in range(2)], [45, 45])
+        self.assertIn('bugtracker_ingest_poll_interval_seconds{folder="inbox",mailbox="default"} 45', self.client.get('/metrics').content.decode())
+
+    @override_settings(INGEST_PARTITIONS=2, INGEST_MAX_MESSAGES=4)
+    def test_mailboxes_are_polled_independently(self):
+        """ Every enabled mailbox folder gets its own run, connection, checkpoint and budget; an unreachable mailbox does not stop the others. """
+        self.run_celery_eagerly()
+        other = FakeIMAPServer().start(); self.addCleanup(other.stop)
+        Mailbox.objects.create(name='product-b', server='127.0.0.1', port=other.port, use_ssl=False, username=other.username, password=other.password,
+                               folders='inbox, triage', max_messages_per_run=1)
+        Mailbox.objects.create(name='broken', server='127.0.0.1', port=1, use_ssl=False, username='nobody', password='x')
+        Mailbox.objects.create(name='retired', enabled=False)
+        self.server.mailbox.append(make_bug_email("MBX-1", "Default account", "<mbx-1@example.com>"))
+        for i in range(2): other.mailbox.append(make_bug_email("MBX-2", f"Product B {i}", f"<mbx-b{i}@example.com>"))
+        other.mailbox.append(make_bug_email("MBX-3", "Needs triage", "<mbx-t@example.com>"), folder='triage')
+
+        self.assertEqual(schedule_mailbox_polls(), ['broken/inbox', 'default/inbox', 'product-b/inbox', 'product-b/triage'])
+        self.assertEqual(schedule_mailbox_polls(), [], "Each folder, the unreachable one included, waits for its next poll.")
+        self.assertEqual(Bug.objects.get(bug_id="MBX-2").modified_count, 1)
+        self.assertEqual(Bug.objects.filter(bug_id__in=["MBX-1", "MBX-3"]).count(), 2)
+        checkpoints = dict(((mailbox, folder), last_uid) for mailbox, folder, last_uid in MailboxSyncState.objects.values_list('mailbox__name', 'folder', 'last_uid'))
+        self.assertEqual(checkpoints, {('broken', 'inbox'): 0, ('default', 'inbox'): 1, ('product-b', 'inbox'): 2, ('product-b', 'triage'): 1})
+        self.assertEqual(IngestionRun.objects.filter(mailbox='product-b', folder='inbox').count(), 2, "A one-email budget: the run re-enqueued itself.")
+        self.assertIn("Connection refused", IngestionRun.objects.get(mailbox='broken').error)
+
+    @override_settings(INGEST_MAX_MESSAGES=4, INGEST_MAX_SECONDS=60, INGEST_MAX_BYTES=0)
+    def test_mailbox_budgets_fall_back_only_when_unset(self):
+        """ Empty per-mailbox limits use the settings; 0 lifts the limit for that mailbox. """
+        budget = RunBudget.from_settings(Mailbox(max_messages_per_run=0, max_bytes_per_run=1024))
+        self.assertEqual((budget.max_messages, budget.max_seconds, budget.max_bytes), (None, 60, 1024))
+        budget = RunBudget.from_settings(Mailbox())
+        self.assertEqual((budget.max_messages, budget.max_seconds, budget.max_bytes), (4, 60, None))
+
+    def test_mailbox_admin_never_renders_the_password(self):
+        """ The change page leaves the password input empty; saving it blank keeps the stored password, clear_password removes it. """
+        mailbox = Mailbox.objects.create(name='product-c', server='imap.example.com', username='bugs', password='s3cret-imap')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        page = self.client.get(f'/admin/api/mailbox/{mailbox.pk}/change/')
+        self.assertEqual(page.status_code, 200); self.assertNotIn('s3cret-imap', page.content.decode())
+        data = {key: '' if value is None else value for key, value in model_to_dict(mailbox).items()}
+        for password, clear, expected in (('', False, 's3cret-imap'), ('n3w', False, 'n3w'), ('', True, '')):
+            form = MailboxAdminForm({**data, 'password': password, **({'clear_password': 'on'} if clear else {})}, instance=mailbox)
+            self.assertTrue(form.is_valid(), form.errors); form.save()
+            mailbox.refresh_from_db(); self.assertEqual(mailbox.password, expected)
+
+    def test_budgeted_fan_out_reenqueues_from_callback(self):
+        for i in range(9):
+            self.server.mailbox.append(make_bug_email(f"FANB-{i % 2}", f"Update {i}", f"<fanb-{i}@example.com>"))
+
+        self.run_celery_eagerly()
+        process_incoming_emails(batch_size=3)
+
+        self.assertEqual(Bug.objects.get(bug_id="FANB-0").description, "Update 8\n")
+        self.assertEqual(ProcessedEmail.objects.count(), 9)
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 9)
+
+    def test_sync_mailbox_stops_at_byte_budget_and_reports_progress(self):
+        for i in range(4):
+            self.server.mailbox.append(make_bug_email(f"BYTES-{i}", "Body", f"<bytes-{i}@example.com>"))
+        mail = connect_imap(); self.addCleanup(mail.logout)
+        budget = RunBudget(max_bytes=1); progress = []
+
+        processed, _ = sync_mailbox(mail, 'inbox', 2, budget, progress.append)
+
+        self.assertEqual(processed, 2, "The first chunk always runs; the budget is checked between chunks.")
+        self.assertTrue(budget.stopped_early)
+        self.assertEqual(progress, [{'folder': 'inbox', 'processed': 2, 'skipped': 0, 'last_uid': 2, 'remaining': 2}])
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 2)
+
+    def test_uid_sequence_set(self):
+        self.assertEqual(uid_sequence_set([7, 1, 2, 3, 9, 10]), "1:3,7,9:10")
+        self.assertEqual(uid_sequence_set([5]), "5")
+
+    def test_incremental_sync_ignores_seen_flags(self):
+        """ Only UIDs above the checkpoint are fetched, even if old messages are marked unread again. """
+        self.server.mailbox.append(make_bug_email("SYNC-1", "First", "<sync-1@example.com>"))
+        process_incoming_emails()
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 1)
+
+        old_message = self.server.mailbox.folder('inbox')['messages'][0]
+        old_message.flags.clear() # A human marks the old email unread
+        self.server.mailbox.append(make_bug_email("SYNC-1", "Second", "<sync-2@example.com>"))
+        process_incoming_emails()
+
+        self.assertEqual(Bug.objects.get(bug_id="SYNC-1").modified_count, 1)
+        self.assertNotIn('\\Seen', old_message.flags, "Old email must not be fetched again.")
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 2)
+
+    def test_uidvalidity_change_forces_full_resync(self):
+        """ A new UIDVALIDITY resets the checkpoint; already processed emails are then skipped as duplicates. """
+        self.server.mailbox.append(make_bug_email("RESYNC-1", "Body", "<resync-1@example.com>"))
+        process_incoming_emails()
+        old_message = self.server.mailbox.folder('inbox')['messages'][0]
+        old_message.flags.clear()
+
+        self.server.mailbox.uid_validity = 2
+        process_incoming_emails()
+
+        state = MailboxSyncState.objects.get(folder='inbox')
+        self.assertEqual((state.uid_validity, state.last_uid), (2, 1))
+        self.assertIn('\\Seen', old_message.flags, "Resync refetches the email and marks the duplicate Seen.")
+        self.assertEqual(Bug.objects.get(bug_id="RESYNC-1").modified_count, 0)
+
+    def test_resync_skips_mail_older_than_the_dedupe_retention(self):
+        """ After a UIDVALIDITY change, mail whose dedupe records may be pruned is not ingested again; the checkpoint moves past it. """
+        self.server.mailbox.append(make_bug_email("RESYNC-2", "Recent", "<resync-new@example.com>"))
+        self.server.mailbox.append(make_bug_email("RESYNC-3", "Old", "<resync-old@example.com>"), received=timezone.localdate() - timezone.timedelta(days=100))
+        process_incoming_emails()
+        ProcessedEmail.objects.filter(message_hash=ProcessedEmail.hash_message_id("<resync-old@example.com>")).delete(); reset_filter() # As the retention prune would
+        for message in self.server.mailbox.folder('inbox')['messages']: message.flags.clear()
+
+        self.server.mailbox.uid_validity = 2
+        process_incoming_emails()
+        state = MailboxSyncState.objects.get(folder='inbox')
+        self.assertEqual((state.last_uid, state.resync_since), (1, timezone.localdate() - timezone.timedelta(days=89)))
+        process_incoming_emails()
+        state.refresh_from_db()
+        self.assertEqual((state.last_uid, state.resync_since), (2, None), "Once caught up, the checkpoint skips the old mail and the resync ends.")
+        self.assertEqual(dict(Bug.objects.values_list('bug_id', 'modified_count')), {"RESYNC-2": 0, "RESYNC-3": 0})
+        self.assertNotIn('\\Seen', self.server.mailbox.folder('inbox')['messages'][1].flags, "The old email is not fetched again.")
+
+    def test_failed_message_is_dead_lettered_and_retried(self):
+        """ A message that fails to persist is parked for isolated retries; the checkpoint moves past it. """
+        for i in range(3):
+            self.server.mailbox.append(make_bug_email(f"FAIL-{i}", "Body", f"<fail-{i}@example.com>"))
+        real_bulk_create = ProcessedEmail.objects.bulk_create
+        def flaky_bulk_create(objs, *args, **kwargs):
+            if any(obj.message_id == "<fail-1@example.com>" for obj in objs): raise RuntimeError("DB down")
+            return real_bulk_create(objs, *args, **kwargs)
+
+        with patch.object(ProcessedEmail.objects, 'bulk_create', side_effect=flaky_bulk_create):
+            process_incoming_emails(batch_size=1)
+            entry = DeadLetterEmail.objects.get()
+            self.assertEqual((entry.uid, entry.message_id, entry.stage, entry.status, entry.attempts), (2, "<fail-1@example.com>", 'persist', 'pending', 1))
+            self.assertIn("DB down", entry.error)
+            self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 3, "The poison message does not hold the checkpoint.")
+            self.assertEqual(Bug.objects.count(), 2)
+            self.assertEqual(retry_dead_letters(), {}, "Not retried before its backoff elapses.")
+
+            DeadLetterEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(retry_dead_letters(), {'retry': 1})
+            entry.refresh_from_db()
+            self.assertEqual(entry.attempts, 2)
+            self.assertAlmostEqual((entry.next_attempt_at - entry.last_failed_at).total_seconds(), 2 * settings.DEAD_LETTER_RETRY_BASE_SECONDS, delta=1)
+
+        process_incoming_emails()
+        self.assertEqual(Bug.objects.count(), 2, "The main run leaves dead-lettered UIDs to the retry task.")
+
+        DeadLetterEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(retry_dead_letters(), {'resolved': 1})
+        self.assertEqual(DeadLetterEmail.objects.get().status, 'resolved')
+        self.assertEqual(Bug.objects.count(), 3)
+        self.assertIn('\\Seen', self.server.mailbox.folder('inbox')['messages'][1].flags)
+
+    @override_settings(DEAD_LETTER_MAX_ATTEMPTS=2)
+    def test_dead_letter_gives_up_and_admin_replays(self):
+        """ Entries stop retrying after DEAD_LETTER_MAX_ATTEMPTS; the admin can replay or discard them. """
+        self.server.mailbox.append(make_bug_email("POISON-1", "Body", "<poison@example.com>"))
+        self.server.mailbox.append(make_bug_email("POISON-2", "Body", "<poison-2@example.com>"))
+        with patch('api.tasks.build_parsed_email', side_effect=ValueError("bad charset")):
+            process_incoming_emails(batch_size=1)
+            self.assertEqual(set(DeadLetterEmail.objects.values_list('stage', flat=True)), {'parse'})
+            DeadLetterEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(retry_dead_letters(), {'exhausted': 2})
+        self.assertEqual(set(DeadLetterEmail.objects.values_list('status', flat=True)), {'exhausted'})
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw'); self.client.force_login(admin_user)
+        first, second = DeadLetterEmail.objects.order_by('uid')
+        self.run_celery_eagerly()
+        DeadLetterEmail.objects.filter(pk=second.pk).update(status='pending', next_attempt_at=timezone.now() - timezone.timedelta(hours=1))
+        self.client.post('/admin/api/deadletteremail/', {'action': 'replay_entries', '_selected_action': [first.pk]})
+        second.refresh_from_db(); self.assertEqual(second.status, 'pending', "Replay only retries the selected entries, not the oldest due ones.")
+        self.client.post('/admin/api/deadletteremail/', {'action': 'discard_entries', '_selected_action': [second.pk]})
+        first.refresh_from_db(); second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('resolved', 'discarded'))
+        self.assertTrue(Bug.objects.filter(bug_id="POISON-1").exists())
+        self.assertFalse(Bug.objects.filter(bug_id="POISON-2").exists())
+
+    def test_idle_wait_returns_on_exists(self):
+        """ IDLE returns as soon as the server announces a new message, and times out quietly otherwise. """
+        mail = connect_imap(); self.addCleanup(mail.logout)
+        mail.select('inbox')
+        self.assertFalse(idle_wait(mail, timeout=0.1))
+
+        threading.Timer(0.1, self.server.mailbox.append, [make_bug_email("IDLE-1", "Body", "<idle-1@example.com>")]).start()
+        started = time.monotonic()
+        self.assertTrue(idle_wait(mail, timeout=5))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(mail.noop()[0], 'OK', "Connection stays usable after IDLE.")
+
+    @patch('api.management.commands.ingest_idle.close_old_connections') # Would close the TestCase transaction
+    def test_ingest_idle_command_reconnects_and_dispatches_new_uids(self, _):
+        """ The daemon retries failed logins with backoff, catches up on connect, then ingests EXISTS pushes. """
+        self.server.mailbox.append(make_bug_email("IDLE-2", "Before connect", "<idle-2a@example.com>"))
+        real_password = self.server.password; self.server.password = 'wrong'
+        threading.Timer(0.05, setattr, [self.server, 'password', real_password]).start()
+        threading.Timer(0.5, self.server.mailbox.append, [make_bug_email("IDLE-2", "Pushed", "<idle-2b@example.com>")]).start()
+
+        call_command('ingest_idle', backoff=0.2, idle_timeout=5, max_cycles=2, stdout=io.StringIO())
+
+        bug = Bug.objects.get(bug_id="IDLE-2")
+        self.assertEqual(bug.modified_count, 1)
+        self.assertEqual(MailboxSyncState.objects.get(folder='inbox').last_uid, 2)
+
+    @patch('api.management.commands.ingest_idle.close_old_connections')
+    def test_ingest_idle_skips_syncs_while_a_poll_holds_the_lease(self, _):
+        """ The daemon and polling runs share the folder's lease; the daemon leaves the folder to a running poll. """
+        self.server.mailbox.append(make_bug_email("IDLE-3", "Body", "<idle-3@example.com>"))
+        key = f"bugtracker:lock:process_incoming_emails:{DEFAULT_MAILBOX}:inbox"
+        get_backend().acquire(key, 'polling-run', 60)
+        call_command('ingest_idle', idle_timeout=0.1, max_cycles=1, stdout=io.StringIO())
+        self.assertFalse(Bug.objects.filter(bug_id="IDLE-3").exists())
+        get_backend().release(key, 'polling-run')
+        call_command('ingest_idle', idle_timeout=0.1, max_cycles=1, stdout=io.StringIO())
+        self.assertTrue(Bug.objects.filter(bug_id="IDLE-3").exists())
+
+
+# --- Batch Persistence Tests ---
+class BatchPersistenceTests(TestCase):
+
+    def setUp(self):
+        reset_filter()
+
+    def _emails(self, count, prefix):
+        return [ParsedEmail(message_id=f"<{prefix}-{i}@example.com>", bug_id=f"{prefix.upper()}-{i % 3}", subject=f"Bug ID: {prefix.upper()}-{i % 3}",
+                            description=f"Body {i}") for i in range(count)]
+
+    def test_batch_matches_per_message_semantics(self):
+        """ Creates, in-batch updates, priority changes, duplicates and existing bugs behave as if processed one by one. """
+        existing = Bug.objects.create(bug_id="OLD-1", subject="Old", description="Old body", priority=Bug.Priority.HIGH, status=Bug.Status.IN_PROGRESS, modified_count=4)
+        ProcessedEmail.objects.create(message_id="<seen@example.com>")
+        emails = [
+            ParsedEmail("<a@example.com>", "NEW-1", "Bug ID: NEW-1 first", "First"),
+            ParsedEmail("<b@example.com>", "NEW-1", "Bug ID: NEW-1 second", "Second", priority='low'),
+            ParsedEmail("<seen@example.com>", "NEW-1", "Bug ID: NEW-1 dup", "Dup"),
+            ParsedEmail("<b@example.com>", "NEW-1", "Bug ID: NEW-1 dup in batch", "Dup"),
+            ParsedEmail("<c@example.com>", "OLD-1", "Bug ID: OLD-1 updated", "Updated"),
+        ]
+
+        outcomes = persist_batch(emails)
+
+        self.assertEqual(outcomes, [PROCESSED, PROCESSED, DUPLICATE, DUPLICATE, PROCESSED])
+        new_bug = Bug.objects.get(bug_id="NEW-1")
+        self.assertEqual((new_bug.subject, new_bug.description, new_bug.priority, new_bug.modified_count), ("Bug ID: NEW-1 second", "Second", 'low', 1))
+        existing.refresh_from_db()
+        self.assertEqual((existing.description, existing.priority, existing.status, existing.modified_count), ("Updated", 'high', 'in_progress', 5))
+        self.assertEqual(BugModificationLog.objects.filter(bug=new_bug).count(), 1)
+        self.assertEqual(BugModificationLog.objects.filter(bug=existing).count(), 1)
+        self.assertEqual(ProcessedEmail.objects.count(), 4)
+
+    @override_settings(DEDUPE_BLOOM_CAPACITY=0) # Without the Bloom filter every chunk probes the dedupe index
+    def test_query_count_is_independent_of_batch_size(self):
+        """ A chunk costs the same fixed number of queries whether it holds 3 or 30 emails. """
+        Bug.objects.create(bug_id="SMALL-0", subject="s", description="d")
+        Bug.objects.create(bug_id="LARGE-0", subject="s", description="d")
+        # SAVEPOINT, dedupe IN query, bug SELECT, bug upsert, rollup insert/lock/update, log insert, revision insert, search index delete/insert, processed insert, RELEASE
+        with self.assertNumQueries(13):
+            persist_batch(self._emails(3, 'small'))
+        with self.assertNumQueries(13):
+            persist_batch(self._emails(30, 'large'))
+        self.assertEqual(Bug.objects.get(bug_id="LARGE-0").modified_count, 10)
+        self.assertEqual(Bug.objects.get(bug_id="LARGE-1").modified_count, 9)
+
+    @override_settings(DEDUPE_BLOOM_URL='') # The in-process filter, so the test needs no Redis
+    def test_bloom_filter_skips_dedupe_probe_for_new_messages(self):
+        """ New Message-IDs ruled out by the filter cost no dedupe query; repeats are still caught. """
+        get_filter() # Built from the (empty) table outside the measured block
+        # SAVEPOINT, bug SELECT, bug upsert, rollup insert/lock/update, log insert, revision insert, search index delete/insert, processed insert, RELEASE
+        with self.assertNumQueries(12):
+            persist_batch(self._emails(30, 'fresh'))
+        self.assertEqual(persist_batch(self._emails(2, 'fresh')), [DUPLICATE, DUPLICATE])
+
+    def test_filter_miss_is_rechecked_against_database(self):
+        """ A record the filter has not seen (written by another process) surfaces as a conflict and is resolved as a duplicate. """
+        get_filter()
+        ProcessedEmail.objects.create(message_id="<elsewhere@example.com>")
+        emails = [ParsedEmail("<elsewhere@example.com>", "MISS-1", "Bug ID: MISS-1", "Dup"), ParsedEmail("<new@example.com>", "MISS-1", "Bug ID: MISS-1", "New")]
+        self.assertEqual(persist_batch(emails), [DUPLICATE, PROCESSED])
+        self.assertEqual(Bug.objects.get(bug_id="MISS-1").description, "New")
+
+    @override_settings(DEDUPE_BLOOM_URL='redis://127.0.0.1:1/0')
+    def test_unreachable_redis_filter_falls_back_to_index(self):
+        self.addCleanup(reset_filter)
+        self.assertIsNone(get_filter())
+        ProcessedEmail.objects.create(message_id="<seen@example.com>")
+        self.assertEqual(persist_batch(self._emails(1, 'seen') + [ParsedEmail("<seen@example.com>", "SEEN-0", "Bug ID: SEEN-0", "Dup")]), [PROCESSED, DUPLICATE])
+
+    @override_settings(DEDUPE_BLOOM_URL='redis://127.0.0.1:1/0')
+    def test_failed_filter_build_is_retried(self):
+        """ A filter that could not be built (Redis briefly down) is tried again after the retry delay, not never. """
+        self.addCleanup(reset_filter)
+        recovered = BloomFilter(64, 2)
+        with patch('api.dedupe.RedisBloomFilter', side_effect=[ConnectionError("Redis down"), recovered]) as build, patch('api.dedupe.time.monotonic', return_value=1000.0) as clock:
+            self.assertIsNone(get_filter())
+            self.assertIsNone(get_filter(), "Within the retry delay the failure is not retried.")
+            clock.return_value += 61
+            self.assertIs(get_filter(), recovered)
+            self.assertIs(get_filter(), recovered)
+        self.assertEqual(build.call_count, 2)
+
+    def test_records_are_keyed_by_fixed_width_hash(self):
+        persist_batch(self._emails(1, 'hash'))
+        with override_settings(DEDUPE_STORE_MESSAGE_ID=False): persist_batch(self._emails(2, 'nohdr')[1:])
+        stored = {record.message_id: bytes(record.message_hash) for record in ProcessedEmail.objects.all()}
+        self.assertEqual(stored, {"<hash-0@example.com>": ProcessedEmail.hash_message_id("<hash-0@example.com>"), "": ProcessedEmail.hash_message_id("<nohdr-1@example.com>")})
+        self.assertEqual(persist_batch(self._emails(2, 'nohdr')[1:]), [DUPLICATE], "Dedupe works without the raw header.")
+
+    def test_prune_drops_records_older_than_retention(self):
+        persist_batch(self._emails(5, 'old')); persist_batch(self._emails(2, 'recent'))
+        old_hashes = [ProcessedEmail.hash_message_id(f"<old-{i}@example.com>") for i in range(5)]
+        ProcessedEmail.objects.filter(message_hash__in=old_hashes).update(processed_at=timezone.now() - timezone.timedelta(days=100))
+        self.assertEqual(prune_processed_emails(90), 5)
+        self.assertEqual(ProcessedEmail.objects.count(), 2)
+        self.assertEqual(prune_processed_emails(0), 0, "0 keeps records forever.")
+
+    def test_updates_keep_compressed_revision_history(self):
+        """ Every email's description is kept as a compressed revision linked to its log; lists carry only the summary. """
+        Bug.objects.create(bug_id="REV-1", subject="Bug ID: REV-1", description="Original report " * 100)
+        persist_batch([ParsedEmail(f"<rev-{i}@example.com>", "REV-1", f"Bug ID: REV-1 v{i}", f"Update {i}\n" + "details " * 200) for i in range(2)])
+        bug = Bug.objects.get(bug_id="REV-1")
+        revisions = list(bug.revisions.order_by('number'))
+        self.assertEqual([(revision.number, revision.subject) for revision in revisions], [(1, "Bug ID: REV-1"), (2, "Bug ID: REV-1 v0"), (3, "Bug ID: REV-1 v1")])
+        self.assertEqual(revisions[0].text, "Original report " * 100)
+        self.assertIsNone(revisions[0].modification_log)
+        self.assertEqual({revision.modification_log_id for revision in revisions[1:]}, set(BugModificationLog.objects.filter(bug=bug).values_list('pk', flat=True)))
+        self.assertLess(len(bytes(revisions[2].data)), revisions[2].size // 10, "Descriptions are stored compressed.")
+        self.assertEqual(bug.description, "Update 1\n" + "details " * 200)
+        self.assertTrue(bug.summary.startswith("Update 1 details") and len(bug.summary) == Bug.SUMMARY_LENGTH)
+
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        listed = client.get('/api/bugs/').json()['results'][0]
+        self.assertEqual(listed['summary'], bug.summary); self.assertNotIn('description', listed)
+        self.assertEqual(client.get('/api/bugs/REV-1/').json()['description'], bug.description)
+        history = client.get('/api/bugs/REV-1/revisions/').json()['results']
+        self.assertEqual([(entry['number'], entry['size']) for entry in history], [(3, revisions[2].size), (2, revisions[1].size), (1, revisions[0].size)])
+        self.assertNotIn('description', history[0])
+        self.assertEqual(client.get('/api/bugs/REV-1/revisions/1/').json()['description'], "Original report " * 100)
+        self.assertEqual(client.get('/api/bugs/REV-1/revisions/9/').status_code, 404)
+
+    def test_bug_search_uses_ranked_full_text_index(self):
+        """ Search matches whole words and a trailing prefix anywhere in the current description, best match first, and follows edits and deletes. """
+        persist_batch([ParsedEmail("<fts-1@example.com>", "FTS-1", "Crash on save", "Saving a draft crashes the editor.\n" + "filler text " * 100 + "segfault in renderer"),
+                       ParsedEmail("<fts-2@example.com>", "FTS-2", "Login page slow", "The login form takes seconds; a crash report is attached."),
+                       ParsedEmail("<fts-3@example.com>", "FTS-3", "Typo", "Old wording")] +
+                      [ParsedEmail(f"<fts-other-{n}@example.com>", f"OTHER-{n}", "Unrelated", "Nothing to see") for n in range(6)]) # bm25 needs a corpus where terms are rare
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        found = lambda term: [bug['bug_id'] for bug in client.get('/api/bugs/', {'search': term}).json()['results']]
+        self.assertEqual(found('crash'), ['FTS-1', 'FTS-2'], "A subject match outranks a description match.")
+        self.assertEqual((found('segfault'), found('crash sav'), found('fts 2'), found('crash typo')), (['FTS-1'], ['FTS-1'], ['FTS-2'], []))
+
+        persist_batch([ParsedEmail("<fts-4@example.com>", "FTS-3", "Typo", "New wording about the renderer")])
+        self.assertEqual((found('old'), sorted(found('renderer'))), ([], ['FTS-1', 'FTS-3']), "Ingestion replaces the document.")
+        bug = Bug.objects.get(bug_id="FTS-2"); bug.subject = "Sign-in page slow"; bug.save()
+        self.assertEqual((found('login'), found('sign')), (['FTS-2'], ['FTS-2']), "Bug.save reindexes (the description is still indexed).")
+        Bug.objects.filter(bug_id="FTS-1").delete()
+        self.assertEqual(found('segfault'), [])
+
+        with connection.cursor() as cursor: cursor.execute("DELETE FROM api_bug_fts")
+        self.assertEqual(found('renderer'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual((found('renderer'), found('ording')), (['FTS-3'], []))
+        with override_settings(SEARCH_FULL_TEXT=False):
+            self.assertEqual(found('ording'), ['FTS-3'], "Without the index, LIKE substrings of the summary.")
+            persist_batch([ParsedEmail("<fts-5@example.com>", "FTS-5", "Flag off", "Written while searches use LIKE\n" + "filler text " * 30 + "kernel panic")])
+            self.assertEqual((found('written'), found('panic')), (['FTS-5'], []), "The fallback only sees the summary, not text past its 300 characters.")
+        self.assertEqual((found('written'), found('panic')), (['FTS-5'], ['FTS-5']), "The index is kept while the flag is off.")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bug-keyset-test'}})
+    def test_bug_list_keyset_pagination(self):
+        """ Cursor pages walk every bug newest first (ties broken by id) without counting, in both directions, with or without a search. """
+        now = timezone.now()
+        for n in range(7):
+            with self.captureOnCommitCallbacks(execute=True): Bug.objects.create(bug_id=f"KEY-{n}", subject="Keyset crash" if n % 2 else "Other", description="d")
+        for n, hours in enumerate([5, 3, 3, 3, 2, 1, 0]): Bug.objects.filter(bug_id=f"KEY-{n}").update(created_at=now - timezone.timedelta(hours=hours)) # Three bugs share a timestamp
+        expected = list(Bug.objects.order_by('-created_at', '-id').values_list('bug_id', flat=True))
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+
+        pages = [client.get('/api/bugs/', {'cursor': '', 'page_size': 2}).json()]
+        while pages[-1]['next']: pages.append(client.get(pages[-1]['next']).json())
+        self.assertEqual([bug['bug_id'] for page in pages for bug in page['results']], expected)
+        self.assertEqual((len(pages), pages[0]['previous'], 'count' in pages[0]), (4, None, False))
+        backward = [client.get(pages[-1]['previous']).json()]
+        while backward[-1]['previous']: backward.append(client.get(backward[-1]['previous']).json())
+        self.assertEqual([[bug['bug_id'] for bug in page['results']] for page in backward], [expected[4:6], expected[2:4], expected[0:2]], "Back to the first page.")
+        with self.assertNumQueries(1): # One keyset read: no COUNT and no OFFSET, however deep
+            self.assertEqual(client.get(pages[2]['next'].replace('page_size=2', 'page_size=1')).json()['results'][0]['bug_id'], expected[6])
+
+        self.assertEqual(client.get('/api/bugs/', {'cursor': 'not-a-cursor'}).status_code, 404)
+        counted = client.get('/api/bugs/', {'cursor': '', 'include_count': 'true'}).json()
+        self.assertEqual(counted['count'], 7)
+        with self.assertNumQueries(1): # The count is cached until the next write
+            client.get('/api/bugs/', {'cursor': '', 'include_count': 'true'})
+        with self.captureOnCommitCallbacks(execute=True): Bug.objects.create(bug_id="KEY-7", subject="Other", description="d")
+        self.assertEqual(client.get('/api/bugs/', {'cursor': '', 'include_count': 'true'}).json()['count'], 8)
+
+        searched = client.get('/api/bugs/', {'cursor': '', 'search': 'crash', 'page_size': 2, 'include_count': 'true'}).json()
+        rest = client.get(searched['next']).json()
+        self.assertEqual(([bug['bug_id'] for bug in searched['results'] + rest['results']], searched['count'], rest['next']),
+                         ([bug_id for bug_id in expected if int(bug_id[-1]) % 2], 3, None), "Search pages keep the date order.")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_daily_rollup_follows_logs_and_priority_changes(self):
+        """ The dashboard series comes from the rollup, which matches grouping the logs even as bugs change priority. """
+        day = lambda n: timezone.now() - timezone.timedelta(days=n)
+        Bug.objects.create(bug_id="ROLL-1", subject="s", description="d"); Bug.objects.create(bug_id="ROLL-2", subject="s", description="d", priority='low')
+        persist_batch([ParsedEmail("<roll-1@example.com>", "ROLL-1", "s", "a", modified_at=day(2)), ParsedEmail("<roll-2@example.com>", "ROLL-1", "s", "b", modified_at=day(1)),
+                       ParsedEmail("<roll-3@example.com>", "ROLL-2", "s", "c", modified_at=day(1))])
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        series = lambda priority='': [(item['date'], item['count']) for item in client.get(f'/api/bug_modifications/?priority={priority}').json()]
+        date = lambda n: BugModificationDaily.day(day(n)).isoformat()
+        self.assertEqual(series(), [(date(2), 1), (date(1), 2), (date(0), 0)], "Zero-filled from the first day with data to today.")
+        self.assertEqual((series('medium'), series('low')), ([(date(2), 1), (date(1), 1), (date(0), 0)], [(date(1), 1), (date(0), 0)]))
+
+        persist_batch([ParsedEmail("<roll-4@example.com>", "ROLL-1", "s", "Priority: High", priority='high', modified_at=day(0))])
+        self.assertEqual((series('medium'), series('high')), ([], [(date(2), 1), (date(1), 1), (date(0), 1)]), "An email changing the priority moves the bug's days.")
+        bug = Bug.objects.get(bug_id="ROLL-2"); bug.priority = 'high'; bug.save()
+        self.assertEqual((series('low'), series('high')), ([], [(date(2), 1), (date(1), 2), (date(0), 1)]), "So does an edit (admin, API).")
+
+        expected = sorted(BugModificationDaily.totals_from_logs())
+        self.assertEqual(sorted(BugModificationDaily.objects.filter(count__gt=0).values_list('date', 'priority', 'count')), expected)
+        BugModificationDaily.objects.all().delete()
+        call_command('rebuild_modification_rollup', stdout=io.StringIO())
+        self.assertEqual(sorted(BugModificationDaily.objects.values_list('date', 'priority', 'count')), expected)
+        with self.assertNumQueries(2): # The data version and the rollup, never the logs
+            client.get('/api/bug_modifications/')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rollup-delete-test'}})
+    def test_deleted_bugs_and_logs_leave_the_rollup(self):
+        """ Deleting a bug (its logs cascade) or a single log takes the modifications out of the series and invalidates the cache. """
+        day = lambda n: timezone.now() - timezone.timedelta(days=n)
+        for bug_id in ("DEL-1", "DEL-2"): Bug.objects.create(bug_id=bug_id, subject="s", description="d")
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_batch([ParsedEmail("<del-1@example.com>", "DEL-1", "s", "a", modified_at=day(1)), ParsedEmail("<del-2@example.com>", "DEL-2", "s", "b", modified_at=day(1)),
+                           ParsedEmail("<del-3@example.com>", "DEL-2", "s", "c", modified_at=day(0))])
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        series = lambda: [item['count'] for item in client.get('/api/bug_modifications/').json()]
+        self.assertEqual(series(), [2, 1])
+        with self.captureOnCommitCallbacks(execute=True): Bug.objects.get(bug_id="DEL-1").delete()
+        self.assertEqual(series(), [1, 1])
+        with self.captureOnCommitCallbacks(execute=True): BugModificationLog.objects.filter(bug__bug_id="DEL-2", modified_at__gte=day(0) - timezone.timedelta(hours=1)).delete()
+        self.assertEqual(series(), [1, 0])
+        with self.captureOnCommitCallbacks(execute=True): Bug.objects.filter(bug_id="DEL-2").delete()
+        self.assertEqual((series(), list(BugModificationDaily.objects.filter(count__gt=0))), ([], []))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bug-modifications-test'}})
+    def test_bug_modifications_are_cached_until_a_write_commits(self):
+        """ Repeat reads cost no query, and a 304 for clients holding the ETag; ingestion and status updates invalidate after commit. """
+        Bug.objects.create(bug_id="CACHE-1", subject="s", description="d")
+        with self.captureOnCommitCallbacks(execute=True): persist_batch([ParsedEmail("<cache-1@example.com>", "CACHE-1", "s", "a")])
+        client = APIClient(); client.force_authenticate(User.objects.create_user("dev", password="pw"))
+        first = client.get('/api/bug_modifications/')
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/bug_modifications/').json(), first.json())
+            self.assertEqual(client.get('/api/bug_modifications/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertNotIn('Last-Modified', first, "Second-resolution dates could give a stale 304 after two writes in one second.")
+        self.assertNotEqual(client.get('/api/bug_modifications/?priority=high')['ETag'], first['ETag'], "Each filter is cached on its own.")
+
+        time.sleep(0.002)
+        with self.captureOnCommitCallbacks(execute=True): persist_batch([ParsedEmail("<cache-2@example.com>", "CACHE-1", "s", "b")])
+        fresh = client.get('/api/bug_modifications/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((fresh.status_code, fresh.json()[0]['count']), (200, 2))
+
+        client.user = None; developer = User.objects.get(username="dev"); developer.groups.add(Group.objects.get_or_create(name='Developer')[0])
+        client.force_authenticate(developer); time.sleep(0.002)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(client.patch('/api/bugs/CACHE-1/status/', {'status': 'in_progress'}, format='json').status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(client.get('/api/bug_modifications/', HTTP_IF_NONE_MATCH=fresh['ETag']).status_code, 200, "A status update invalidates too.")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_etag_is_stable_without_a_cache(self):
+        """ Without a cache (or after an eviction) the data version comes from the database, so clients still get 304s until a write commits. """
+        Bug.objects.create(bug_id="ETAG-1", subject="s", description="d")
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        first = client.get('/api/bug_modifications/')
+        self.assertEqual(client.get('/api/bug_modifications/')['ETag'], first['ETag'])
+        with self.assertNumQueries(1): # Reads the seeded version row, never writes it
+            self.assertEqual(client.get('/api/bug_modifications/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True): persist_batch([ParsedEmail("<etag-1@example.com>", "ETAG-1", "s", "a")])
+        self.assertEqual(client.get('/api/bug_modifications/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}, DASHBOARD_MAX_POINTS=40)
+    def test_bug_modifications_series_is_bucketed_zero_filled_and_bounded(self):
+        """ start/end/bucket select the range and bucket; every bucket gets a point, and long ranges are downsampled to the point budget. """
+        at = lambda *args: timezone.make_aware(timezone.datetime(*args))
+        Bug.objects.create(bug_id="SERIES-1", subject="s", description="d")
+        persist_batch([ParsedEmail(f"<series-{n}@example.com>", "SERIES-1", "s", str(n), modified_at=moment)
+                       for n, moment in enumerate([at(2024, 1, 1, 9), at(2024, 1, 1, 9, 30), at(2024, 1, 3, 14), at(2024, 1, 10, 8), at(2024, 2, 20, 8)])])
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        def series(query):
+            result = client.get(f'/api/bug_modifications/?{query}')
+            return result['X-Series-Bucket'], [(item['date'], item['count']) for item in result.json()]
+
+        self.assertEqual(series('start=2024-01-01&end=2024-01-04'), ('day', [('2024-01-01', 2), ('2024-01-02', 0), ('2024-01-03', 1), ('2024-01-04', 0)]))
+        self.assertEqual(series('start=2024-01-01&end=2024-01-14&bucket=week'), ('week', [('2024-01-01', 3), ('2024-01-08', 1)]))
+        self.assertEqual(series('start=2024-01-01&end=2024-03-31&bucket=month'), ('month', [('2024-01-01', 4), ('2024-02-01', 1), ('2024-03-01', 0)]))
+        bucket, hours = series('start=2024-01-01&end=2024-01-01&bucket=hour')
+        self.assertEqual((bucket, len(hours), hours[9], sum(count for _, count in hours)), ('hour', 24, ('2024-01-01T09:00+00:00', 2), 2))
+
+        self.assertEqual(series('start=2024-01-01&end=2024-01-05&bucket=hour')[0], 'day', "120 hours exceed the budget of 40 points.")
+        self.assertEqual(series('start=2024-01-01&end=2024-03-31')[0], 'week')
+        bucket, months = series('start=2020-01-01&end=2024-03-31')
+        self.assertEqual((bucket, len(months), months[-1]), ('month', 40, ('2024-03-01', 0)), "Beyond the budget even in months, the latest months are kept.")
+        bucket, recent = series('')
+        self.assertTrue(bucket in ('week', 'month') and len(recent) <= 40 and recent[0][0] == '2024-01-01' and sum(count for _, count in recent) == 5, "An open range starts at the first data and stays in budget.")
+        for query in ('start=2024-13-01', 'start=2024-02-01&end=2024-01-01', 'bucket=year'):
+            self.assertEqual(client.get(f'/api/bug_modifications/?{query}').status_code, 400)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}, TIME_ZONE='Europe/Berlin')
+    def test_hour_labels_stay_distinct_across_a_dst_fall_back(self):
+        """ The repeated 02:00 of a fall-back day gets two points, told apart by their UTC offsets. """
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        hours = client.get('/api/bug_modifications/?start=2024-10-27&end=2024-10-27&bucket=hour').json()
+        labels = [item['date'] for item in hours]
+        self.assertEqual((len(labels), len(set(labels))), (25, 25))
+        self.assertEqual(labels[2:4], ['2024-10-27T02:00+02:00', '2024-10-27T02:00+01:00'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_bug_modifications_grouped_by_priority_in_one_query(self):
+        """ group=priority returns every series, aligned with one date column, from a single GROUP BY. """
+        at = lambda *args: timezone.make_aware(timezone.datetime(*args))
+        Bug.objects.create(bug_id="GROUP-1", subject="s", description="d", priority='high'); Bug.objects.create(bug_id="GROUP-2", subject="s", description="d", priority='low')
+        persist_batch([ParsedEmail("<group-1@example.com>", "GROUP-1", "s", "a", priority='high', modified_at=at(2024, 1, 1, 9)),
+                       ParsedEmail("<group-2@example.com>", "GROUP-2", "s", "b", priority='low', modified_at=at(2024, 1, 3, 10)),
+                       ParsedEmail("<group-3@example.com>", "GROUP-2", "s", "c", priority='low', modified_at=at(2024, 1, 3, 11))])
+        client = APIClient(); client.force_authenticate(User.objects.create_user("viewer", password="pw"))
+        with self.assertNumQueries(2): # The data version, then one GROUP BY
+            grouped = client.get('/api/bug_modifications/?group=priority&start=2024-01-01&end=2024-01-03').json()
+        self.assertEqual((grouped['bucket'], grouped['dates']), ('day', ['2024-01-01', '2024-01-02', '2024-01-03']))
+        self.assertEqual(grouped['series'], {'all': [1, 0, 2], 'high': [1, 0, 0], 'medium': [0, 0, 0], 'low': [0, 0, 2]})
+        for priority in ('high', 'medium', 'low'):
+            single = client.get(f'/api/bug_modifications/?priority={priority}&start=2024-01-01&end=2024-01-03').json()
+            self.assertEqual([item['count'] for item in single], grouped['series'][priority], "Each column matches the filtered series.")
+
+        hourly = client.get('/api/bug_modifications/?group=priority&start=2024-01-03&end=2024-01-03&bucket=hour').json()
+        self.assertEqual((len(hourly['dates']), hourly['series']['low'][10:12], sum(hourly['series']['high'])), (24, [1, 1], 0))
+        self.assertEqual(client.get('/api/bug_modifications/?group=priority&priority=high').status_code, 400)
+
+
+
+# --- Streaming MIME Parser Tests ---
+class StreamingParserTests(TestCase):
+
+    def _report_with_attachment(self, body="Crash on save\nPriority: High\n", size=300_000):
+        msg = email.message_from_bytes(make_bug_email("STREAM-1", body, "<stream@example.com>"), policy=email.policy.default)
+        msg.add_alternative("<p>html copy</p>", subtype='html')
+        msg.add_attachment(bytes(range(256)) * (size // 256), maintype='application', subtype='octet-stream', filename='core.dump')
+        return msg.as_bytes()
+
+    def test_attachment_is_dropped_and_body_matches_full_parse(self):
+        raw = self._report_with_attachment()
+        msg, stats = parse_message(raw)
+        self.assertEqual(get_plain_text_body(msg), get_plain_text_body(email.message_from_bytes(raw)))
+        self.assertEqual(msg['Message-ID'], "<stream@example.com>")
+        self.assertGreater(stats.bytes_skipped, 300_000, "Attachment (base64) and HTML bodies are skipped.")
+        self.assertFalse(stats.truncated)
+
+    def test_chunked_input_parses_like_bytes(self):
+        raw = self._report_with_attachment()
+        chunks = (raw[i:i + 1000] for i in range(0, len(raw), 1000)) # Boundaries and lines split across chunks
+        self.assertEqual(get_plain_text_body(parse_message(chunks)[0]), get_plain_text_body(parse_message(raw)[0]))
+
+    def test_body_is_capped(self):
+        raw = make_bug_email("STREAM-2", "line of text\n" * 1000, "<cap@example.com>")
+        msg, stats = parse_message(raw, max_body_bytes=1300)
+        self.assertTrue(stats.truncated)
+        self.assertEqual(get_plain_text_body(msg), "line of text\n" * 100)
+
+
+# --- Reply Stripping Tests ---
+class ReplyStrippingTests(TestCase):
+
+    def test_new_content_is_separated_from_quoted_history(self):
+        gmail = "Fixed in build 42.\nPriority: Low\n\nOn Mon, Jan 1, 2024 at 10:00 AM Jane Doe <\njane@example.com> wrote:\n> It crashes\n> Priority: High\n"
+        self.assertEqual(split_reply(gmail), ("Fixed in build 42.\nPriority: Low\n", "On Mon, Jan 1, 2024 at 10:00 AM Jane Doe <\njane@example.com> wrote:\n> It crashes\n> Priority: High\n"))
+        self.assertEqual(strip_reply("See below.\n\n-----Original Message-----\nFrom: Jane\nSent: Monday\n\nOld report"), "See below.\n")
+        self.assertEqual(strip_reply("See below.\n\nFrom: Jane <j@example.com>\nSent: Monday\nTo: bugs\n\nOld report"), "See below.\n")
+        self.assertEqual(strip_reply("Inline answers:\n> Does it crash?\nYes.\n> On save?\nOn load.\n"), "Inline answers:\nYes.\nOn load.\n")
+        self.assertEqual(strip_reply("Thanks.\n-- \nBob\nACME QA\n"), "Thanks.\n")
+        self.assertEqual(strip_reply("Thanks.\n\nSent from my phone\n"), "Thanks.\n")
+        for untouched in ("Update 4\nPriority: Low\n", "On the login page it wrote: nothing.\nif a > b: crash\n", "> only quoted\n> text\n"):
+            self.assertEqual(strip_reply(untouched), untouched, "Bodies without history, or with nothing new, are kept whole.")
+
+    def test_plain_double_dash_and_new_reports_keep_their_text(self):
+        """ Only "-- " starts a signature, and a new report keeps `>` lines and signatures unless an attribution precedes them. """
+        self.assertEqual(strip_reply("Crash in parser.\n--\nStack trace...\nPriority: High"), "Crash in parser.\n--\nStack trace...\nPriority: High")
+        report = "Build fails:\n> npm run build\n> tsc -p .\nerror TS2304\n-- \nBob\n"
+        self.assertEqual((strip_reply(report, reply=False), strip_reply(report)), (report, "Build fails:\nerror TS2304\n"))
+        self.assertEqual(strip_reply("Forwarding this.\n\nOn Mon, Jane wrote:\n> It crashes\n", reply=False), "Forwarding this.\n")
+        new = parse_email(make_bug_email("NEW-1", report + "Priority: High\n", "<new-1@example.com>"), "new-1")
+        self.assertEqual((new.description, new.priority), (report + "Priority: High\n", 'high'))
+        answer = make_bug_email("NEW-1", "Still failing\n> npm run build\n", "<new-2@example.com>", subject="Re: Bug ID: NEW-1 - Build")
+        self.assertEqual(parse_email(answer, "new-2").description, "Still failing\n")
+
+    def test_encoded_reply_subjects_are_replies(self):
+        """ A "Re:" inside an RFC 2047 encoded-word (non-ASCII clients) still marks the email as a reply. """
+        for subject in ("=?UTF-8?Q?Re=3A_Bug_ID=3A_ENC-1_-_Caf=C3=A9_crash?=", "=?UTF-8?B?QVc6IEJ1ZyBJRDogRU5DLTEgLSBDYWbDqQ==?="):
+            msg = email.message_from_bytes(f"Subject: {subject}\n\nBody".encode())
+            self.assertTrue(is_reply(msg), subject)
+        self.assertFalse(is_reply(email.message_from_bytes(b"Subject: =?UTF-8?Q?Bug_ID=3A_ENC-1_-_Caf=C3=A9?=\n\nBody")))
+        answer = make_bug_email("ENC-1", "Still failing\n> npm run build\n", "<enc-1@example.com>", subject="=?UTF-8?Q?Re=3A_Bug_ID=3A_ENC-1_-_Caf=C3=A9?=")
+        self.assertEqual(parse_email(answer, "enc-1").description, "Still failing\n")
+
+    def test_ingestion_stores_only_the_new_text(self):
+        """ Replies quoting the whole thread store only their own text; priority is read from that text. """
+        corpus = list(generate_bug_emails(30, update_ratio=0.9, replies=True, seed=5))
+        emails = [parse_email(raw, mid) for mid, raw in corpus]
+        replies = [parsed for parsed in emails if parsed.subject.startswith("Re: ")]
+        self.assertTrue(replies)
+        for reply in replies:
+            self.assertNotIn("wrote:", reply.description); self.assertNotIn("\n>", reply.description); self.assertNotIn("Example Corp", reply.description)
+            self.assertTrue(reply.description.startswith("Synthetic failure report"))
+        with override_settings(EMAIL_STRIP_QUOTED=False):
+            mid, raw = corpus[emails.index(replies[-1])]
+            self.assertIn("wrote:", parse_email(raw, mid).description)
+        quoted_priority = make_bug_email("REPLY-1", "Looks fixed now.\n\nOn Tue, Bob wrote:\n> Priority: High\n", "<reply-1@example.com>")
+        parsed = parse_email(quoted_priority, "reply-1")
+        self.assertEqual((parsed.description, parsed.priority), ("Looks fixed now.\n", None))
+
+
+# --- Push Ingestion Tests ---
+@override_settings(INGEST_PUSH_TOKEN='relay-secret', INGEST_PUSH_MAX_MESSAGES=3)
+class PushIngestionTests(TestCase):
+
+    def setUp(self):
+        reset_filter()
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+        self.url = reverse('api:ingest-email')
+
+    def post(self, data, content_type, token='relay-secret'):
+        return self.client.post(self.url, data, content_type=content_type, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_pushed_messages_are_persisted_with_per_message_results(self):
+        """ ndjson and multipart pushes go through the normal persistence path; each message gets its own result. """
+        lines = [json.dumps({'raw': make_bug_email("PUSH-1", "Crash on save\nPriority: High", "<push-1@example.com>").decode()}),
+                 json.dumps({'raw_base64': base64.b64encode(make_bug_email("PUSH-1", "Fixed\nPriority: Low", "<push-2@example.com>")).decode()}),
+                 json.dumps({'raw': make_bug_email("X", "Body", "<push-3@example.com>", subject="No id here").decode()})]
+        response = self.post("\n".join(lines) + "\n", 'application/x-ndjson')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual([(result['status'], result.get('reason')) for result in response.json()['results']], [('queued', None), ('queued', None), ('rejected', 'no_bug_id')])
+        bug = Bug.objects.get(bug_id="PUSH-1")
+        self.assertEqual((bug.modified_count, bug.priority, bug.description), (1, Bug.Priority.LOW, "Fixed\nPriority: Low\n"))
+
+        uploads = {'first': SimpleUploadedFile('a.eml', make_bug_email("PUSH-2", "New report", "<push-4@example.com>"), 'message/rfc822'),
+                   'again': SimpleUploadedFile('b.eml', make_bug_email("PUSH-1", "Fixed\nPriority: Low", "<push-2@example.com>"), 'message/rfc822')}
+        response = self.client.post(self.url, uploads, HTTP_AUTHORIZATION="Bearer relay-secret")
+        self.assertEqual([result['status'] for result in response.json()['results']], ['queued', 'duplicate'], "Relay retries of stored messages are not queued again.")
+        self.assertTrue(Bug.objects.filter(bug_id="PUSH-2").exists())
+        self.assertEqual(Bug.objects.get(bug_id="PUSH-1").modified_count, 1)
+
+        response = self.post(make_bug_email("PUSH-2", "Still broken", "<push-5@example.com>"), 'message/rfc822')
+        self.assertEqual((response.status_code, response.json()['queued']), (202, 1))
+        self.assertEqual(Bug.objects.get(bug_id="PUSH-2").modified_count, 1)
+
+    def test_requests_are_authenticated_and_validated(self):
+        raw = make_bug_email("PUSH-9", "Body", "<push-9@example.com>")
+        self.assertEqual(self.post(raw, 'message/rfc822', token='wrong').status_code, 401)
+        with override_settings(INGEST_PUSH_TOKEN=''):
+            self.assertEqual(self.post(raw, 'message/rfc822', token='').status_code, 401, "No token configured: the endpoint is disabled.")
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer relay-secret").status_code, 405)
+        self.assertEqual(self.post(raw, 'text/plain').status_code, 400)
+        self.assertEqual(self.post("not json\n", 'application/x-ndjson').status_code, 400)
+        self.assertEqual(self.post("\n".join([json.dumps({'raw': raw.decode()})] * 4), 'application/x-ndjson').status_code, 400, "Over INGEST_PUSH_MAX_MESSAGES.")
+        self.assertFalse(Bug.objects.filter(bug_id="PUSH-9").exists())
+        with patch('api.push.persist_pushed_emails.apply_async', side_effect=ConnectionError("broker down")):
+            self.assertEqual(self.post(raw, 'message/rfc822').status_code, 503)
+        with patch('api.push.persist_pushed_emails.apply_async', side_effect=RuntimeError("bug")), self.assertRaises(RuntimeError):
+            self.post(raw, 'message/rfc822') # Only broker errors are answered with 503
+
+    @override_settings(INGEST_PUSH_MAX_BYTES=4 * 1024 * 1024)
+    def test_large_pushes_are_streamed_up_to_the_byte_cap(self):
+        """ Messages past DATA_UPLOAD_MAX_MEMORY_SIZE are accepted; requests past INGEST_PUSH_MAX_BYTES get 413, not 503. """
+        screenshot = b"iVBORw0KGgo" * (2400 * 1024 // 11) # ~3.2 MB once base64-encoded, past the 2.5 MB DATA_UPLOAD_MAX_MEMORY_SIZE
+        message = email.message.EmailMessage(); message['Message-ID'] = "<push-big@example.com>"; message['Subject'] = "Bug ID: PUSH-BIG - Screenshot"
+        message.set_content("See the screenshot"); message.add_attachment(screenshot, maintype='image', subtype='png', filename='shot.png')
+        response = self.post(message.as_bytes(), 'message/rfc822')
+        self.assertEqual((response.status_code, response.json()['queued']), (202, 1))
+        self.assertEqual(Bug.objects.get(bug_id="PUSH-BIG").description, "See the screenshot\n")
+        with override_settings(INGEST_PUSH_MAX_BYTES=1024 * 1024):
+            self.assertEqual(self.post(message.as_bytes(), 'message/rfc822').status_code, 413)
+            self.assertEqual(self.post(json.dumps({'raw': message.as_string()}), 'application/x-ndjson').status_code, 413)
+
+
+# --- Load Generator Tests ---
+@override_settings(INGEST_LOCK_URL='')
+class LoadGeneratorTests(TestCase):
+
+    def test_generated_workload_is_reproducible(self):
+        first = [mid for mid, _ in generate_bug_emails(50, update_ratio=0.5, duplicate_ratio=0.2, seed=7)]
+        second = [mid for mid, _ in generate_bug_emails(50, update_ratio=0.5, duplicate_ratio=0.2, seed=7)]
+        self.assertEqual(first, second)
+        self.assertLess(len(set(first)), 50, "Some Message-IDs are redelivered.")
+
+    def test_ingesting_a_generated_workload(self):
+        with FakeIMAPServer() as server:
+            stats, _ = fill_mailbox(server.mailbox, 40, update_ratio=0.6, duplicate_ratio=0.1, attachment_kb=4, attachment_ratio=0.5, seed=3)
+            with override_settings(IMAP_SERVER='127.0.0.1', IMAP_PORT=server.port, IMAP_USE_SSL=False,
+                                   IMAP_USER=server.username, IMAP_PASSWORD=server.password):
+                process_incoming_emails(batch_size=8)
+        self.assertEqual(Bug.objects.count(), stats.new_bugs)
+        self.assertEqual(ProcessedEmail.objects.count(), stats.emails - stats.duplicates)
+        self.assertEqual(BugModificationLog.objects.count(), stats.updates)
+
+    @override_settings(DEDUPE_BLOOM_URL='redis://127.0.0.1:1/7', INGEST_LOCK_URL='redis://127.0.0.1:1/7')
+    def test_load_ingest_command_reports_metrics(self):
+        out = io.StringIO()
+        with patch('api.dedupe.RedisBloomFilter') as shared_filter, patch('api.locks.RedisLeaseBackend') as shared_lease:
+            call_command('load_ingest', emails=30, latency_ms=0, stdout=out)
+        self.assertFalse(shared_filter.called or shared_lease.called, "Synthetic Message-IDs and leases stay out of the shared Redis.")
+        self.assertIn("emails/sec", out.getvalue())
+        self.assertIn("per email", out.getvalue())
+        self.assertEqual(Bug.objects.count(), 0, "The load test rolls back its writes.")
+
+
+# --- Mailbox Import Tests ---
+class MailboxImportTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(); self.addCleanup(self.tmp.cleanup)
+
+    def _dated_email(self, bug_id, body, message_id, date):
+        msg = email.message_from_bytes(make_bug_email(bug_id, body, message_id))
+        msg['Date'] = date
+        return msg.as_bytes()
+
+    def _write_mbox(self, messages):
+        path = os.path.join(self.tmp.name, 'archive.mbox')
+        with open(path, 'wb') as mbox:
+            for raw in messages:
+                body = re.sub(rb'(?m)^(>*From )', rb'>\1', raw) # mboxrd quoting
+                mbox.write(b'From reporter@example.com Mon Jan  1 00:00:00 2024\n' + body + b'\n')
+        return path
+
+    def _write_maildir(self, messages):
+        path = os.path.join(self.tmp.name, 'Maildir')
+        for subdir in ('cur', 'new', 'tmp'): os.makedirs(os.path.join(path, subdir))
+        for i, raw in enumerate(messages):
+            with open(os.path.join(path, 'cur', f'{1700000000 + i}.{i}.host:2,S'), 'wb') as message: message.write(raw)
+        return path
+
+    def test_import_mbox_and_maildir_keeps_date_headers(self):
+        mbox = self._write_mbox([
+            self._dated_email("HIST-1", "First report\nFrom the field", "<hist-1@example.com>", "Tue, 02 Jan 2024 10:00:00 +0000"),
+            self._dated_email("HIST-1", "Second report\nPriority: High", "<hist-2@example.com>", "Wed, 03 Jan 2024 11:30:00 +0100"),
+            self._dated_email("X", "Body", "<hist-bad@example.com>", "Wed, 03 Jan 2024 12:00:00 +0000").replace(b"Bug ID: X", b"Hello"),
+        ])
+        maildir = self._write_maildir([
+            self._dated_email("HIST-1", "Third report", "<hist-3@example.com>", "Fri, 05 Jan 2024 09:15:00 +0000"),
+            self._dated_email("HIST-2", "Other bug", "<hist-4@example.com>", "Sat, 06 Jan 2024 08:00:00 +0000"),
+        ])
+        out = io.StringIO()
+
+        call_command('import_mailbox', mbox, maildir, workers=0, batch_size=2, stdout=out)
+
+        bug = Bug.objects.get(bug_id="HIST-1")
+        self.assertEqual(bug.modified_count, 2)
+        self.assertEqual(bug.description, "Third report\n")
+        self.assertEqual(bug.priority, Bug.Priority.HIGH)
+        self.assertEqual(Bug.objects.get(bug_id="HIST-2").description, "Other bug\n")
+        self.assertEqual(
+            sorted(log.modified_at.isoformat() for log in BugModificationLog.objects.filter(bug=bug)),
+            ["2024-01-03T10:30:00+00:00", "2024-01-05T09:15:00+00:00"],
+        )
+        self.assertEqual(ProcessedEmail.objects.count(), 4)
+        self.assertIn("4 emails imported, 1 skipped", out.getvalue())
+
+    def test_mbox_unescapes_from_lines(self):
+        path = self._write_mbox([self._dated_email("HIST-3", "Line\nFrom the start\n>From quoted", "<hist-5@example.com>", "Tue, 02 Jan 2024 10:00:00 +0000")])
+        [(label, raw)] = list(iter_mbox(path))
+        self.assertIn(b"\nFrom the start\n>From quoted", raw)
+
+    def test_process_pool_import_is_idempotent(self):
+        mbox = self._write_mbox([self._dated_email(f"POOL-{i % 3}", f"Report {i}", f"<pool-{i}@example.com>", "Tue, 02 Jan 2024 10:00:00 +0000") for i in range(9)])
+        call_command('import_mailbox', mbox, workers=2, batch_size=4, stdout=io.StringIO())
+        call_command('import_mailbox', mbox, workers=2, batch_size=4, stdout=io.StringIO()) # Second run only finds duplicates
+        self.assertEqual(Bug.objects.count(), 3)
+        self.assertEqual(BugModificationLog.objects.count(), 6)
+        self.assertEqual(Bug.objects.get(bug_id="POOL-2").description, "Report 8\n")
@@ -0,0 +1,121 @@
+# api/timeseries.py
+"""
+Dashboard time series: modification counts over a date range, bucketed and zero-filled.
+
+A series covers `start`..`end` (inclusive dates, TIME_ZONE). Left open, `start`
+is the first day with modifications and `end` is today. Every bucket in the
+range gets a point, including buckets with zero modifications, so the client can
+draw a continuous axis. Buckets are hours, days, ISO weeks (starting Monday) or
+calendar months, and each point is labelled with its bucket's start (hours with
+their UTC offset, so the two hours sharing a wall-clock time at a DST fall-back
+stay distinct).
+A series never has more than DASHBOARD_MAX_POINTS points. A range that would
+exceed the budget at the requested bucket is downsampled to the next coarser
+bucket until it fits. If even months do not fit, only the most recent months are
+kept. Day, week and month buckets are summed from the BugModificationDaily rollup
+with one query. Only hour buckets read BugModificationLog, and the budget limits
+them to a few weeks.
+The grouped form returns every priority's series from the same single query, in a
+columnar layout: one shared list of bucket labels and one count list per priority.
+The dashboard can then switch between priorities without another request.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Bug, BugModificationDaily, BugModificationLog
+
+logger = logging.getLogger(__name__)
+
+HOUR, DAY, WEEK, MONTH = 'hour', 'day', 'week', 'month'
+BUCKETS = (HOUR, DAY, WEEK, MONTH) # Finest to coarsest
+
+
+def max_points():
+    return max(getattr(settings, 'DASHBOARD_MAX_POINTS', 400), 1)
+
+def bucket_start(day, bucket):
+    """ First day of the week or month bucket holding `day` (the day itself for day buckets). """
+    if bucket == WEEK: return day - timedelta(days=day.weekday())
+    if bucket == MONTH: return day.replace(day=1)
+    return day
+
+def next_bucket(day, bucket):
+    """ First day of the bucket after the one starting on `day`. """
+    if bucket == WEEK: return day + timedelta(days=7)
+    if bucket == MONTH: return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+def point_count(start, end, bucket):
+    """ Number of `bucket` points from start to end (dates, inclusive). """
+    if bucket == HOUR: return ((end - start).days + 1) * 24
+    if bucket == MONTH: return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (bucket_start(end, bucket) - bucket_start(start, bucket)).days // (7 if bucket == WEEK else 1) + 1
+
+def fit_to_budget(start, end, bucket):
+    """ (start, bucket) such that the series has at most DASHBOARD_MAX_POINTS points: a coarser bucket, then a later start. """
+    limit = max_points(); chosen = bucket
+    for candidate in BUCKETS[BUCKETS.index(bucket):]:
+        chosen = candidate
+        if point_count(start, end, candidate) <= limit: return start, chosen
+    months_back = end.year * 12 + end.month - limit # The most recent `limit` months
+    return max(start, end.replace(year=months_back // 12, month=months_back % 12 + 1, day=1)), chosen
+
+
+def modification_series(priority=None, start=None, end=None, bucket=DAY, by_priority=False):
+    """
+    {'bucket', 'start', 'end', 'dates', 'counts'} for the modifications of bugs with `priority` (all if None).
+    'bucket', 'start' and 'end' are the ones actually used after defaults and downsampling; 'dates' holds
+    ISO labels of the bucket starts and 'counts' the matching totals. Empty when `start` is open and
+    there is no data.
+    With `by_priority`, one GROUP BY date, priority fills every series at once: 'counts' is replaced by
+    'series', {'all': [...], 'high': [...], ...}, each list aligned with the shared 'dates'.
+    """
+    rows = BugModificationDaily.objects.filter(count__gt=0)
+    if priority: rows = rows.filter(priority=priority)
+    if start: rows = rows.filter(date__gte=start)
+    if end: rows = rows.filter(date__lte=end)
+    columns = ('date', 'priority') if by_priority else ('date',)
+    daily = list(rows.values(*columns).annotate(total=Sum('count')).order_by(*columns).values_list(*columns, 'total'))
+
+    today = timezone.localdate()
+    start = start or (daily[0][0] if daily else None)
+    if start is None: return {'bucket': bucket, 'start': None, 'end': None, 'dates': [], **_columns({}, [], by_priority)}
+    end = end or max(today, daily[-1][0] if daily else today)
+    start, used = fit_to_budget(start, end, bucket)
+    if used != bucket: logger.debug(f"Downsampled modification series {start}..{end} from {bucket} to {used} buckets.")
+
+    if used == HOUR: keys, totals = hourly(priority, start, end, by_priority); labels = [timezone.localtime(hour).isoformat(timespec='minutes') for hour in keys] # With the offset: the repeated hour of a DST fall-back gets its own label
+    else:
+        totals = Counter()
+        for day, *group, total in daily:
+            if day >= start: totals[(bucket_start(day, used).isoformat(), *group)] += total
+        keys = []; day = bucket_start(start, used)
+        while day <= end: keys.append(day.isoformat()); day = next_bucket(day, used)
+        labels = keys
+    return {'bucket': used, 'start': start.isoformat(), 'end': end.isoformat(), 'dates': labels, **_columns(totals, keys, by_priority)}
+
+def _columns(totals, keys, by_priority):
+    """ The count column(s) for bucket `keys` from Counter totals keyed by (key,) or (key, priority). """
+    if not by_priority: return {'counts': [totals[(key,)] for key in keys]}
+    series = {name: [totals[(key, name)] for key in keys] for name, _ in Bug.Priority.choices}
+    return {'series': {'all': [sum(counts) for counts in zip(*series.values())], **series}}
+
+def hourly(priority, start, end, by_priority=False):
+    """ (every hour from start to end as an aware datetime, Counter of logs keyed like _columns expects), grouped from the logs. """
+    first = timezone.make_aware(datetime.combine(start, time.min)).astimezone(dt_timezone.utc)
+    last = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)).astimezone(dt_timezone.utc)
+    logs = BugModificationLog.objects.filter(modified_at__gte=first, modified_at__lt=last)
+    if priority: logs = logs.filter(bug__priority=priority)
+    columns = ('hour', 'bug__priority') if by_priority else ('hour',)
+    totals = Counter()
+    for hour, *group, total in logs.order_by().annotate(hour=TruncHour('modified_at')).values(*columns).annotate(total=Count('id')).values_list(*columns, 'total'):
+        totals[(hour, *group)] += total
+    keys = []; hour = first
+    while hour < last: keys.append(hour); hour += timedelta(hours=1) # Stepped in UTC, so DST changes neither skip nor repeat an hour
+    return keys, totals
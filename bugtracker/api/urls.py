@@ -9,8 +9,13 @@ urlpatterns = [
     path('bugs/', views.BugListView.as_view(), name='bug-list'),
     path('bugs/<str:bug_id>/', views.BugDetailView.as_view(), name='bug-detail'),
     path('bugs/<str:bug_id>/status/', views.BugStatusUpdateView.as_view(), name='bug-status-update'),
+    path('bugs/<str:bug_id>/revisions/', views.BugRevisionListView.as_view(), name='bug-revision-list'),
+    path('bugs/<str:bug_id>/revisions/<int:number>/', views.BugRevisionDetailView.as_view(), name='bug-revision-detail'),
     path('bug_modifications/', views.BugModificationsAPIView.as_view(), name='bug-modifications'),
 
+    # Push ingestion from a mail relay (raw MIME, bearer token)
+    path('ingest/email/', views.ingest_email_view, name='ingest-email'),
+
     # Auth related URL (Registration)
     path('register/', views.UserRegistrationView.as_view(), name='user-register'),
 ]
\ No newline at end of file
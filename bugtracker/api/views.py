@@ -1,13 +1,22 @@
 # api/views.py
+import datetime
 import logging # For explicit logging
-from django.db.models import Count, F # Import F object if modifying count in status update
-from django.db.models.functions import TruncDate
-from rest_framework import generics, permissions, views, response, status, filters # Import filters
+from django.db.models import F # Import F object if modifying count in status update
+from rest_framework import generics, permissions, views, response, status
 from django.contrib.auth.models import User, Group # Import User, Group
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from .models import Bug, BugModificationLog # Import models relative to app
+from .models import Bug, BugRevision # Import models relative to app
+from .metrics import render_prometheus
+from .pagination import KeysetPagination
+from . import caching, push, search, timeseries
 # Import all serializers
-from .serializers import BugSerializer, BugStatusUpdateSerializer, UserRegistrationSerializer
+from .serializers import BugSerializer, BugListSerializer, BugRevisionSerializer, BugRevisionDetailSerializer, BugStatusUpdateSerializer, UserRegistrationSerializer
 
 logger = logging.getLogger(__name__) # Get logger instance
 
@@ -30,19 +39,33 @@ class BugListView(generics.ListAPIView):
     """
     Lists all bugs, supports pagination and search.
     Accessible by any authenticated user.
-    Search applies to bug_id, subject, and description fields.
+    Search uses the full-text index over bug_id, subject and the full description, best matches
+    first (see api/search.py); without an index it matches bug_id, subject and the summary.
+    Rows carry only the summary; full descriptions are served by the detail and revision views.
+    Pages by number by default; with `?cursor=` by keyset on (created_at, id), newest first
+    (see api/pagination.py).
     """
     permission_classes = [permissions.IsAuthenticated]
     queryset = Bug.objects.all().order_by('-created_at') # Base queryset
-    serializer_class = BugSerializer
+    serializer_class = BugListSerializer
 
     # --- Add Search Filter ---
-    filter_backends = [filters.SearchFilter]
-    # Define fields to search against using the 'search' query parameter
-    search_fields = ['bug_id', 'subject', 'description']
+    filter_backends = [search.FullTextSearchFilter]
+    # Fields for the LIKE fallback when the database has no full-text index. Full descriptions are only stored
+    # compressed (BugRevision), so the fallback sees their first 300 characters (the summary), not the whole text.
+    search_fields = ['bug_id', 'subject', 'summary']
     # -------------------------
 
     # Pagination uses defaults from settings (including page_size_query_param)
+    @property
+    def paginator(self):
+        """ KeysetPagination when the request carries a cursor, else the default page numbers. """
+        if not hasattr(self, '_paginator'):
+            self._paginator = KeysetPagination() if KeysetPagination.requested(self.request) else self.pagination_class()
+        return self._paginator
+
+    @property
+    def ranked_search(self): return not isinstance(self.paginator, KeysetPagination) # Keyset pages keep their (created_at, id) order
 
 
 class BugDetailView(generics.RetrieveAPIView):
@@ -53,10 +76,41 @@ class BugDetailView(generics.RetrieveAPIView):
     lookup_field = 'bug_id' # Use the unique bug_id from the URL
 
 
+class BugRevisionListView(generics.ListAPIView):
+    """ Lists a bug's description revisions, newest first (metadata only; texts are decompressed per revision). """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = BugRevisionSerializer
+
+    def get_queryset(self):
+        bug = generics.get_object_or_404(Bug.objects.only('pk'), bug_id=self.kwargs['bug_id'])
+        return BugRevision.objects.filter(bug=bug).select_related('modification_log').defer('data').order_by('-number')
+
+
+class BugRevisionDetailView(generics.RetrieveAPIView):
+    """ Retrieves one revision of a bug's description by number. """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = BugRevisionDetailSerializer
+
+    def get_object(self):
+        return generics.get_object_or_404(BugRevision.objects.select_related('modification_log'), bug__bug_id=self.kwargs['bug_id'], number=self.kwargs['number'])
+
+
 class BugModificationsAPIView(views.APIView):
     """
-    Retrieves aggregated modification counts per date.
-    Accepts an optional 'priority' query parameter ('low', 'medium', 'high').
+    Retrieves modification counts as a zero-filled time series, read from the BugModificationDaily
+    rollup (at most one row per date and priority) rather than grouping every log row.
+    Query parameters (all optional):
+      * priority: 'low', 'medium' or 'high',
+      * start / end: inclusive YYYY-MM-DD dates (default: first day with data / today),
+      * bucket: 'hour', 'day' (default), 'week' or 'month',
+      * group: 'priority' for every priority's series in one response (not combined with priority).
+    Returns [{'date': <bucket start>, 'count': n}, ...] with one entry per bucket. Ranges that would
+    exceed DASHBOARD_MAX_POINTS are downsampled; the bucket and range actually used are sent in the
+    X-Series-Bucket, X-Series-Start and X-Series-End headers (see api/timeseries.py).
+    Grouped, returns columns instead: {'bucket', 'start', 'end', 'dates': [...],
+    'series': {'all': [...], 'high': [...], 'medium': [...], 'low': [...]}}.
+    Responses are cached per query until the next write, and carry ETag/Last-Modified
+    so unchanged data is answered with 304 (see api/caching.py).
     Accessible by any authenticated user.
     """
     permission_classes = [permissions.IsAuthenticated]
@@ -71,29 +125,48 @@ class BugModificationsAPIView(views.APIView):
                 {"error": f"Invalid priority value. Choose from: {', '.join(self.valid_priorities)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        try: start, end, bucket = self.parse_range(request.query_params)
+        except ValueError as range_error: return response.Response({"error": str(range_error)}, status=status.HTTP_400_BAD_REQUEST)
+        group = request.query_params.get('group') or None
+        if group not in (None, 'priority') or (group and priority_filter):
+            return response.Response({"error": "group accepts only 'priority', and cannot be combined with a priority filter."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            queryset = BugModificationLog.objects.select_related('bug').all() # Optimize query
-            if priority_filter:
-                 queryset = queryset.filter(bug__priority=priority_filter.lower())
-                 logger.debug(f"Filtering modifications API for priority: {priority_filter.lower()}") # Use logger
-
-            # Aggregate data
-            data = queryset \
-                .annotate(date=TruncDate('modified_at')) \
-                .values('date') \
-                .annotate(count=Count('id')) \
-                .values('date', 'count') \
-                .order_by('date')
-
-            # Format response
-            formatted_data = [{'date': item['date'].strftime('%Y-%m-%d'), 'count': item['count']} for item in data if item['date']]
-            return response.Response(formatted_data, status=status.HTTP_200_OK)
+            priority_filter = priority_filter.lower() if priority_filter else None
+            # An open end means today, so it is part of the key: yesterday's response must not be served (or 304'd) after midnight
+            name = f"bug_modifications:{'by_priority' if group else priority_filter or 'all'}:{start or ''}:{end or timezone.localdate()}:{bucket}"
+            return caching.cached_response(request, name, lambda: timeseries.modification_series(priority_filter, start, end, bucket, by_priority=bool(group)),
+                                           self.grouped_response if group else self.series_response)
 
         except Exception as e:
             logger.error(f"Error fetching bug modifications (priority: {priority_filter}): {e}", exc_info=True) # Log full exception
             return response.Response({"error": "Server error fetching modifications data."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @staticmethod
+    def parse_range(params):
+        """ (start, end, bucket) from the query parameters; raises ValueError with a message for the client. """
+        dates = []
+        for name in ('start', 'end'):
+            value = params.get(name) or None
+            try: dates.append(datetime.date.fromisoformat(value) if value else None)
+            except ValueError: raise ValueError(f"Invalid {name} date '{value}'. Use YYYY-MM-DD.")
+        start, end = dates
+        if start and end and start > end: raise ValueError("start must not be after end.")
+        bucket = (params.get('bucket') or timeseries.DAY).lower()
+        if bucket not in timeseries.BUCKETS: raise ValueError(f"Invalid bucket value. Choose from: {', '.join(timeseries.BUCKETS)}")
+        return start, end, bucket
+
+    @staticmethod
+    def series_response(series):
+        data = [{'date': date, 'count': count} for date, count in zip(series['dates'], series['counts'])]
+        result = response.Response(data, status=status.HTTP_200_OK)
+        result['X-Series-Bucket'] = series['bucket']
+        if series['start']: result['X-Series-Start'] = series['start']; result['X-Series-End'] = series['end']
+        return result
+
+    @staticmethod
+    def grouped_response(series): return response.Response(series, status=status.HTTP_200_OK)
+
 
 class BugStatusUpdateView(generics.UpdateAPIView):
     """
@@ -128,6 +201,7 @@ class BugStatusUpdateView(generics.UpdateAPIView):
         # If this should change, add: instance.modified_count = F('modified_count') + 1
         # and potentially create a BugModificationLog entry.
         instance.save(update_fields=['status', 'updated_at']) # Save only updated fields
+        caching.on_commit_bump() # Cached bug data is stale from here on
 
         # Return the FULL updated bug data using the main display serializer
         return response.Response(BugSerializer(instance).data, status=status.HTTP_200_OK)
@@ -167,4 +241,44 @@ class UserRegistrationView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         # DRF's default implementation just calls serializer.save()
-        return serializer.save()
\ No newline at end of file
+        return serializer.save()
+
+
+# --- Metrics ---
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint for the ingestion metrics (see api/metrics.py).
+    Plain Django view: scrapers send no JWT. Requests must carry `Authorization: Bearer
+    <METRICS_TOKEN>`; without a token the endpoint is closed unless METRICS_PUBLIC is set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    public = not token and getattr(settings, 'METRICS_PUBLIC', False)
+    if not public and not (token and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")):
+        return HttpResponse("Unauthorized\n", status=401, content_type='text/plain')
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+# --- END Metrics ---
+
+
+# --- Push Ingestion ---
+@csrf_exempt
+@require_POST
+def ingest_email_view(request):
+    """
+    Accepts raw RFC822 messages from a mail relay (formats in api/push.py) and queues them
+    for the same persistence path as polled mail. Plain Django view: the body is MIME, not
+    JSON, and relays send `Authorization: Bearer <INGEST_PUSH_TOKEN>` instead of a JWT.
+    Answers 202 with one result per message (queued, duplicate or rejected with a reason).
+    """
+    token = getattr(settings, 'INGEST_PUSH_TOKEN', '')
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    try:
+        results, task_id = push.accept_messages(push.read_messages(request))
+    except push.PushError as push_error: # Malformed (400) or oversized (413): retrying will not help
+        return JsonResponse({'error': str(push_error)}, status=push_error.status_code)
+    except push.BROKER_ERRORS as queue_error: # Broker unreachable: nothing was queued, the relay should retry
+        logger.error(f"Could not queue pushed emails: {queue_error}", exc_info=True)
+        return JsonResponse({'error': 'Could not queue the messages. Retry later.'}, status=503)
+    queued = sum(result['status'] == push.QUEUED for result in results)
+    return JsonResponse({'queued': queued, 'task_id': task_id, 'results': results}, status=202 if queued else 200)
+# --- END Push Ingestion ---
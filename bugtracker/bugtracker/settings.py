@@ -72,8 +72,36 @@ CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:5173,
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_METHODS = [ "DELETE", "GET", "OPTIONS", "PATCH", "POST", "PUT", ]
 CORS_ALLOW_HEADERS = [ "accept", "accept-encoding", "authorization", "content-type", "dnt", "origin", "user-agent", "x-csrftoken", "x-requested-with", ]
+CORS_EXPOSE_HEADERS = [ "etag", "last-modified", "x-series-bucket", "x-series-start", "x-series-end", ]
 
 IMAP_SERVER = os.getenv('IMAP_SERVER'); IMAP_PORT = int(os.getenv('IMAP_PORT', 993)); IMAP_USER = os.getenv('IMAP_USER'); IMAP_PASSWORD = os.getenv('IMAP_PASSWORD')
+IMAP_USE_SSL = os.getenv('IMAP_USE_SSL', 'True') == 'True'; IMAP_FETCH_BATCH_SIZE = int(os.getenv('IMAP_FETCH_BATCH_SIZE', 100)) # UIDs per UID FETCH; 1 = one FETCH per message
+IMAP_IDLE_TIMEOUT = int(os.getenv('IMAP_IDLE_TIMEOUT', 29 * 60)) # Seconds before the ingest_idle daemon re-issues IDLE
+IMAP_TIMEOUT = int(os.getenv('IMAP_TIMEOUT', 60)) # Socket timeout (seconds) of IMAP connections, so a hung server fails its mailbox's run instead of blocking a worker (0 = none)
+IMAP_HEADER_FIRST = os.getenv('IMAP_HEADER_FIRST', 'True') == 'True' # Fetch headers + BODYSTRUCTURE first, then only the text/plain section
+EMAIL_MAX_BODY_BYTES = int(os.getenv('EMAIL_MAX_BODY_BYTES', 256 * 1024)) # text/plain body cap: full-message parsing (api.email_parser) and the partial section fetch of header-first ingestion
+EMAIL_STRIP_QUOTED = os.getenv('EMAIL_STRIP_QUOTED', 'True') == 'True' # Store only the new text of reply emails (quoted history and signatures dropped, see api/reply_parser.py)
+INGEST_PARTITIONS = int(os.getenv('INGEST_PARTITIONS', 1)) # >1: persist in parallel Celery tasks, partitioned by Bug ID (see fan_out_mailbox)
+INGEST_PERSIST_QUEUE = os.getenv('INGEST_PERSIST_QUEUE', 'ingest'); INGEST_FANOUT_TIMEOUT = int(os.getenv('INGEST_FANOUT_TIMEOUT', 15 * 60)) # Seconds before an unfinished fan-out is re-fetched
+INGEST_MAX_MESSAGES = int(os.getenv('INGEST_MAX_MESSAGES', 1000)); INGEST_MAX_SECONDS = float(os.getenv('INGEST_MAX_SECONDS', 240)); INGEST_MAX_BYTES = int(os.getenv('INGEST_MAX_BYTES', 50 * 1024 * 1024)) # Per-run budgets (0 = unlimited); the task re-enqueues itself until drained
+DEDUPE_STORE_MESSAGE_ID = os.getenv('DEDUPE_STORE_MESSAGE_ID', 'True') == 'True' # Keep the raw Message-ID next to its hash (unindexed, for the admin)
+DEDUPE_BLOOM_CAPACITY = int(os.getenv('DEDUPE_BLOOM_CAPACITY', 10_000_000)); DEDUPE_BLOOM_ERROR_RATE = float(os.getenv('DEDUPE_BLOOM_ERROR_RATE', 0.01)) # Bloom filter in front of the dedupe index (0 = off)
+MAILBOX_RETENTION_DAYS = int(os.getenv('MAILBOX_RETENTION_DAYS', 90)) # Dedupe records older than this are pruned daily (0 = keep forever)
+INGEST_RETRY_QUEUE = os.getenv('INGEST_RETRY_QUEUE', 'ingest_retry'); DEAD_LETTER_RETRY_BATCH = int(os.getenv('DEAD_LETTER_RETRY_BATCH', 50)) # Dead-lettered emails retried per retry_dead_letters run
+DEAD_LETTER_RETRY_BASE_SECONDS = int(os.getenv('DEAD_LETTER_RETRY_BASE_SECONDS', 300)); DEAD_LETTER_RETRY_MAX_SECONDS = int(os.getenv('DEAD_LETTER_RETRY_MAX_SECONDS', 24 * 60 * 60)); DEAD_LETTER_MAX_ATTEMPTS = int(os.getenv('DEAD_LETTER_MAX_ATTEMPTS', 8)) # Exponential backoff, then give up (replay from the admin)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', ''); METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True' # Bearer token /metrics requires (empty = endpoint closed); METRICS_PUBLIC=True opts into open scraping without a token
+INGEST_POLL_MIN_SECONDS = int(os.getenv('INGEST_POLL_MIN_SECONDS', 30)); INGEST_POLL_MAX_SECONDS = int(os.getenv('INGEST_POLL_MAX_SECONDS', 15 * 60)); INGEST_POLL_BACKOFF = float(os.getenv('INGEST_POLL_BACKOFF', 2.0)) # Adaptive poll interval: the minimum while mail arrives, multiplied per empty poll up to the maximum (per-folder overrides in the admin)
+INGEST_POLL_TICK_SECONDS = int(os.getenv('INGEST_POLL_TICK_SECONDS', 15)) # How often beat runs schedule_mailbox_polls, which enqueues due polls (DB only)
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'); CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'); CELERY_ACCEPT_CONTENT = ['json']; CELERY_TASK_SERIALIZER = 'json'; CELERY_RESULT_SERIALIZER = 'json'; CELERY_TIMEZONE = TIME_ZONE; CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_TASK_ROUTES = {'api.tasks.persist_email_partition': {'queue': INGEST_PERSIST_QUEUE}, 'api.tasks.retry_dead_letters': {'queue': INGEST_RETRY_QUEUE}} # Workers: celery -A bugtracker worker -Q ingest / -Q ingest_retry --concurrency=1
+CELERY_BEAT_SCHEDULE = {'prune-dedupe-records': {'task': 'api.tasks.prune_dedupe_records', 'schedule': 24 * 60 * 60}, 'retry-dead-letters': {'task': 'api.tasks.retry_dead_letters', 'schedule': 5 * 60}, 'schedule-mailbox-polls': {'task': 'api.tasks.schedule_mailbox_polls', 'schedule': INGEST_POLL_TICK_SECONDS}} # Synced into django_celery_beat's schedule
+INGEST_LOCK_URL = os.getenv('INGEST_LOCK_URL', CELERY_BROKER_URL if CELERY_BROKER_URL.startswith('redis') else ''); INGEST_LOCK_TTL = int(os.getenv('INGEST_LOCK_TTL', 60)) # Lease that stops polling runs from overlapping (renewed every TTL/3; empty URL = per-process lease)
+DEDUPE_BLOOM_URL = os.getenv('DEDUPE_BLOOM_URL', CELERY_BROKER_URL if CELERY_BROKER_URL.startswith('redis') else '') # Redis bitmap of the dedupe Bloom filter, shared by every web and worker process; empty URL = per-process filter (opt-in: each process scans ProcessedEmail on first use)
+CACHE_URL = os.getenv('CACHE_URL', CELERY_BROKER_URL if CELERY_BROKER_URL.startswith('redis') else ''); CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 300)) # Shared cache for API responses (api/caching.py); empty URL = no caching, since a per-process cache would miss invalidations from Celery workers
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL, 'KEY_PREFIX': 'bugtracker', 'OPTIONS': {'socket_connect_timeout': 1, 'socket_timeout': 1}} if CACHE_URL else {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+DASHBOARD_MAX_POINTS = int(os.getenv('DASHBOARD_MAX_POINTS', 400)) # Most points one bug_modifications series returns; longer ranges are downsampled to coarser buckets (api/timeseries.py)
+SEARCH_FULL_TEXT = os.getenv('SEARCH_FULL_TEXT', 'True') == 'True' # Bug list search through the FTS5 / tsvector index (api/search.py); False = LIKE scans
+INGEST_PUSH_TOKEN = os.getenv('INGEST_PUSH_TOKEN', ''); INGEST_PUSH_MAX_MESSAGES = int(os.getenv('INGEST_PUSH_MAX_MESSAGES', 500)) # Bearer token a mail relay sends to POST /api/ingest/email/ (empty = endpoint disabled); messages per request
+INGEST_PUSH_MAX_BYTES = int(os.getenv('INGEST_PUSH_MAX_BYTES', 50 * 1024 * 1024)); DATA_UPLOAD_MAX_NUMBER_FILES = max(100, INGEST_PUSH_MAX_MESSAGES) # Push request size (streamed, so DATA_UPLOAD_MAX_MEMORY_SIZE does not apply; larger = 413); multipart pushes may carry INGEST_PUSH_MAX_MESSAGES files
 
 LOGGING = { 'version': 1, 'disable_existing_loggers': False, 'formatters': { 'verbose': { 'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}', 'style': '{', }, 'simple': { 'format': '{levelname} {asctime} {module} {message}', 'style': '{', }, }, 'handlers': { 'console': { 'class': 'logging.StreamHandler', 'formatter': 'simple', }, }, 'root': { 'handlers': ['console'], 'level': 'INFO', }, 'loggers': { 'django': { 'handlers': ['console'], 'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'), 'propagate': False, }, 'api': { 'handlers': ['console'], 'level': 'DEBUG', 'propagate': False, }, 'celery': { 'handlers': ['console'], 'level': 'INFO', 'propagate': False, }, }, }
\ No newline at end of file
@@ -1,7 +1,7 @@
 // src/pages/BugListPage.jsx
 import React, { useState, useEffect, useCallback, useRef } from 'react'; // Added useRef
 import { Link as RouterLink } from 'react-router-dom';
-import { getBugs } from '../services/api';
+import { getBugs, getBugsPage } from '../services/api';
 import {
   Container, Typography, Box, CircularProgress, Alert,
   Table, TableBody, TableCell, TableContainer, TableHead,
@@ -36,6 +36,8 @@ function BugListPage() {
     const [debouncedSearchTerm, setDebouncedSearchTerm] = useState(''); // Value used for API call
     const debounceTimeoutRef = useRef(null); // Ref to store timeout ID
     // ------------------------
+    // Keyset cursors of the unfiltered list: cursorsRef.current[n] opens page n (searches page by number, best match first)
+    const cursorsRef = useRef(['']);
 
     // Debounce function for search input
     const handleSearchChange = (event) => {
@@ -51,7 +53,7 @@ function BugListPage() {
         debounceTimeoutRef.current = setTimeout(() => {
             console.log("Debounced search:", newSearchTerm);
             setDebouncedSearchTerm(newSearchTerm); // Trigger API call via useEffect
-             setPage(0); // Reset to first page when search term changes
+             cursorsRef.current = ['']; setPage(0); // Reset to first page when search term changes
         }, 500); // Adjust debounce delay (milliseconds) as needed
     };
 
@@ -60,10 +62,16 @@ function BugListPage() {
         setLoading(true);
         setError('');
         try {
-            // Pass all params to the API call
-            const data = await getBugs(currentPage + 1, currentRowsPerPage, currentSearchTerm);
-            setBugs(data.results);
-            setTotalBugs(data.count);
+            if (currentSearchTerm && currentSearchTerm.trim() !== '') {
+                const data = await getBugs(currentPage + 1, currentRowsPerPage, currentSearchTerm);
+                setBugs(data.results); setTotalBugs(data.count);
+            } else {
+                // The pagination only steps one page at a time, so the cursor of every reachable page is known.
+                // The total is counted once per list (page 0, reached again after any reset) and kept while paging.
+                const data = await getBugsPage(cursorsRef.current[currentPage] ?? '', currentRowsPerPage, null, currentPage === 0);
+                cursorsRef.current[currentPage + 1] = data.nextCursor;
+                setBugs(data.results); if (data.count !== undefined) setTotalBugs(data.count);
+            }
         } catch (err) {
             console.error("Fetch bugs error:", err);
             setError('Failed to fetch bugs.');
@@ -85,7 +93,7 @@ function BugListPage() {
     const handleChangePage = (event, newPage) => { setPage(newPage); };
     const handleChangeRowsPerPage = (event) => {
         setRowsPerPage(parseInt(event.target.value, 10));
-        setPage(0);
+        cursorsRef.current = ['']; setPage(0); // Cursors depend on the page size
     };
 
     return (
@@ -1,6 +1,6 @@
 // src/pages/DashboardPage.jsx
-import React, { useState, useEffect, useCallback } from 'react';
-import { getBugModifications } from '../services/api';
+import React, { useState, useEffect, useCallback, useMemo } from 'react';
+import { getBugModificationSeries } from '../services/api';
 import { useTheme } from '@mui/material/styles';
 import {
   Container, Typography, Box, CircularProgress, Alert, Paper,
@@ -29,24 +29,27 @@ const getBarColor = (priority, theme) => {
 // ---------------------------------------------------
 
 function DashboardPage() {
-  const [chartData, setChartData] = useState([]);
+  const [seriesData, setSeriesData] = useState({ dates: [], series: {} }); // All priorities, fetched once
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [selectedPriority, setSelectedPriority] = useState('all');
   const theme = useTheme();
 
-  const fetchChartData = useCallback(async (filterPriority) => {
+  const fetchChartData = useCallback(async () => {
     setLoading(true); setError('');
     try {
-      const priorityParam = filterPriority === 'all' ? null : filterPriority;
-      const data = await getBugModifications(priorityParam);
-       data.sort((a, b) => new Date(a.date).getTime() - new Date(b.date).getTime());
-      setChartData(data);
-    } catch (err) { setError('Failed to fetch chart data.'); console.error(`Fetch chart data error (Priority: ${filterPriority}):`, err); setChartData([]); }
+      setSeriesData(await getBugModificationSeries());
+    } catch (err) { setError('Failed to fetch chart data.'); console.error('Fetch chart data error:', err); setSeriesData({ dates: [], series: {} }); }
     finally { setLoading(false); }
   }, []);
 
-  useEffect(() => { fetchChartData(selectedPriority); }, [selectedPriority, fetchChartData]);
+  useEffect(() => { fetchChartData(); }, [fetchChartData]);
+
+  // Switching priority only picks another column; no refetch
+  const chartData = useMemo(() => {
+      const counts = seriesData.series[selectedPriority] || [];
+      return counts.some((count) => count > 0) ? seriesData.dates.map((date, index) => ({ date, count: counts[index] })) : [];
+  }, [seriesData, selectedPriority]);
 
   const handlePriorityChange = (event, newPriority) => { if (newPriority !== null) { setSelectedPriority(newPriority); } };
 
@@ -80,7 +83,7 @@ function DashboardPage() {
             <ResponsiveContainer width="100%" height="90%">
               <BarChart data={chartData} margin={{ top: 5, right: 30, left: 0, bottom: 5 }} barGap={4} >
                 <CartesianGrid strokeDasharray="3 3" stroke={theme.palette.divider} />
-                <XAxis dataKey="date" stroke={theme.palette.text.secondary} tick={{ fontSize: 12 }} />
+                <XAxis dataKey="date" tickFormatter={(date) => date.slice(0, 16)} stroke={theme.palette.text.secondary} tick={{ fontSize: 12 }} />
                 <YAxis stroke={theme.palette.text.secondary} allowDecimals={false} width={30} tick={{ fontSize: 12 }} />
                 <Tooltip
                    cursor={{ fill: theme.palette.action.hover }}
@@ -104,6 +104,22 @@ export const getBugs = async (page = 1, pageSize = 10, searchTerm = null) => {
   } catch (error) { throw error; } // Error logged by interceptor
 };
 
+/**
+ * Fetches one keyset page of bugs, newest first. `cursor` is '' for the first page, then the
+ * `nextCursor` / `previousCursor` of a fetched page. With `includeCount` the total is returned as `count`.
+ */
+export const getBugsPage = async (cursor = '', pageSize = 10, searchTerm = null, includeCount = false) => {
+  const cursorOf = (link) => (link ? new URL(link).searchParams.get('cursor') : null);
+  try {
+    const params = { cursor: cursor, page_size: pageSize };
+    if (searchTerm && searchTerm.trim() !== '') { params.search = searchTerm.trim(); }
+    if (includeCount) { params.include_count = 'true'; }
+    const response = await apiClient.get('/bugs/', { params });
+    if (response.data?.results) { return { ...response.data, nextCursor: cursorOf(response.data.next), previousCursor: cursorOf(response.data.previous) }; }
+    else { throw new Error("Invalid data format for bugs list."); }
+  } catch (error) { throw error; } // Error logged by interceptor
+};
+
 /** Fetches details for a single bug by its unique ID. */
 export const getBugById = async (bugId) => {
   if (!bugId) throw new Error("Bug ID required.");
@@ -125,16 +141,33 @@ export const updateBugStatus = async (bugId, status) => {
     } catch (error) { throw error; } // Error logged by interceptor
 };
 
-/** Fetches aggregated bug modification counts, optionally filtered by priority. */
-export const getBugModifications = async (priority = null) => {
+/**
+ * Fetches bug modification counts as a zero-filled series, optionally filtered by priority.
+ * `range` may hold start/end (YYYY-MM-DD) and bucket ('hour', 'day', 'week', 'month'); long ranges come back downsampled.
+ */
+export const getBugModifications = async (priority = null, range = {}) => {
     try {
       const params = {};
       if (priority && ['high', 'medium', 'low'].includes(priority.toLowerCase())) { params.priority = priority.toLowerCase(); }
+      ['start', 'end', 'bucket'].forEach((key) => { if (range[key]) { params[key] = range[key]; } });
       console.debug("Fetching modifications with params:", params);
       const response = await apiClient.get('/bug_modifications/', { params });
       return Array.isArray(response.data) ? response.data : []; // Ensure array response
     } catch (error) { throw error; } // Error logged by interceptor
 };
 
+/**
+ * Fetches every priority's modification series in one request (columnar):
+ * { bucket, start, end, dates: [...], series: { all: [...], high: [...], medium: [...], low: [...] } }.
+ */
+export const getBugModificationSeries = async (range = {}) => {
+    try {
+      const params = { group: 'priority' };
+      ['start', 'end', 'bucket'].forEach((key) => { if (range[key]) { params[key] = range[key]; } });
+      const response = await apiClient.get('/bug_modifications/', { params });
+      return { dates: [], series: {}, ...response.data };
+    } catch (error) { throw error; } // Error logged by interceptor
+};
+
 // Export the configured apiClient instance (optional, prefer functions)
 export default apiClient;
\ No newline at end of file